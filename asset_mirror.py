@@ -0,0 +1,261 @@
+import csv
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from http_session import get_shared_session
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+MANIFEST_FILE = 'manifest.json'
+SPRITES_FILE = 'sprites.json'
+CONTENT_TYPES = {
+    'image/png': '.png', 'image/svg+xml': '.svg', 'image/jpeg': '.jpg', 'image/webp': '.webp',
+    'image/gif': '.gif', 'image/avif': '.avif',
+}
+SPRITE_SHEET_WIDTH = 2048
+_ASSET_FILE_RE = re.compile(r'^[0-9a-f]{16}\.\w+$')
+
+
+def collect_asset_urls(merged_csv, flags_csv):
+    """Все URL изображений узлов (image_url) и флагов наций (flag_image_url), без повторов."""
+    urls = []
+    for path, field in ((merged_csv, 'image_url'), (flags_csv, 'flag_image_url')):
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding='utf-8') as f:
+            urls.extend((row.get(field) or '').strip() for row in csv.DictReader(f))
+    return list(dict.fromkeys(url for url in urls if url.startswith(('http://', 'https://'))))
+
+
+def _extension(url, content_type):
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in CONTENT_TYPES:
+        return CONTENT_TYPES[content_type]
+    ext = os.path.splitext(urlsplit(url).path)[1].lower()
+    return ext if re.fullmatch(r'\.\w{1,5}', ext) else '.bin'
+
+
+class AssetMirror:
+    """
+    Локальное зеркало изображений с адресацией по содержимому.
+
+    Файл называется по sha256 содержимого, поэтому одинаковые картинки с разных URL хранятся один раз.
+    В manifest.json для каждого URL записаны файл, ETag и Last-Modified: повторный запуск отправляет
+    условные запросы, и неизмененные изображения (304) не скачиваются заново.
+    """
+
+    def __init__(self, root='assets', max_workers=16, session=None):
+        self.root = root
+        self.max_workers = max(1, max_workers)
+        self.session = session
+        self.manifest_path = os.path.join(root, MANIFEST_FILE)
+        self.entries = self._load_manifest()
+        self.stats = {'downloaded': 0, 'not_modified': 0, 'deduplicated': 0, 'failed': 0, 'bytes': 0}
+        self._lock = threading.Lock()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return json.load(f).get('urls', {})
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Предупреждение: Манифест зеркала '{self.manifest_path}' поврежден ({e}), изображения будут загружены заново.")
+            return {}
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.stats[name] += value
+
+    def _store(self, url, response):
+        data = response.content
+        digest = hashlib.sha256(data).hexdigest()
+        name = digest[:16] + _extension(url, response.headers.get('Content-Type'))
+        path = os.path.join(self.root, name)
+        with self._lock:
+            exists = os.path.exists(path)
+            if not exists:
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+        self._count('deduplicated' if exists else 'downloaded')
+        self._count('bytes', len(data))
+        return {
+            'file': name,
+            'sha256': digest,
+            'bytes': len(data),
+            'content_type': response.headers.get('Content-Type', ''),
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+
+    def fetch(self, url):
+        """Загружает один URL (условно, если он уже есть в зеркале). Возвращает запись манифеста или None."""
+        previous = self.entries.get(url)
+        headers = {}
+        if previous and os.path.exists(os.path.join(self.root, previous['file'])):
+            if previous.get('etag'):
+                headers['If-None-Match'] = previous['etag']
+            if previous.get('last_modified'):
+                headers['If-Modified-Since'] = previous['last_modified']
+        try:
+            response = (self.session or get_shared_session()).get(url, headers=headers, timeout=30)
+        except Exception as e:
+            print(f"Ошибка загрузки изображения {url}: {e}")
+            self._count('failed')
+            return previous
+        if response.status_code == 304 and headers:
+            self._count('not_modified')
+            return previous
+        content_type = response.headers.get('Content-Type', '')
+        if response.status_code != 200 or 'html' in content_type:
+            print(f"Изображение {url} не загружено: HTTP {response.status_code} {content_type}")
+            self._count('failed')
+            return previous
+        return self._store(url, response)
+
+    def mirror(self, urls):
+        """Загружает urls параллельно (скорость ограничивает общий RateLimiter сессии) и сохраняет манифест."""
+        os.makedirs(self.root, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = list(pool.map(self.fetch, urls))
+        self.entries = {url: entry for url, entry in zip(urls, results) if entry is not None}
+        self.save()
+        self.prune()
+        return self.entries
+
+    def save(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'generated_at': time.strftime('%Y-%m-%d %H:%M:%S'), 'urls': self.entries},
+                      f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def prune(self):
+        """Удаляет файлы зеркала, на которые больше не ссылается ни один URL."""
+        referenced = {entry['file'] for entry in self.entries.values()}
+        removed = 0
+        for name in os.listdir(self.root):
+            if _ASSET_FILE_RE.match(name) and name not in referenced:
+                os.remove(os.path.join(self.root, name))
+                removed += 1
+        return removed
+
+    def report(self):
+        s = self.stats
+        files = len({entry['file'] for entry in self.entries.values()})
+        print(f"Зеркало изображений '{self.root}': URL {len(self.entries)}, файлов {files}; загружено новых {s['downloaded']} "
+              f"({s['bytes'] / 1e6:.1f} МБ), не изменились {s['not_modified']}, "
+              f"совпали по содержимому с уже сохраненными {s['deduplicated']}, ошибок {s['failed']}")
+
+
+def build_sprite_sheets(mirror, merged_csv, max_px=128):
+    """
+    Собирает мелкие иконки техники каждой нации в один PNG (нужен Pillow).
+
+    Иконки раскладываются полками по высоте в лист шириной SPRITE_SHEET_WIDTH; sprites.json хранит
+    для каждого исходного URL лист и прямоугольник [x, y, w, h]. Лист называется по хэшу содержимого.
+    """
+    if Image is None:
+        print("Pillow не установлен, спрайты не собираются.")
+        return None
+    with open(merged_csv, encoding='utf-8') as f:
+        by_nation = {}
+        for row in csv.DictReader(f):
+            url = (row.get('image_url') or '').strip()
+            nation = (row.get('country') or '').strip().lower()
+            if url in mirror.entries and nation:
+                by_nation.setdefault(nation, {})[url] = None
+
+    sprite_dir = os.path.join(mirror.root, 'sprites')
+    os.makedirs(sprite_dir, exist_ok=True)
+    atlas = {}
+    for nation, urls in sorted(by_nation.items()):
+        icons = []
+        for url in urls:
+            path = os.path.join(mirror.root, mirror.entries[url]['file'])
+            try:
+                with Image.open(path) as image:
+                    if image.width <= max_px and image.height <= max_px:
+                        icons.append((url, image.convert('RGBA')))
+            except Exception:
+                continue
+        if not icons:
+            continue
+        icons.sort(key=lambda item: (-item[1].height, item[0]))
+        placements, x, y, shelf = {}, 0, 0, 0
+        for url, image in icons:
+            if x + image.width > SPRITE_SHEET_WIDTH:
+                x, y, shelf = 0, y + shelf, 0
+            placements[url] = [x, y, image.width, image.height]
+            x += image.width
+            shelf = max(shelf, image.height)
+        sheet = Image.new('RGBA', (SPRITE_SHEET_WIDTH if y else x, y + shelf), (0, 0, 0, 0))
+        for url, image in icons:
+            sheet.paste(image, tuple(placements[url][:2]))
+        tmp_path = os.path.join(sprite_dir, f"{nation}.png.tmp")
+        sheet.save(tmp_path, format='PNG', optimize=True)
+        with open(tmp_path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:12]
+        name = f"{nation}.{digest}.png"
+        os.replace(tmp_path, os.path.join(sprite_dir, name))
+        atlas[nation] = {'sheet': f"sprites/{name}", 'width': sheet.width, 'height': sheet.height,
+                         'icons': placements}
+
+    keep = {os.path.basename(entry['sheet']) for entry in atlas.values()}
+    for name in os.listdir(sprite_dir):
+        if name.endswith('.png') and name not in keep:
+            os.remove(os.path.join(sprite_dir, name))
+    with open(os.path.join(mirror.root, SPRITES_FILE), 'w', encoding='utf-8') as f:
+        json.dump(atlas, f, ensure_ascii=False, indent=1)
+    print(f"Спрайты: {len(atlas)} листов, {sum(len(a['icons']) for a in atlas.values())} иконок")
+    return atlas
+
+
+def mirror_assets(config, merged_csv, flags_csv):
+    """Шаг зеркалирования: загрузка изображений узлов и флагов и, при asset_sprites=true, спрайты."""
+    mirror = AssetMirror(config.get('asset_dir', 'assets'),
+                         max_workers=int(config.get('http_pool_size', '16')))
+    urls = collect_asset_urls(merged_csv, flags_csv)
+    print(f"Зеркалирование {len(urls)} изображений в '{mirror.root}' ({mirror.max_workers} потоков)...")
+    mirror.mirror(urls)
+    mirror.report()
+    if config.get('asset_sprites', 'false').lower() == 'true':
+        build_sprite_sheets(mirror, merged_csv, max_px=int(config.get('asset_sprite_max_px', '128')))
+    return mirror
+
+
+def load_asset_urls(asset_dir, base_url):
+    """
+    {исходный URL: URL в зеркале} по манифесту зеркала; пустой словарь, если зеркала или base_url нет.
+    """
+    if not base_url:
+        return {}
+    try:
+        with open(os.path.join(asset_dir, MANIFEST_FILE), encoding='utf-8') as f:
+            entries = json.load(f).get('urls', {})
+    except (OSError, json.JSONDecodeError):
+        return {}
+    base_url = base_url if base_url.endswith('/') else base_url + '/'
+    return {url: base_url + entry['file'] for url, entry in entries.items()}
+
+
+def rewrite_asset_urls(records, asset_urls, field='image_url'):
+    """Заменяет URL изображений в records на адреса зеркала; возвращает число замен."""
+    replaced = 0
+    for record in records:
+        url = record.get(field)
+        if url and url in asset_urls:
+            record[field] = asset_urls[url]
+            replaced += 1
+    return replaced
@@ -0,0 +1,95 @@
+import argparse
+import glob
+import os
+import time
+from bs4 import BeautifulSoup
+from scrape_archive import ScrapeArchive
+from unit_card_parser import HTML_PARSER, parse_unit_card
+
+
+def legacy_required_exp(html):
+    """Прежний разбор VehicleDataFetcher: полное дерево html.parser ради одного поля."""
+    soup = BeautifulSoup(html, "html.parser")
+    for block in soup.find_all("div", class_="game-unit_card-info_item"):
+        title_div = block.find("div", class_="game-unit_card-info_title")
+        if title_div and "Исследование" in title_div.text:
+            value_div = block.find("div", class_="game-unit_card-info_value")
+            if value_div:
+                number_div = value_div.find("div")
+                if number_div and number_div.text:
+                    return number_div.text.replace(" ", "").replace(".", "").strip()
+    return None
+
+
+def load_pages(sources):
+    """Страницы техники из архивов записи (--record) и каталогов с .html: [(id, html)]."""
+    pages = []
+    for source in sources:
+        if os.path.isdir(source):
+            for path in sorted(glob.glob(os.path.join(source, '*.html'))):
+                with open(path, encoding='utf-8') as f:
+                    pages.append((os.path.splitext(os.path.basename(path))[0], f.read()))
+            continue
+        archive = ScrapeArchive(source)
+        try:
+            for key, entry in archive.responses.items():
+                if '/unit/' not in key or entry.get('status') != 200:
+                    continue
+                _, body = archive.response(*key.split(' ', 1))
+                unit_id = key.rstrip('/').rsplit('/', 1)[-1]
+                pages.append((unit_id, body.decode(entry.get('encoding') or 'utf-8', errors='replace')))
+        finally:
+            archive.close()
+    return pages
+
+
+def measure(name, func, pages, repeat):
+    size = sum(len(html.encode('utf-8')) for _, html in pages) * repeat
+    started = time.perf_counter()
+    results = []
+    for _ in range(repeat):
+        results = [func(unit_id, html) for unit_id, html in pages]
+    elapsed = time.perf_counter() - started
+    count = len(pages) * repeat
+    print(f"  {name:<28} {count / elapsed:8.1f} стр./сек. {size / elapsed / 1e6:7.2f} МБ/сек. "
+          f"({elapsed / count * 1000:.2f} мс на страницу)")
+    return results, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Скорость разбора сохраненных страниц техники.")
+    parser.add_argument('sources', nargs='+', help="Архивы записи (--record) или каталоги с .html страниц техники")
+    parser.add_argument('--repeat', type=int, default=3, help="Сколько раз разобрать каждую страницу")
+    args = parser.parse_args(argv)
+
+    pages = load_pages(args.sources)
+    if not pages:
+        print("Страницы техники не найдены.")
+        return
+    total_mb = sum(len(html.encode('utf-8')) for _, html in pages) / 1e6
+    print(f"Страниц: {len(pages)} ({total_mb:.1f} МБ), повторов: {args.repeat}, парсер: {HTML_PARSER}")
+
+    legacy, legacy_time = measure("прежний (только required_exp)", lambda _, html: legacy_required_exp(html),
+                                  pages, args.repeat)
+    cards, card_time = measure("карточка за один проход", lambda unit_id, html: parse_unit_card(html, unit_id),
+                               pages, args.repeat)
+    print(f"Ускорение: x{legacy_time / card_time:.2f}")
+
+    mismatched = [(unit_id, old, card.required_exp) for (unit_id, _), old, card in zip(pages, legacy, cards)
+                  if (int(old) if old and old.isdigit() else None) != card.required_exp]
+    filled = {}
+    for card in cards:
+        for name, value in card.as_row().items():
+            if value not in (None, '') and name != 'data_ulist_id':
+                filled[name] = filled.get(name, 0) + 1
+    print("Заполненность полей: " + ", ".join(f"{name} {count}" for name, count in filled.items()))
+    if mismatched:
+        print(f"Расхождения required_exp с прежним разбором: {len(mismatched)}")
+        for unit_id, old, new in mismatched[:10]:
+            print(f"  {unit_id}: {old!r} -> {new!r}")
+    else:
+        print("required_exp совпадает с прежним разбором на всех страницах.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+def file_hash(path):
+    """sha256 содержимого файла или None, если файла нет."""
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def value_hash(value):
+    return hashlib.sha256(str(value).encode('utf-8')).hexdigest()
+
+
+class Stage:
+    """
+    Шаг конвейера: функция, входные файлы и ключи config.txt, выходные файлы.
+
+    source=True - шаг получает данные извне (браузер, сеть): его входы нельзя хэшировать,
+    поэтому в обычном режиме он выполняется всегда, а в offline-режиме - никогда.
+    resource - общий ресурс (например, 'browser'): шаги с одним ресурсом не выполняются параллельно.
+    optional_outputs - выходы, без которых следующие шаги обходятся: в offline-режиме их отсутствие
+    не ошибка, а предупреждение.
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=(), config_keys=(), source=False, resource=None,
+                 optional_outputs=()):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.config_keys = list(config_keys)
+        self.source = source
+        self.resource = resource
+        self.optional_outputs = list(optional_outputs)
+
+    def __repr__(self):
+        return f"Stage({self.name!r})"
+
+
+class BuildGraph:
+    """
+    Декларативный граф шагов с пропуском актуальных шагов.
+
+    Хэши входов, значений конфигурации и выходов каждого успешного шага хранятся в манифесте;
+    шаг пропускается, если ни один вход не изменился, а выходы совпадают с записанными.
+    Зависимости между шагами выводятся из совпадения выходов одних шагов с входами других.
+    """
+
+    def __init__(self, config, manifest_path='.build_manifest.json'):
+        self.config = config
+        self.manifest_path = manifest_path
+        self.stages = {}
+        self.manifest = self._load_manifest()
+        self.results = {}
+        self._lock = threading.Lock()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Предупреждение: Манифест '{self.manifest_path}' поврежден ({e}), все шаги будут выполнены.")
+            return {}
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def add(self, stage):
+        if stage.name in self.stages:
+            raise ValueError(f"Шаг '{stage.name}' уже добавлен в граф")
+        self.stages[stage.name] = stage
+        return stage
+
+    def dependencies(self, stage):
+        """Шаги, чьи выходы являются входами stage."""
+        producers = {path: s.name for s in self.stages.values() for path in s.outputs}
+        return [producers[path] for path in stage.inputs if path in producers and producers[path] != stage.name]
+
+    def order(self, targets=None):
+        """Топологический порядок шагов, нужных для targets (по умолчанию - все шаги)."""
+        ordered, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Цикл в графе шагов на шаге '{name}'")
+            if name not in self.stages:
+                raise ValueError(f"Неизвестный шаг: '{name}'")
+            visiting.add(name)
+            for dep in self.dependencies(self.stages[name]):
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+            ordered.append(name)
+
+        for name in (targets or list(self.stages)):
+            visit(name)
+        return ordered
+
+    def signature(self, stage):
+        return {
+            'inputs': {path: file_hash(path) for path in stage.inputs},
+            'config': {key: value_hash(self.config.get(key, '')) for key in stage.config_keys},
+        }
+
+    def is_up_to_date(self, stage, offline=False):
+        """Можно ли пропустить шаг: входы и конфиг не менялись, выходы на месте и не тронуты."""
+        record = self.manifest.get(stage.name)
+        if stage.source:
+            if not offline:
+                return False
+            missing = [path for path in stage.outputs if not os.path.exists(path)]
+            required = [path for path in missing if path not in stage.optional_outputs]
+            if required:
+                raise FileNotFoundError(
+                    f"offline-режим: нет файлов {', '.join(required)}, их создает шаг '{stage.name}', "
+                    f"которому нужна сеть или браузер. Запустите его без --offline (python main.py {stage.name}).")
+            if missing:
+                print(f"Предупреждение: offline-режим, шаг '{stage.name}' пропущен без файлов: {', '.join(missing)}")
+            return True
+        if not record:
+            return False
+        signature = self.signature(stage)
+        if record.get('inputs') != signature['inputs'] or record.get('config') != signature['config']:
+            return False
+        return all(record.get('outputs', {}).get(path) == file_hash(path) for path in stage.outputs)
+
+    def record_run(self, stage, elapsed):
+        """Записывает в манифест хэши успешно выполненного шага."""
+        record = self.signature(stage)
+        record['outputs'] = {path: file_hash(path) for path in stage.outputs}
+        record['finished_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        record['seconds'] = round(elapsed, 2)
+        with self._lock:
+            self.manifest[stage.name] = record
+            self._save_manifest()
+            self.results[stage.name] = 'run'
+
+    def run(self, targets=None, force=False, offline=False):
+        """
+        Выполняет нужные шаги по порядку, пропуская актуальные.
+
+        :param targets: Имена целевых шагов (их зависимости добавляются автоматически)
+        :param force: Выполнить все шаги независимо от манифеста
+        :param offline: Не выполнять source-шаги (браузер, сеть), использовать их готовые файлы
+        :return: Словарь {шаг: 'run' | 'skipped'}
+        """
+        for name in self.order(targets):
+            stage = self.stages[name]
+            if (not force or stage.source) and self.is_up_to_date(stage, offline=offline):
+                print(f"\n[{name}] актуален, пропуск.")
+                self.results[name] = 'skipped'
+                continue
+
+            print(f"\n[{name}] выполнение...")
+            started = time.time()
+            stage.func()
+            elapsed = time.time() - started
+            self.record_run(stage, elapsed)
+            print(f"[{name}] завершен за {elapsed:.2f} сек.")
+        return self.results
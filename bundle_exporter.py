@@ -0,0 +1,245 @@
+import csv
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+from build_graph import value_hash
+from query_service import node_record
+from asset_mirror import rewrite_asset_urls
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Имена файлов бандлов - ASCII, чтобы их без экранирования отдавали CDN и статические серверы
+SECTION_SLUGS = {
+    'Авиация': 'aviation',
+    'Вертолёты': 'helicopters',
+    'Наземная техника': 'ground',
+    'Большой флот': 'bluewater',
+    'Малый флот': 'coastal',
+}
+BUNDLE_FORMAT = 1
+INDEX_FILE = 'index.json'
+# Поля раскладки переходят в сетку и папки, нация и тип - в заголовок бандла
+LAYOUT_FIELDS = ('country', 'vehicle_category', 'column_index', 'row_index', 'order_in_folder',
+                 'parent_external_id', 'data_ulist_id')
+_BUNDLE_FILE_RE = re.compile(r'^[\w-]+\.[0-9a-f]{12}\.json(\.gz|\.br)?$')
+
+
+def section_slug(vehicle_type):
+    return SECTION_SLUGS.get(vehicle_type) or f"type-{value_hash(vehicle_type)[:8]}"
+
+
+def _read_csv(path):
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def _folder_of(node, nodes):
+    """
+    Папка узла внутри группы. Первый узел группы ссылается на папку, следующие - на предыдущий узел,
+    поэтому идем по parent_external_id (с откатом на id + '_group', как NodesMerger), пока не встретим папку.
+    """
+    seen = set()
+    while node is not None and node.get('order_in_folder') is not None and node['id'] not in seen:
+        seen.add(node['id'])
+        parent = node.get('parent_external_id') or ''
+        node = nodes.get(parent) or nodes.get(parent + '_group')
+    return node['id'] if node is not None and node.get('type') == 'folder' else None
+
+
+def build_bundle(nation, vehicle_type, nodes, edges, rank_requirements):
+    """
+    Бандл дерева одной нации и типа техники с готовой раскладкой.
+
+    ranks[].research / ranks[].premium - строки сетки ранга, в строке - столбцы, в ячейке - id узлов верхнего
+    уровня (техника и папки). Содержимое папки - nodes[<папка>].items по order_in_folder.
+    edges - пары [узел, требуемый узел] из dependencies.csv.
+
+    :param nodes: Записи узлов этой нации и типа (node_record)
+    """
+    by_id = {node['id']: node for node in nodes}
+    folder_items, placed, unplaced = {}, {}, []
+    for node in nodes:
+        if node.get('order_in_folder') is not None:
+            folder = _folder_of(node, by_id)
+            if folder:
+                folder_items.setdefault(folder, []).append(node)
+                continue
+        if node.get('rank') is None or node.get('column_index') is None or node.get('row_index') is None:
+            unplaced.append(node['id'])
+            continue
+        section = 'premium' if node.get('tech_category') == 'premium' else 'research'
+        placed.setdefault((node['rank'], section), []).append(node)
+
+    columns = {section: 1 + max((node['column_index'] for (_, s), cell in placed.items() if s == section
+                                 for node in cell), default=-1)
+               for section in ('research', 'premium')}
+    ranks = []
+    for rank in sorted({rank for rank, _ in placed}):
+        entry = {'rank': rank}
+        for section in ('research', 'premium'):
+            cell_nodes = placed.get((rank, section), [])
+            rows = 1 + max((node['row_index'] for node in cell_nodes), default=-1)
+            grid = [[[] for _ in range(columns[section])] for _ in range(rows)]
+            for node in sorted(cell_nodes, key=lambda n: n['id']):
+                grid[node['row_index']][node['column_index']].append(node['id'])
+            entry[section] = grid
+        ranks.append(entry)
+
+    bundle_nodes = {}
+    for node in sorted(nodes, key=lambda n: n['id']):
+        record = {key: value for key, value in node.items()
+                  if value is not None and key not in LAYOUT_FIELDS and key != 'id'}
+        if record.get('external_id') == node['id']:
+            del record['external_id']
+        if node['id'] in folder_items:
+            items = sorted(folder_items[node['id']], key=lambda n: (n['order_in_folder'], n['id']))
+            record['items'] = [item['id'] for item in items]
+        bundle_nodes[node['id']] = record
+
+    return {
+        'format': BUNDLE_FORMAT,
+        'nation': nation,
+        'vehicle_type': vehicle_type,
+        'columns': columns,
+        'ranks': ranks,
+        'unplaced': sorted(unplaced),
+        'nodes': bundle_nodes,
+        'edges': sorted(edges),
+        'rank_requirements': rank_requirements,
+    }
+
+
+def _write_if_missing(path, data):
+    """Файлы бандлов неизменяемы (имя - хэш содержимого): существующий файл не перезаписывается."""
+    if os.path.exists(path):
+        return
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_bundle(bundle, out_dir, slug):
+    """
+    Записывает бандл как <slug>.<хэш>.json и предсжатые рядом .json.gz / .json.br
+    (имена, которые ищут gzip_static / brotli_static в nginx).
+
+    :return: Запись индекса для бандла
+    """
+    data = json.dumps(bundle, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()
+    name = f"{slug}.{digest[:12]}.json"
+    entry = {'file': name, 'sha256': digest, 'size': len(data)}
+    _write_if_missing(os.path.join(out_dir, name), data)
+    # mtime=0 - одинаковые данные дают побайтно одинаковый .gz
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    _write_if_missing(os.path.join(out_dir, name + '.gz'), compressed)
+    entry['gzip_size'] = len(compressed)
+    if brotli is not None:
+        compressed = brotli.compress(data, quality=11)
+        _write_if_missing(os.path.join(out_dir, name + '.br'), compressed)
+        entry['brotli_size'] = len(compressed)
+    return entry
+
+
+def _index_files(index):
+    files = set()
+    for entry in (index or {}).get('bundles', {}).values():
+        files.update({entry['file'], entry['file'] + '.gz', entry['file'] + '.br'})
+    return files
+
+
+def export_bundles(merged_csv, deps_csv, rank_csv, out_dir='bundles', target_sections=None, asset_urls=None):
+    """
+    Экспортирует бандлы по всем (нация, тип техники) и индекс бандлов.
+
+    Индекс (index.json) пишется последним и атомарно, поэтому он ссылается только на уже записанные файлы.
+    Файлы, на которые не ссылаются ни новый, ни предыдущий индекс, удаляются: клиенты со старым индексом
+    успевают догрузить бандлы прошлой версии.
+
+    :param asset_urls: {исходный URL: URL зеркала} для image_url узлов (load_asset_urls)
+    :return: Индекс бандлов
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    index_path = os.path.join(out_dir, INDEX_FILE)
+    try:
+        with open(index_path, encoding='utf-8') as f:
+            previous_index = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        previous_index = None
+
+    groups = {}
+    for row in _read_csv(merged_csv):
+        node = node_record(row)
+        if asset_urls:
+            rewrite_asset_urls([node], asset_urls)
+        nation, vehicle_type = node.get('country'), (node.get('vehicle_category') or '').strip()
+        if not node['id'] or not nation or not vehicle_type:
+            continue
+        if target_sections and vehicle_type not in target_sections:
+            continue
+        groups.setdefault((nation, vehicle_type), {}).setdefault(node['id'], node)
+
+    group_of = {node_id: key for key, nodes in groups.items() for node_id in nodes}
+    edges = {}
+    for row in _read_csv(deps_csv):
+        source = (row.get('node_external_id') or '').strip()
+        target = (row.get('prerequisite_external_id') or '').strip()
+        if source in group_of:
+            edges.setdefault(group_of[source], set()).add((source, target))
+
+    requirements = {}
+    for row in _read_csv(rank_csv):
+        key = ((row.get('nation') or '').strip().lower(), (row.get('vehicle_type') or '').strip())
+        rank, units = (row.get('target_rank') or '').strip(), (row.get('required_units') or '').strip()
+        if rank.isdigit() and units.isdigit():
+            requirements.setdefault(key, {})[rank] = int(units)
+
+    bundles = {}
+    for (nation, vehicle_type), nodes in sorted(groups.items()):
+        bundle = build_bundle(nation, vehicle_type, list(nodes.values()),
+                              [list(edge) for edge in edges.get((nation, vehicle_type), ())],
+                              requirements.get((nation, vehicle_type), {}))
+        entry = write_bundle(bundle, out_dir, f"{nation}-{section_slug(vehicle_type)}")
+        entry.update({'nation': nation, 'vehicle_type': vehicle_type, 'nodes': len(nodes)})
+        bundles[f"{nation}/{vehicle_type}"] = entry
+
+    index = {
+        'format': BUNDLE_FORMAT,
+        'version': value_hash(sorted(entry['sha256'] for entry in bundles.values()))[:16],
+        'generated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'bundles': bundles,
+    }
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, index_path)
+
+    keep = _index_files(index) | _index_files(previous_index)
+    removed = 0
+    for path in glob.glob(os.path.join(out_dir, '*.json*')):
+        name = os.path.basename(path)
+        if _BUNDLE_FILE_RE.match(name) and name not in keep:
+            os.remove(path)
+            removed += 1
+
+    raw = sum(entry['size'] for entry in bundles.values())
+    packed = sum(entry['gzip_size'] for entry in bundles.values())
+    print(f"Бандлов: {len(bundles)} в '{out_dir}' ({raw / 1e3:.0f} КБ, gzip {packed / 1e3:.0f} КБ"
+          + (", brotli " + f"{sum(e['brotli_size'] for e in bundles.values()) / 1e3:.0f} КБ" if brotli else "")
+          + f"), версия {index['version']}, удалено устаревших файлов: {removed}")
+    return index
+
+
+if __name__ == "__main__":
+    from main import read_config, MERGED_CSV, DEPS_CSV, RANK_CSV, TARGET_SECTIONS
+    export_bundles(MERGED_CSV, DEPS_CSV, RANK_CSV, read_config().get('bundle_dir', 'bundles'), TARGET_SECTIONS)
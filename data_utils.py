@@ -1,9 +1,15 @@
 import csv
 import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
 from tree_data_extractor import TreeDataExtractor
+from vehicle_get_required_exp import VehicleDataFetcher
+from navigator import NavState
+from scrape_archive import record_page
+from page_payload import get_shared_capture
 
 def save_to_csv(data_list, filename="vehicles.csv", fieldnames=None):
     """Сохраняет список словарей в CSV файл."""
@@ -27,6 +33,55 @@ def save_to_csv(data_list, filename="vehicles.csv", fieldnames=None):
         print(f"Ошибка при сохранении данных в CSV {filename}: {e}")
 
 
+def load_from_csv(filename, int_fields=()):
+    """
+    Читает CSV, сохраненный save_to_csv, обратно в список словарей.
+
+    :param int_fields: Поля, приводимые к int (пустые значения -> None), как их отдают экстракторы
+    """
+    with open(filename, encoding="utf-8") as f:
+        data = list(csv.DictReader(f))
+    for row in data:
+        for field in int_fields:
+            value = row.get(field)
+            row[field] = int(value) if value not in (None, '') else None
+    print(f"Загружено {len(data)} строк из {filename}")
+    return data
+
+
+def filter_tree_data(tree_view_data_raw):
+    """Убирает из сырых данных Tree View папки без имени и узлы с повторяющимся или пустым ID."""
+    # Шаг 1: Фильтруем ПАПКИ без имени
+    filtered_tree_data_step1 = []
+    folders_without_name_count = 0
+    for node in tree_view_data_raw:
+        if node.get('type') == 'folder' and not node.get('name'):
+            folders_without_name_count += 1
+            continue
+        filtered_tree_data_step1.append(node)
+    print(f"Узлов после фильтрации папок без имени: {len(filtered_tree_data_step1)} (удалено папок без имени: {folders_without_name_count})")
+
+    # Шаг 2: Фильтруем ВСЕ узлы по уникальности ID
+    unique_tree_data = []
+    seen_ids = set()
+    duplicates_count = 0
+    nodes_without_id_count = 0
+    for node in filtered_tree_data_step1:
+        node_id = node.get('data_ulist_id') or node.get('external_id')
+
+        if node_id:
+            if node_id not in seen_ids:
+                unique_tree_data.append(node)
+                seen_ids.add(node_id)
+            else:
+                duplicates_count += 1
+        else:
+             nodes_without_id_count += 1
+
+    print(f"Узлов после фильтрации по уникальности ID: {len(unique_tree_data)} (удалено дубликатов: {duplicates_count}, узлов без ID: {nodes_without_id_count})")
+    return unique_tree_data
+
+
 def roman_to_int(s: str) -> int:
     """
     Конвертирует римские цифры (I, II, IV и т.д.) в целые числа.
@@ -79,11 +134,262 @@ def save_dependencies_to_csv(dependencies, filename="dependencies.csv", fieldnam
          print(f"Ошибка при сохранении зависимостей в CSV {filename}: {e}")
 
 
-def get_all_nation_tree_data(helper, target_section):
+def open_section(helper, section, settle=1.5):
+    """Кликает по пункту навигационного меню раздела и ждет отрисовки страницы."""
+    nav_item = helper.wait.until(
+        EC.element_to_be_clickable(
+            (By.XPATH, f"//a[contains(@class, 'layout-nav_item')]//span[normalize-space(text())='{section}']/..")
+        )
+    )
+    nav_item.click()
+    print(f"Переход в раздел '{section}' выполнен.")
+    time.sleep(settle)
+
+
+def show_tree_view(helper):
+    """Активирует режим Tree View в текущем разделе."""
+    tree_button = helper.wait.until(EC.presence_of_element_located((By.ID, "wt-show-tree")))
+    try:
+         helper.driver.execute_script("arguments[0].scrollIntoView(true);", tree_button)
+         time.sleep(0.5)
+         helper.wait.until(EC.element_to_be_clickable(tree_button)).click()
+    except Exception as e:
+        print(f"Предупреждение: Обычный клик по кнопке Tree не сработал: {e}. Пробую JS click.")
+        helper.driver.execute_script("arguments[0].click();", tree_button)
+    print("Кнопка 'Tree' активирована.")
+    time.sleep(2.5)
+
+
+def needs_required_exp(data):
+    """Есть ли у техники страница с required_exp (исследуемая техника за серебро)."""
+    silver = str(data.get('silver') or '')
+    return silver.isdigit() and int(silver) > 0
+
+
+def fetch_unit_cards(vehicles_data, max_workers=8, researchable_only=False):
+    """
+    Параллельно загружает и разбирает карточки со страниц техники.
+    Скорость запросов ограничивает общий RateLimiter сессии.
+
+    :param researchable_only: Только техника за серебро (страницы, где есть required_exp)
+    :return: Список UnitCard в порядке vehicles_data для загруженных страниц
+    """
+    targets = [data for data in vehicles_data
+               if data.get('link') and (not researchable_only or needs_required_exp(data))]
+    print(f"Загрузка карточек {len(targets)} единиц техники ({max_workers} потоков)...")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        cards = [card for card in pool.map(VehicleDataFetcher.fetch_unit_card, targets)
+                 if card is not None and not card.is_empty()]
+    with_exp = sum(1 for card in cards if card.required_exp is not None)
+    print(f"Получено карточек: {len(cards)}/{len(targets)} (с required_exp: {with_exp})")
+    return cards
+
+
+def normalize_silver(data):
+    """Приводит поле 'silver' записи List View к int (или None)."""
+    if data.get('silver'):
+        try:
+            silver_str = str(data['silver']).replace(',', '').replace(' ', '').strip()
+            if silver_str.isdigit():
+                 data['silver'] = int(silver_str)
+            else:
+                 data['silver'] = None
+        except (ValueError, TypeError):
+             print(f"Предупреждение: Не удалось конвертировать 'silver' в число для {data.get('name')}: '{data.get('silver')}'")
+             data['silver'] = None
+    return data
+
+
+def show_list_view(helper, section):
+    """Открывает раздел кликом по меню и активирует режим List View."""
+    open_section(helper, section)
+
+    list_button = helper.wait_for_id('wt-show-list')
+    if not list_button:
+        print(f"Предупреждение: Не удалось найти кнопку 'List' для раздела {section}")
+        return False
+    try:
+        helper.driver.execute_script("arguments[0].scrollIntoView(true);", list_button)
+        helper.wait.until(EC.element_to_be_clickable(list_button)).click()
+    except Exception as e:
+        print(f"Предупреждение: Обычный клик по кнопке List не сработал: {e}. Пробую JS click.")
+        helper.driver.execute_script("arguments[0].click();", list_button)
+    print("Кнопка 'List' активирована.")
+    return True
+
+
+def get_section_list_data(helper, section, on_item=None, navigator=None, fetch_exp=True, strict=False):
+    """
+    Собирает записи техники из List View раздела (вместе с required_exp со страниц техники).
+
+    :param on_item: Необязательный callback, вызываемый для каждой готовой записи
+    :param navigator: Необязательный Navigator для прямого перехода вместо кликов
+    :param fetch_exp: Загружать required_exp сразу; False - оставить это fetch_required_exp_data
+    :param strict: Поднимать исключение, если раздел или часть его строк собрать не удалось
+    :raises RuntimeError: При strict, если раздел собран не полностью
+    """
+    section_data = []
+    failed_rows = []
+    try:
+        print(f"\nОбработка раздела (List View): {section}")
+        if not (navigator and navigator.goto(NavState(section, 'list'))):
+            if not show_list_view(helper, section):
+                if strict:
+                    raise RuntimeError(f"Не удалось открыть List View раздела '{section}'")
+                return section_data
+
+        capture = get_shared_capture()
+        capture.probe(helper.driver, f"'{section}' (List View)")
+        rows = capture.list_rows(helper.driver, section)
+        captured = rows is not None
+        if not captured:
+            rows = helper.get_vehicle_rows()
+        record_page(helper.driver, section, 'list')
+        total_rows = len(rows)
+        print(f"Найдено строк техники: {total_rows}")
+        for idx, row in enumerate(rows, start=1):
+            try:
+                data = row if captured else helper.parse_vehicle_row(row, section)
+                if data is None:
+                    continue
+
+                if fetch_exp and needs_required_exp(data):
+                    try:
+                         data = VehicleDataFetcher.fetch_required_exp(data)
+                    except Exception as fetch_exp:
+                        print(f"Предупреждение: Не удалось получить required_exp для {data.get('name', data.get('data_ulist_id'))}: {fetch_exp}")
+
+                normalize_silver(data)
+                section_data.append(data)
+                if on_item:
+                    on_item(data)
+            except Exception as e:
+                print(f"Ошибка при обработке строки {idx} в разделе '{section}' (List View): {e}")
+                failed_rows.append(idx)
+        print(f"Успешно обработано строк в разделе '{section}': {len(section_data)}/{total_rows}")
+
+    except TimeoutException as e:
+         print(f"Ошибка (тайм-аут) при обработке раздела '{section}' (List View): {e}")
+         if strict:
+             raise
+    except Exception as e:
+        print(f"Непредвиденная ошибка при обработке раздела '{section}' (List View): {e}")
+        if strict:
+            raise
+    if strict and failed_rows:
+        raise RuntimeError(f"List View раздела '{section}': не обработаны строки {', '.join(map(str, failed_rows))}")
+    if strict and not section_data:
+        raise RuntimeError(f"List View раздела '{section}': не найдено ни одной записи")
+    return section_data
+
+
+def extract_tree_nodes(helper, section, extractor=None):
+    """
+    Узлы Tree View текущей страницы: одним скриптом (capture_mode=script) или по элементам через TreeDataExtractor.
+    """
+    capture = get_shared_capture()
+    capture.probe(helper.driver, f"'{section}' (Tree View)")
+    nodes = capture.tree_nodes(helper.driver)
+    if nodes is None:
+        nodes = (extractor or TreeDataExtractor(helper)).extract_nodes()
+    return nodes
+
+
+def get_section_tree_data_via_navigator(navigator, section, nations=None, on_item=None):
+    """
+    Собирает узлы Tree View раздела, переходя к каждой нации напрямую через Navigator.
+
+    :param nations: Необязательный список ключей или подписей наций
+    :param on_item: Необязательный callback, вызываемый для каждого извлеченного узла
+    """
+    extractor = TreeDataExtractor(navigator.helper)
+    all_nodes_in_section = []
+    for state in navigator.iter_states([section], views=('tree',), nations=nations):
+        nation_label = state.nation_label or state.nation
+        print(f"Обработка нации: {nation_label} в разделе '{section}'")
+        record_page(navigator.helper.driver, section, 'tree', nation=state.nation, nation_label=state.nation_label)
+        try:
+            nation_data = extract_tree_nodes(navigator.helper, section, extractor)
+        except Exception as e:
+            print(f"Ошибка при извлечении дерева нации '{nation_label}' в разделе '{section}': {e}")
+            continue
+        print(f"Извлечено {len(nation_data)} узлов для нации '{nation_label}'.")
+        all_nodes_in_section.extend(nation_data)
+        if on_item:
+            for node in nation_data:
+                on_item(node)
+    return all_nodes_in_section
+
+
+def get_nation_tree_data(navigator, state):
+    """
+    Переходит в Tree View одной нации и извлекает ее узлы.
+
+    :return: Список узлов или None, если перейти в состояние не удалось
+    """
+    nation_label = state.nation_label or state.nation
+    if not navigator.goto(state):
+        return None
+    print(f"Обработка нации: {nation_label} в разделе '{state.section}'")
+    record_page(navigator.helper.driver, state.section, 'tree', nation=state.nation, nation_label=state.nation_label)
+    nation_data = extract_tree_nodes(navigator.helper, state.section)
+    print(f"Извлечено {len(nation_data)} узлов для нации '{nation_label}'.")
+    return nation_data
+
+
+def get_tree_data_pipelined(navigator, sections, parser, nations=None, driver_lock=None):
+    """
+    Собирает узлы Tree View нескольких разделов: браузер только переходит по нациям и снимает
+    page_source, а SnapshotParser разбирает снимки в других процессах параллельно со следующими переходами.
+
+    :param driver_lock: Необязательная блокировка драйвера; берется на переход и снимок каждой нации
+    :return: Словарь {раздел: узлы} в порядке разделов и наций навигации
+    """
+    driver = navigator.helper.driver
+    driver_lock = driver_lock or nullcontext()
+    submitted = {}
+    states = navigator.iter_states(sections, views=('tree',), nations=nations)
+    while True:
+        with driver_lock:
+            state = next(states, None)
+            if state is None:
+                break
+            nation_label = state.nation_label or state.nation
+            try:
+                html = driver.page_source
+            except Exception as e:
+                print(f"Ошибка при получении снимка нации '{nation_label}' в разделе '{state.section}': {e}")
+                navigator.failed_states.append(state)
+                continue
+            url = driver.current_url
+            record_page(driver, state.section, 'tree', nation=state.nation, nation_label=state.nation_label, html=html)
+        submitted[(state.section, nation_label)] = state
+        parser.submit((state.section, nation_label), html, url)
+        print(f"Снимок нации '{nation_label}' в разделе '{state.section}' отправлен на разбор.")
+
+    section_nodes = {}
+    for (section, nation_label), nation_data in parser.results():
+        if nation_data is None:
+            navigator.failed_states.append(submitted[(section, nation_label)])
+            continue
+        print(f"Извлечено {len(nation_data)} узлов для нации '{nation_label}' в разделе '{section}'.")
+        section_nodes.setdefault(section, []).extend(nation_data)
+    return section_nodes
+
+
+def get_all_nation_tree_data(helper, target_section, nations=None, on_item=None, strict=False):
     """
     Собирает все узлы (техника и папки) из Tree View для всех наций в текущем разделе.
+
+    :param nations: Необязательный список подписей вкладок наций; остальные вкладки пропускаются
+    :param on_item: Необязательный callback, вызываемый для каждого извлеченного узла
+    :param strict: Поднимать исключение, если раздел или какую-либо из наций собрать не удалось
+    :raises RuntimeError: При strict, если раздел собран не полностью
     """
+    wanted = {n.strip().lower() for n in nations} if nations else None
     all_nodes_in_section = []
+    failed_nations = []
     try:
         container = helper.wait.until(
             EC.presence_of_element_located((By.CSS_SELECTOR, "div.navtabs_wrapper"))
@@ -111,6 +417,9 @@ def get_all_nation_tree_data(helper, target_section):
                 except Exception:
                     nation_label = f"[вкладка {i+1}]"
 
+                if wanted is not None and nation_label.lower() not in wanted:
+                    continue
+
                 print(f"Обработка нации: {nation_label} (вкладка {i+1}/{len(nation_tabs)}) в разделе '{target_section}'")
 
                 try:
@@ -121,16 +430,22 @@ def get_all_nation_tree_data(helper, target_section):
                         helper.driver.execute_script("arguments[0].click();", tab)
                     except Exception as js_e:
                         print(f"JS click по вкладке '{nation_label}' также не удался: {js_e}. Пропускаем нацию.")
+                        failed_nations.append(nation_label)
                         continue
 
                 time.sleep(2.5)
 
-                nation_data = extractor.extract_nodes()
+                record_page(helper.driver, target_section, 'tree', nation_label=nation_label)
+                nation_data = extract_tree_nodes(helper, target_section, extractor)
                 print(f"Извлечено {len(nation_data)} узлов для нации '{nation_label}'.")
                 all_nodes_in_section.extend(nation_data)
+                if on_item:
+                    for node in nation_data:
+                        on_item(node)
 
             except Exception as tab_e:
                 print(f"Ошибка при обработке вкладки нации '{nation_label}' в разделе '{target_section}': {tab_e}")
+                failed_nations.append(nation_label or f"[вкладка {i+1}]")
                 try:
                     helper.driver.execute_script("arguments[0].scrollLeft += 200;", container)
                     time.sleep(0.5)
@@ -140,8 +455,14 @@ def get_all_nation_tree_data(helper, target_section):
 
     except TimeoutException:
         print(f"Не удалось найти контейнер с вкладками наций ('div.navtabs_wrapper') в разделе '{target_section}'.")
+        if strict:
+            raise
     except Exception as e:
         print(f"Общая ошибка при получении данных дерева для раздела '{target_section}': {e}")
+        if strict:
+            raise
 
     print(f"Сбор данных TreeView для раздела '{target_section}' завершен. Собрано узлов: {len(all_nodes_in_section)}.")
+    if strict and failed_nations:
+        raise RuntimeError(f"Tree View раздела '{target_section}': не собраны нации {', '.join(failed_nations)}")
     return all_nodes_in_section
\ No newline at end of file
@@ -1,12 +1,80 @@
+import json
+import os
 import requests
 import jwt
 import time
+from rate_limiter import RateLimitedAdapter, RateLimiter
+
+
+class IdCache:
+    """
+    Соответствия ключ -> id по таблицам (name -> id, external_id -> id) на стороне клиента.
+
+    Заполняется строками, которые PostgREST возвращает при вставке (Prefer: return=representation),
+    и хранится в JSON-файле между запусками отдельно для каждого base_url. Перед использованием
+    таблица проверяется одним запросом: число строк и max(id) в БД должны совпасть с кэшем.
+    """
+
+    def __init__(self, path=None, scope=''):
+        self.path = path
+        self.scope = scope
+        self.tables = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self.tables = json.load(f).get(scope, {})
+            except (OSError, ValueError) as e:
+                print(f"Предупреждение: Кэш id '{path}' не прочитан: {e}")
+
+    def get(self, table, key_field):
+        entry = self.tables.get(table)
+        if entry is None or entry['key_field'] != key_field:
+            return None
+        return entry['ids']
+
+    def remember(self, table, key_field, rows):
+        """Добавляет id из возвращенных вставкой строк (ответ без строк игнорируется)."""
+        if not isinstance(rows, list):
+            return
+        entry = self.tables.get(table)
+        if entry is None or entry['key_field'] != key_field:
+            entry = self.tables[table] = {'key_field': key_field, 'ids': {}}
+        for row in rows:
+            if row.get(key_field) is not None and row.get('id') is not None:
+                entry['ids'][row[key_field]] = row['id']
+
+    def replace(self, table, key_field, ids):
+        self.tables[table] = {'key_field': key_field, 'ids': dict(ids)}
+
+    def forget(self, table):
+        self.tables.pop(table, None)
+
+    def save(self):
+        if not self.path:
+            return
+        data = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+        data[self.scope] = self.tables
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
 
 class PostgrestClient:
-    def __init__(self, base_url, api_key=None, jwt_secret=None):
+    def __init__(self, base_url, api_key=None, jwt_secret=None, limiter=None, id_cache_file=None):
         self.base = base_url.rstrip('/')
+        self.ids = IdCache(id_cache_file, scope=self.base)
         self.session = requests.Session()
         self.session.trust_env = False
+        # Свой лимитер с высоким потолком: PostgREST локальный, но 429/503 все равно учитываются
+        self.limiter = limiter or RateLimiter(rate=100, max_rate=1000, concurrency=8, max_concurrency=32)
+        self.session.mount(self.base, RateLimitedAdapter(self.limiter))
         
         headers = {'Content-Type': 'application/json'}
         
@@ -29,13 +97,22 @@ class PostgrestClient:
         url = f"{self.base}/{table}"
         r = self.session.delete(url)
         r.raise_for_status()
+        self.ids.forget(table)
         print(f"Очищена таблица {table}")
         return r.status_code
 
-    def _post(self, path, data):
-        """POST запрос"""
+    def _post(self, path, data, returning=None):
+        """
+        POST запрос
+
+        :param returning: Поля вставленных строк, которые вернуть в ответе (Prefer: return=representation)
+        """
         url = f"{self.base}/{path}"
-        r = self.session.post(url, json=data)
+        if returning:
+            r = self.session.post(url, json=data, params={'select': returning},
+                                  headers={'Prefer': 'return=representation'})
+        else:
+            r = self.session.post(url, json=data)
         r.raise_for_status()
         if r.text:
             try:
@@ -66,26 +143,47 @@ class PostgrestClient:
     def upsert_vehicle_types(self, names):
         """Вставка типов техники"""
         payload = [{'name': n} for n in names]
-        result = self._post('vehicle_types', payload)
+        result = self._post('vehicle_types', payload, returning='id,name')
+        self.ids.remember('vehicle_types', 'name', result)
         print(f"Загружено {len(names)} типов техники")
         return result
 
     def upsert_nations(self, nations):
         """Вставка наций"""
-        result = self._post('nations', nations)
+        result = self._post('nations', nations, returning='id,name')
+        self.ids.remember('nations', 'name', result)
         print(f"Загружено {len(nations)} наций")
         return result
 
+    def table_signature(self, table):
+        """(число строк, max(id)) одним запросом: Prefer: count=exact и одна строка по убыванию id."""
+        r = self.session.get(f"{self.base}/{table}", params={'select': 'id', 'order': 'id.desc', 'limit': '1'},
+                             headers={'Prefer': 'count=exact'})
+        r.raise_for_status()
+        total = r.headers.get('Content-Range', '').rsplit('/', 1)[-1]
+        rows = r.json()
+        return (int(total) if total.isdigit() else None), (rows[0]['id'] if rows else None)
+
     def fetch_map(self, table, key_field='name'):
-        """Получение справочника id -> name"""
+        """Получение справочника name -> id: из кэша id, если он сходится с таблицей, иначе чтением таблицы"""
+        cached = self.ids.get(table, key_field)
+        if cached is not None:
+            count, max_id = self.table_signature(table)
+            if count == len(cached) and max_id == max(cached.values(), default=None):
+                print(f"Справочник {table}: {len(cached)} записей из кэша id")
+                return dict(cached)
+            print(f"Кэш id таблицы {table} устарел ({len(cached)} записей в кэше, {count} в БД), чтение таблицы")
         data = self._get(table, params={'select': f"id,{key_field}"})
         mapping = {rec[key_field]: rec['id'] for rec in data}
+        self.ids.replace(table, key_field, mapping)
         print(f"Загружен справочник {table}: {len(mapping)} записей")
         return mapping
 
     def insert_nodes(self, nodes_payload):
         """Вставка узлов техники"""
-        return self._post('nodes', nodes_payload)
+        result = self._post('nodes', nodes_payload, returning='id,external_id')
+        self.ids.remember('nodes', 'external_id', result)
+        return result
 
     def insert_node_dependencies(self, deps_payload):
         """Вставка зависимостей между узлами"""
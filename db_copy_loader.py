@@ -0,0 +1,173 @@
+from db_uploader import build_upload_payload
+
+try:
+    import psycopg
+except ImportError:
+    psycopg = None
+
+NODE_COLUMNS = [
+    'external_id', 'name', 'type', 'tech_category', 'nation', 'vehicle_type', 'rank',
+    'silver_cost', 'required_exp', 'image_url', 'br', 'column_index', 'row_index',
+    'order_in_folder', 'parent_external_id',
+]
+
+TEMP_TABLES_SQL = """
+CREATE TEMP TABLE tmp_nodes (
+    external_id        text,
+    name               text,
+    type               text,
+    tech_category      text,
+    nation             text,
+    vehicle_type       text,
+    rank               integer,
+    silver_cost        integer,
+    required_exp       integer,
+    image_url          text,
+    br                 double precision,
+    column_index       integer,
+    row_index          integer,
+    order_in_folder    integer,
+    parent_external_id text
+) ON COMMIT DROP;
+CREATE TEMP TABLE tmp_dependencies (
+    node_external_id         text,
+    prerequisite_external_id text
+) ON COMMIT DROP;
+CREATE TEMP TABLE tmp_rank_requirements (
+    nation         text,
+    vehicle_type   text,
+    target_rank    integer,
+    previous_rank  integer,
+    required_units integer
+) ON COMMIT DROP;
+"""
+
+INSERT_NODES_SQL = """
+INSERT INTO {nodes} (external_id, name, type, tech_category, nation_id, vehicle_type_id, rank,
+                     silver_cost, required_exp, image_url, br, column_index, row_index, order_in_folder)
+SELECT t.external_id, t.name, t.type, t.tech_category, n.id, vt.id, t.rank,
+       t.silver_cost, t.required_exp, t.image_url, t.br, t.column_index, t.row_index, t.order_in_folder
+FROM tmp_nodes t
+JOIN {nations} n ON n.name = t.nation
+JOIN {vehicle_types} vt ON vt.name = t.vehicle_type
+"""
+
+UPDATE_PARENTS_SQL = """
+UPDATE {nodes} c
+SET parent_id = p.id
+FROM tmp_nodes t
+JOIN {nodes} p ON p.external_id = t.parent_external_id
+WHERE c.external_id = t.external_id
+"""
+
+INSERT_DEPENDENCIES_SQL = """
+INSERT INTO {node_dependencies} (node_id, prerequisite_node_id)
+SELECT a.id, b.id
+FROM tmp_dependencies d
+JOIN {nodes} a ON a.external_id = d.node_external_id
+JOIN {nodes} b ON b.external_id = d.prerequisite_external_id
+"""
+
+INSERT_RANK_REQUIREMENTS_SQL = """
+INSERT INTO {rank_requirements} (nation_id, vehicle_type_id, target_rank, previous_rank, required_units)
+SELECT n.id, vt.id, r.target_rank, r.previous_rank, r.required_units
+FROM tmp_rank_requirements r
+JOIN {nations} n ON n.name = r.nation
+JOIN {vehicle_types} vt ON vt.name = r.vehicle_type
+"""
+
+TABLES = ('vehicle_types', 'nations', 'nodes', 'node_dependencies', 'rank_requirements')
+
+
+def _copy_rows(cur, table, columns, rows):
+    with cur.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row(row)
+
+
+def _null_if_empty(value):
+    return None if value is None or value == '' else value
+
+
+def load_into_tables(cur, tables, payload):
+    """
+    Заливает данные через COPY в таблицы tables (словарь логическое имя -> имя таблицы).
+    id наций, типов техники и родителей подставляются в SQL через временные таблицы.
+    Таблицы должны быть пустыми.
+
+    :param payload: Результат build_upload_payload
+    :return: Словарь с числом ожидаемых и вставленных строк
+    """
+    counts = {}
+    cur.execute(TEMP_TABLES_SQL)
+
+    print("\nCOPY vehicle_types...")
+    _copy_rows(cur, tables['vehicle_types'], ['name'], [(name,) for name in payload['vehicle_types']])
+
+    print("COPY nations...")
+    _copy_rows(cur, tables['nations'], ['name', 'image_url'],
+               [(n['name'], n['image_url']) for n in payload['nations']])
+
+    nodes_payload = payload['nodes']
+    print(f"COPY {len(nodes_payload)} узлов...")
+    _copy_rows(cur, 'tmp_nodes', NODE_COLUMNS, [tuple(row[c] for c in NODE_COLUMNS) for row in nodes_payload])
+    cur.execute(INSERT_NODES_SQL.format(**tables))
+    counts['nodes_expected'] = len(nodes_payload)
+    counts['nodes'] = cur.rowcount
+    print(f"Вставлено {cur.rowcount} узлов")
+    cur.execute(UPDATE_PARENTS_SQL.format(**tables))
+    print(f"Обновлено {cur.rowcount} связей parent_id")
+
+    dep_columns = ['node_external_id', 'prerequisite_external_id']
+    _copy_rows(cur, 'tmp_dependencies', dep_columns,
+               [tuple(_null_if_empty(row.get(c)) for c in dep_columns) for row in payload['dependencies']])
+    cur.execute(INSERT_DEPENDENCIES_SQL.format(**tables))
+    print(f"Загружено {cur.rowcount} зависимостей")
+
+    rank_columns = ['nation', 'vehicle_type', 'target_rank', 'previous_rank', 'required_units']
+    _copy_rows(cur, 'tmp_rank_requirements', rank_columns,
+               [tuple(row[c] for c in rank_columns) for row in payload['rank_requirements']])
+    cur.execute(INSERT_RANK_REQUIREMENTS_SQL.format(**tables))
+    print(f"Загружено {cur.rowcount} требований по рангам")
+
+    counts['vehicle_types_expected'] = len(payload['vehicle_types'])
+    counts['nations_expected'] = len(payload['nations'])
+    return counts
+
+
+def connect(config):
+    """Открывает прямое соединение с PostgreSQL по pg_dsn из config.txt."""
+    if psycopg is None:
+        raise RuntimeError("Для db_backend=copy требуется пакет psycopg (pip install \"psycopg[binary]\")")
+    dsn = config.get('pg_dsn')
+    if not dsn:
+        raise ValueError("В config.txt не указан pg_dsn для прямой загрузки в PostgreSQL")
+    return psycopg.connect(dsn)
+
+
+def load_all_data(config,
+                  target_sections,
+                  override_rules_data=None,
+                  country_csv="country_flags.csv",
+                  merged_csv="vehicles_merged.csv",
+                  deps_csv="dependencies.csv",
+                  rank_csv="rank_requirements.csv",
+                  payload=None):
+    """
+    Полная загрузка данных напрямую в PostgreSQL через COPY ... FROM STDIN.
+    Альтернатива upload_all_data; очистка и загрузка идут в одной транзакции.
+    """
+    if payload is None:
+        payload = build_upload_payload(target_sections, override_rules_data,
+                                       country_csv, merged_csv, deps_csv, rank_csv)
+    with connect(config) as conn:
+        with conn.cursor() as cur:
+            print("\nОчистка таблиц...")
+            cur.execute(f"TRUNCATE {', '.join(TABLES)}")
+            load_into_tables(cur, {t: t for t in TABLES}, payload)
+    print("\nВсё успешно загружено через COPY!")
+
+
+if __name__ == "__main__":
+    from main import read_config, load_override_rules, TARGET_SECTIONS
+    load_all_data(read_config(), TARGET_SECTIONS, override_rules_data=load_override_rules())
@@ -0,0 +1,152 @@
+from db_copy_loader import connect, load_into_tables, TABLES
+from db_uploader import build_upload_payload
+
+SHADOW_SUFFIX = '_next'
+
+# Проверки ссылочной целостности staging-таблиц: (описание, запрос количества нарушений)
+INTEGRITY_CHECKS = [
+    ("узлы с неизвестной нацией",
+     "SELECT count(*) FROM nodes_next c LEFT JOIN nations_next n ON n.id = c.nation_id WHERE n.id IS NULL"),
+    ("узлы с неизвестным типом техники",
+     "SELECT count(*) FROM nodes_next c LEFT JOIN vehicle_types_next v ON v.id = c.vehicle_type_id WHERE v.id IS NULL"),
+    ("узлы с отсутствующим родителем",
+     "SELECT count(*) FROM nodes_next c LEFT JOIN nodes_next p ON p.id = c.parent_id "
+     "WHERE c.parent_id IS NOT NULL AND p.id IS NULL"),
+    ("зависимости с отсутствующим узлом",
+     "SELECT count(*) FROM node_dependencies_next d "
+     "LEFT JOIN nodes_next a ON a.id = d.node_id LEFT JOIN nodes_next b ON b.id = d.prerequisite_node_id "
+     "WHERE a.id IS NULL OR b.id IS NULL"),
+    ("требования по рангам с неизвестной нацией или типом",
+     "SELECT count(*) FROM rank_requirements_next r "
+     "LEFT JOIN nations_next n ON n.id = r.nation_id LEFT JOIN vehicle_types_next v ON v.id = r.vehicle_type_id "
+     "WHERE n.id IS NULL OR v.id IS NULL"),
+    ("дубликаты external_id",
+     "SELECT count(*) FROM (SELECT external_id FROM nodes_next GROUP BY external_id HAVING count(*) > 1) d"),
+]
+
+
+class ShadowValidationError(RuntimeError):
+    """Данные в staging-таблицах не прошли проверку; рабочие таблицы не тронуты."""
+
+
+def _shadow(table):
+    return table + SHADOW_SUFFIX
+
+
+def create_shadow_tables(cur):
+    """
+    Пересоздает staging-таблицы по структуре рабочих (без внешних ключей, UNLOGGED).
+    Для serial-колонок id берутся из тех же последовательностей, что и в рабочих таблицах.
+    """
+    for table in TABLES:
+        cur.execute(f"DROP TABLE IF EXISTS {_shadow(table)}")
+        cur.execute(
+            f"CREATE UNLOGGED TABLE {_shadow(table)} "
+            f"(LIKE {table} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS INCLUDING INDEXES)"
+        )
+
+
+def drop_shadow_tables(cur):
+    for table in TABLES:
+        cur.execute(f"DROP TABLE IF EXISTS {_shadow(table)}")
+
+
+def _count(cur, table):
+    cur.execute(f"SELECT count(*) FROM {table}")
+    return cur.fetchone()[0]
+
+
+def validate_shadow_tables(cur, counts, min_ratio=0.9):
+    """
+    Проверяет число строк и ссылочную целостность staging-таблиц.
+
+    :param counts: Ожидаемые количества, которые вернул load_into_tables
+    :param min_ratio: Минимальная доля узлов относительно текущих рабочих таблиц
+    :raises ShadowValidationError: Если найдено хотя бы одно нарушение
+    """
+    problems = []
+    next_counts = {table: _count(cur, _shadow(table)) for table in TABLES}
+    print("Строк в staging-таблицах: " + ", ".join(f"{t}={c}" for t, c in next_counts.items()))
+
+    if next_counts['vehicle_types'] != counts['vehicle_types_expected']:
+        problems.append(f"vehicle_types: {next_counts['vehicle_types']} из {counts['vehicle_types_expected']}")
+    if next_counts['nations'] != counts['nations_expected']:
+        problems.append(f"nations: {next_counts['nations']} из {counts['nations_expected']}")
+    if next_counts['nodes'] == 0 or next_counts['nodes'] != counts['nodes_expected']:
+        problems.append(f"nodes: {next_counts['nodes']} из {counts['nodes_expected']}")
+
+    live_nodes = _count(cur, 'nodes')
+    if live_nodes and next_counts['nodes'] < live_nodes * min_ratio:
+        problems.append(f"узлов {next_counts['nodes']} - меньше {min_ratio:.0%} от текущих {live_nodes}")
+
+    for description, query in INTEGRITY_CHECKS:
+        cur.execute(query)
+        violations = cur.fetchone()[0]
+        if violations:
+            problems.append(f"{description}: {violations}")
+
+    if problems:
+        for problem in problems:
+            print(f"❌ {problem}")
+        raise ShadowValidationError("Проверка staging-таблиц не пройдена: " + "; ".join(problems))
+    print("Проверка staging-таблиц пройдена.")
+
+
+def swap_shadow_tables(cur):
+    """
+    Подменяет содержимое рабочих таблиц данными staging-таблиц в одной транзакции.
+
+    Таблицы не переименовываются: внешние ключи, представления и кэш схемы PostgREST
+    продолжают ссылаться на те же объекты. Читатели до COMMIT видят старые данные
+    (или ждут блокировку), но никогда - пустые или частично загруженные таблицы.
+    """
+    cur.execute(f"LOCK TABLE {', '.join(TABLES)} IN ACCESS EXCLUSIVE MODE")
+    cur.execute(f"TRUNCATE {', '.join(TABLES)}")
+    for table in TABLES:
+        cur.execute(f"INSERT INTO {table} OVERRIDING SYSTEM VALUE SELECT * FROM {_shadow(table)}")
+        # Последовательность рабочей таблицы не должна отставать от перенесенных id
+        cur.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), max(id)) FROM {table} "
+            f"WHERE pg_get_serial_sequence('{table}', 'id') IS NOT NULL HAVING max(id) IS NOT NULL"
+        )
+
+
+def load_all_data_shadow(config,
+                         target_sections,
+                         override_rules_data=None,
+                         country_csv="country_flags.csv",
+                         merged_csv="vehicles_merged.csv",
+                         deps_csv="dependencies.csv",
+                         rank_csv="rank_requirements.csv",
+                         payload=None):
+    """
+    Загрузка без простоя: COPY в staging-таблицы *_next, проверка и атомарная подмена.
+    Если загрузка или проверка не удались, рабочие таблицы остаются как были.
+    """
+    if payload is None:
+        payload = build_upload_payload(target_sections, override_rules_data,
+                                       country_csv, merged_csv, deps_csv, rank_csv)
+    min_ratio = float(config.get('shadow_min_ratio', '0.9'))
+    with connect(config) as conn:
+        with conn.cursor() as cur:
+            print("\nПодготовка staging-таблиц...")
+            create_shadow_tables(cur)
+            counts = load_into_tables(cur, {t: _shadow(t) for t in TABLES}, payload)
+        conn.commit()
+
+        try:
+            with conn.cursor() as cur:
+                validate_shadow_tables(cur, counts, min_ratio=min_ratio)
+            conn.commit()
+
+            print("\nПодмена рабочих таблиц...")
+            with conn.transaction():
+                with conn.cursor() as cur:
+                    swap_shadow_tables(cur)
+            print("Рабочие таблицы обновлены.")
+        finally:
+            conn.rollback()
+            with conn.cursor() as cur:
+                drop_shadow_tables(cur)
+            conn.commit()
+    print("\nВсё успешно загружено через staging-таблицы!")
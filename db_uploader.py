@@ -1,53 +1,12 @@
 import csv
+import json
 from requests import HTTPError
 from data_utils import roman_to_int
 from db_client import PostgrestClient 
+from asset_mirror import rewrite_asset_urls
 
-def upload_all_data(config,
-                      target_sections,
-                      override_rules_data=None,
-                      country_csv="country_flags.csv",
-                      merged_csv="vehicles_merged.csv",
-                      deps_csv="dependencies.csv",
-                      rank_csv="rank_requirements.csv"):
-    """
-    Полная загрузка данных через PostgREST с аутентификацией парсера
-    """
-    base_url = config.get('base_url')
-    api_key = config.get('parser_api_key')
-    jwt_secret = config.get('jwt_secret') 
-    
-    if not base_url:
-        raise ValueError("В config.txt не указан base_url для PostgREST")
-    
-    if not api_key:
-        print("ВНИМАНИЕ: parser_api_key не указан в config.txt")
-    
-    if not jwt_secret:
-        print("ВНИМАНИЕ: jwt_secret не указан в config.txt")
-    
-    client = PostgrestClient(base_url, api_key, jwt_secret)
-    
-    print("Тестирование подключения...")
-    client.test_connection()
-    
-    print("\nНачинаем загрузку данных...")
-
-    # 1) очистка всех таблиц
-    print("\nОчистка таблиц...")
-    for tbl in ('node_dependencies','rank_requirements','nodes','nations','vehicle_types'):
-        try:
-            client.delete_all(tbl)
-        except Exception as e:
-            print(f"❌ Ошибка очистки таблицы {tbl}: {e}")
-            raise
-
-    # 2) vehicle_types
-    print("\nЗаливаю vehicle_types…")
-    client.upsert_vehicle_types(target_sections)
-
-    # 3) nations
-    print("\nЗаливаю nations…")
+def read_nations_csv(country_csv):
+    """Читает country_flags.csv в строки таблицы nations."""
     nations_payload = []
     try:
         with open(country_csv, encoding='utf-8') as f:
@@ -56,25 +15,20 @@ def upload_all_data(config,
                     'name':      row['country'].strip().lower(),
                     'image_url': row['flag_image_url'].strip()
                 })
-        client.upsert_nations(nations_payload)
     except FileNotFoundError:
         print(f"Файл {country_csv} не найден")
         raise
+    return nations_payload
 
-    # 4) fetch_map справочников
-    print("\nЗагружаю справочники...")
-    vt_map  = client.fetch_map('vehicle_types', key_field='name')
-    nat_map = client.fetch_map('nations',       key_field='name')
 
-    # 5) читаем merged CSV и строим payload для nodes
-    print(f"\nЧитаю данные из {merged_csv}...")
-    try:
-        merged_data = list(csv.DictReader(open(merged_csv, encoding='utf-8')))
-        print(f"Найдено {len(merged_data)} записей для обработки")
-    except FileNotFoundError:
-        print(f"Файл {merged_csv} не найден")
-        raise
-    
+def build_nodes_payload(merged_data, known_nations, known_types, override_rules_data=None):
+    """
+    Строит строки таблицы nodes из записей vehicles_merged.csv.
+    Нация и тип техники остаются именами ('nation', 'vehicle_type') - их id подставляет загрузчик.
+
+    :param known_nations: Имена наций, которые есть в БД (узлы других наций пропускаются)
+    :param known_types: Имена типов техники, которые есть в БД
+    """
     nodes_payload = []
     overridden_by_strict_rules_count = 0
 
@@ -85,12 +39,12 @@ def upload_all_data(config,
             continue
 
         country_key = (nd.get('country') or '').strip().lower()
-        if country_key not in nat_map:
+        if country_key not in known_nations:
             print(f"узел {ext}: неизвестная страна '{country_key}'")
             continue
 
         vt_key = (nd.get('vehicle_category') or '').strip()
-        if vt_key not in vt_map:
+        if vt_key not in known_types:
             print(f"узел {ext}: неизвестный vehicle_type '{vt_key}'")
             continue
 
@@ -148,8 +102,8 @@ def upload_all_data(config,
             'name':            nd.get('name') or ext,
             'type':            nd.get('type'),
             'tech_category':   tech_category,
-            'nation_id':       nat_map[country_key],
-            'vehicle_type_id': vt_map[vt_key],
+            'nation':          country_key,
+            'vehicle_type':    vt_key,
             'rank':            rank_int,
             'silver_cost':     silver_cost,
             'required_exp':    required_exp,
@@ -163,6 +117,164 @@ def upload_all_data(config,
     if override_rules_data and overridden_by_strict_rules_count > 0:
         print(f"Строгие правила применены к {overridden_by_strict_rules_count} узлам")
 
+    return nodes_payload
+
+
+
+def build_upload_payload(target_sections,
+                         override_rules_data=None,
+                         country_csv="country_flags.csv",
+                         merged_csv="vehicles_merged.csv",
+                         deps_csv="dependencies.csv",
+                         rank_csv="rank_requirements.csv",
+                         asset_urls=None):
+    """
+    Собирает все данные для загрузки в БД из CSV-файлов.
+    Связи (нации, типы, родители, зависимости) остаются по именам и external_id -
+    их id подставляет конкретный загрузчик (PostgREST или COPY).
+    asset_urls ({исходный URL: URL зеркала}) заменяет ссылки на изображения вики локальными копиями.
+    """
+    nations_payload = read_nations_csv(country_csv)
+
+    print(f"\nЧитаю данные из {merged_csv}...")
+    try:
+        with open(merged_csv, encoding='utf-8') as f:
+            merged_data = list(csv.DictReader(f))
+        print(f"Найдено {len(merged_data)} записей для обработки")
+    except FileNotFoundError:
+        print(f"Файл {merged_csv} не найден")
+        raise
+
+    parents = {(nd.get('data_ulist_id') or '').strip(): (nd.get('parent_external_id') or '').strip()
+               for nd in merged_data}
+    nodes_payload = build_nodes_payload(
+        merged_data,
+        known_nations={n['name'] for n in nations_payload},
+        known_types=set(target_sections),
+        override_rules_data=override_rules_data,
+    )
+    for row in nodes_payload:
+        row['parent_external_id'] = parents.get(row['external_id']) or None
+    if asset_urls:
+        replaced = rewrite_asset_urls(nations_payload, asset_urls) + rewrite_asset_urls(nodes_payload, asset_urls)
+        print(f"Ссылки на изображения заменены на зеркало: {replaced}")
+
+    dependencies = []
+    try:
+        with open(deps_csv, encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                dependencies.append({
+                    'node_external_id':         (row.get('node_external_id') or '').strip(),
+                    'prerequisite_external_id': (row.get('prerequisite_external_id') or '').strip(),
+                })
+    except FileNotFoundError:
+        print(f"Файл {deps_csv} не найден, пропуск зависимостей")
+
+    rank_requirements = []
+    try:
+        with open(rank_csv, encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                rank_requirements.append({
+                    'nation':         row.get('nation', '').strip().lower(),
+                    'vehicle_type':   row.get('vehicle_type', ''),
+                    'target_rank':    int(row['target_rank']),
+                    'previous_rank':  int(row['previous_rank']),
+                    'required_units': int(row['required_units']),
+                })
+    except FileNotFoundError:
+        print(f"Файл {rank_csv} не найден, пропуск требований по рангам")
+
+    return {
+        'vehicle_types':     list(target_sections),
+        'nations':           nations_payload,
+        'nodes':             nodes_payload,
+        'dependencies':      dependencies,
+        'rank_requirements': rank_requirements,
+    }
+
+
+def save_upload_payload(payload, filename="upload_payload.json"):
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=1)
+    print(f"Данные для загрузки ({len(payload['nodes'])} узлов) сохранены в {filename}")
+
+
+def load_upload_payload(filename="upload_payload.json"):
+    with open(filename, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def upload_all_data(config,
+                      target_sections,
+                      override_rules_data=None,
+                      country_csv="country_flags.csv",
+                      merged_csv="vehicles_merged.csv",
+                      deps_csv="dependencies.csv",
+                      rank_csv="rank_requirements.csv",
+                      payload=None):
+    """
+    Полная загрузка данных через PostgREST с аутентификацией парсера
+
+    :param payload: Готовый результат build_upload_payload (иначе собирается из CSV)
+    """
+    base_url = config.get('base_url')
+    api_key = config.get('parser_api_key')
+    jwt_secret = config.get('jwt_secret') 
+    
+    if not base_url:
+        raise ValueError("В config.txt не указан base_url для PostgREST")
+    
+    if not api_key:
+        print("ВНИМАНИЕ: parser_api_key не указан в config.txt")
+    
+    if not jwt_secret:
+        print("ВНИМАНИЕ: jwt_secret не указан в config.txt")
+
+    if payload is None:
+        payload = build_upload_payload(target_sections, override_rules_data,
+                                       country_csv, merged_csv, deps_csv, rank_csv)
+    
+    client = PostgrestClient(base_url, api_key, jwt_secret,
+                             id_cache_file=config.get('id_cache_file', '.id_cache.json') or None)
+    
+    print("Тестирование подключения...")
+    client.test_connection()
+    
+    print("\nНачинаем загрузку данных...")
+
+    # 1) очистка всех таблиц
+    print("\nОчистка таблиц...")
+    for tbl in ('node_dependencies','rank_requirements','nodes','nations','vehicle_types'):
+        try:
+            client.delete_all(tbl)
+        except Exception as e:
+            print(f"❌ Ошибка очистки таблицы {tbl}: {e}")
+            raise
+
+    # 2) vehicle_types
+    print("\nЗаливаю vehicle_types…")
+    client.upsert_vehicle_types(payload['vehicle_types'])
+
+    # 3) nations
+    print("\nЗаливаю nations…")
+    client.upsert_nations(payload['nations'])
+
+    # 4) fetch_map справочников
+    print("\nЗагружаю справочники...")
+    vt_map  = client.fetch_map('vehicle_types', key_field='name')
+    nat_map = client.fetch_map('nations',       key_field='name')
+
+    # 5) подставляем id справочников в payload для nodes
+    nodes_payload = []
+    for nd in payload['nodes']:
+        if nd['nation'] not in nat_map or nd['vehicle_type'] not in vt_map:
+            print(f"узел {nd['external_id']}: нет в справочниках БД ('{nd['nation']}', '{nd['vehicle_type']}')")
+            continue
+        row = {k: v for k, v in nd.items() if k not in ('nation', 'vehicle_type', 'parent_external_id')}
+        row['nation_id'] = nat_map[nd['nation']]
+        row['vehicle_type_id'] = vt_map[nd['vehicle_type']]
+        nodes_payload.append(row)
+
     # 6) вставляем nodes по одной записи
     print(f"\nВставка {len(nodes_payload)} узлов...")
     for idx, rec in enumerate(nodes_payload, 1):
@@ -181,9 +293,9 @@ def upload_all_data(config,
     node_map = client.fetch_map('nodes', key_field='external_id')
     updated_count = 0
     
-    for nd in merged_data:
-        ext_id_node  = (nd.get('data_ulist_id') or '').strip()
-        parent_ext_id = (nd.get('parent_external_id') or '').strip()
+    for nd in payload['nodes']:
+        ext_id_node  = nd['external_id']
+        parent_ext_id = nd.get('parent_external_id') or ''
         
         if ext_id_node in node_map and parent_ext_id and parent_ext_id in node_map:
             try:
@@ -196,59 +308,47 @@ def upload_all_data(config,
     print(f"Обновлено {updated_count} связей parent_id")
 
     # 8) node_dependencies
-    print(f"\nЗагрузка зависимостей из {deps_csv}...")
+    print("\nЗагрузка зависимостей...")
     deps = []
     node_map_for_deps = client.fetch_map('nodes', key_field='external_id')
-    
-    try:
-        with open(deps_csv, encoding='utf-8') as f:
-            for row in csv.DictReader(f):
-                node_id_val = row.get('node_external_id')
-                prerequisite_id_val = row.get('prerequisite_external_id')
-
-                if node_id_val in node_map_for_deps and prerequisite_id_val in node_map_for_deps:
-                    deps.append({
-                        'node_id':              node_map_for_deps[node_id_val],
-                        'prerequisite_node_id': node_map_for_deps[prerequisite_id_val]
-                    })
-        
-        if deps:
-            client.insert_node_dependencies(deps)
-        else:
-            print("Зависимости не найдены")
-            
-    except FileNotFoundError:
-        print(f"Файл {deps_csv} не найден, пропуск зависимостей")
+    client.ids.save()
+
+    for row in payload['dependencies']:
+        node_id_val = row.get('node_external_id')
+        prerequisite_id_val = row.get('prerequisite_external_id')
+
+        if node_id_val in node_map_for_deps and prerequisite_id_val in node_map_for_deps:
+            deps.append({
+                'node_id':              node_map_for_deps[node_id_val],
+                'prerequisite_node_id': node_map_for_deps[prerequisite_id_val]
+            })
+
+    if deps:
+        client.insert_node_dependencies(deps)
+    else:
+        print("Зависимости не найдены")
 
     # 9) rank_requirements
-    print(f"\nЗагрузка требований по рангам из {rank_csv}...")
+    print("\nЗагрузка требований по рангам...")
     rr = []
-    
-    try:
-        with open(rank_csv, encoding='utf-8') as f:
-            for row in csv.DictReader(f):
-                nation_name_key = row.get('nation','').strip().lower()
-                vehicle_type_name_key = row.get('vehicle_type','')
-                
-                if nation_name_key not in nat_map:
-                    continue
-                if vehicle_type_name_key not in vt_map:
-                    continue
-                    
-                rr.append({
-                    'nation_id':       nat_map[nation_name_key],
-                    'vehicle_type_id': vt_map[vehicle_type_name_key],
-                    'target_rank':     int(row['target_rank']),
-                    'previous_rank':   int(row['previous_rank']),
-                    'required_units':  int(row['required_units']),
-                })
-        
-        if rr:
-            client.insert_rank_requirements(rr)
-        else:
-            print("Требования по рангам не найдены")
-            
-    except FileNotFoundError:
-        print(f"Файл {rank_csv} не найден, пропуск требований по рангам")
 
-    print("\nВсё успешно загружено через PostgREST!")
\ No newline at end of file
+    for row in payload['rank_requirements']:
+        if row['nation'] not in nat_map:
+            continue
+        if row['vehicle_type'] not in vt_map:
+            continue
+
+        rr.append({
+            'nation_id':       nat_map[row['nation']],
+            'vehicle_type_id': vt_map[row['vehicle_type']],
+            'target_rank':     row['target_rank'],
+            'previous_rank':   row['previous_rank'],
+            'required_units':  row['required_units'],
+        })
+
+    if rr:
+        client.insert_rank_requirements(rr)
+    else:
+        print("Требования по рангам не найдены")
+
+    print("\nВсё успешно загружено через PostgREST!")
@@ -0,0 +1,186 @@
+import threading
+import time
+from urllib3.exceptions import HTTPError as Urllib3HTTPError
+from selenium.common.exceptions import (WebDriverException, InvalidSessionIdException, NoSuchWindowException,
+                                        TimeoutException)
+
+# Признаки потерянной сессии в сообщениях geckodriver/Marionette
+DEAD_SESSION_MESSAGES = (
+    'invalid session id',
+    'session deleted',
+    'session not created',
+    'browsing context has been discarded',
+    'failed to decode response from marionette',
+    'tried to run command without establishing a connection',
+    'connection refused',
+    'disconnected',
+)
+
+
+class DriverRecoveryError(RuntimeError):
+    """Драйвер не удалось восстановить за отведенное число попыток."""
+
+
+def is_dead_session_error(error):
+    """Означает ли исключение, что драйвер или браузер больше не отвечает."""
+    if isinstance(error, (InvalidSessionIdException, NoSuchWindowException, Urllib3HTTPError, ConnectionError)):
+        return True
+    if isinstance(error, TimeoutException):
+        return False
+    if isinstance(error, WebDriverException):
+        message = (error.msg or str(error)).lower()
+        return any(m in message for m in DEAD_SESSION_MESSAGES)
+    return False
+
+
+class DriverSupervisor:
+    """
+    Сторож драйвера.
+
+    Каждая команда WebDriver получает жесткий дедлайн (таймаут HTTP-клиента), загрузка страницы -
+    page_load_timeout. Ошибки, означающие потерю сессии, запоминаются даже если вызывающий код
+    их перехватил. run выполняет единицу работы (раздел, вид, нация); если сессия умерла, драйвер
+    перезапускается и единица выполняется заново - она сама переходит в свое состояние.
+    """
+
+    def __init__(self, start_driver, command_timeout=90.0, page_load_timeout=60.0, max_retries=2,
+                 quit_timeout=15.0):
+        """
+        :param start_driver: Функция без аргументов, возвращающая (driver, helper)
+        :param command_timeout: Максимальное время одной команды WebDriver, сек.
+        :param page_load_timeout: Максимальное время загрузки страницы, сек.
+        :param max_retries: Сколько раз повторять единицу работы после перезапуска драйвера
+        :param quit_timeout: Сколько ждать закрытия зависшего драйвера перед тем, как бросить его
+        """
+        self.start_driver = start_driver
+        self.command_timeout = command_timeout
+        self.page_load_timeout = page_load_timeout
+        self.max_retries = max_retries
+        self.quit_timeout = quit_timeout
+        self.on_restart = None
+        self.driver = None
+        self.helper = None
+        self.dead = False
+        self.last_error = None
+        self.restarts = 0
+        self.recoveries = []
+
+    @classmethod
+    def from_config(cls, config, start_driver):
+        return cls(
+            start_driver,
+            command_timeout=float(config.get('driver_command_timeout', '90')),
+            page_load_timeout=float(config.get('page_load_timeout', '60')),
+            max_retries=int(config.get('driver_max_retries', '2')),
+        )
+
+    def start(self):
+        self.driver, self.helper = self.start_driver()
+        self._install(self.driver)
+        self.dead = False
+        return self.driver, self.helper
+
+    def _install(self, driver):
+        try:
+            driver.set_page_load_timeout(self.page_load_timeout)
+        except WebDriverException as e:
+            print(f"Предупреждение: Не удалось установить page_load_timeout: {e}")
+        executor = driver.command_executor
+        executor.client_config.timeout = self.command_timeout
+        original = executor.execute
+
+        def execute(command, params=None):
+            try:
+                return original(command, params)
+            except Exception as e:
+                if is_dead_session_error(e):
+                    self.dead = True
+                    self.last_error = e
+                raise
+
+        executor.execute = execute
+
+    def _quit(self, driver):
+        """Закрывает драйвер в отдельном потоке, чтобы зависший geckodriver не остановил сбор."""
+        def quit_driver():
+            try:
+                driver.quit()
+            except Exception:
+                try:
+                    driver.service.stop()
+                except Exception:
+                    pass
+
+        thread = threading.Thread(target=quit_driver, daemon=True)
+        thread.start()
+        thread.join(self.quit_timeout)
+        if thread.is_alive():
+            print("Предупреждение: Старый драйвер не закрылся вовремя, оставляю его.")
+
+    def restart(self):
+        old = self.driver
+        self.driver = None
+        if old is not None:
+            self._quit(old)
+        self.restarts += 1
+        self.start()
+        if self.on_restart:
+            self.on_restart(self.driver, self.helper)
+
+    def stop(self):
+        if self.driver is not None:
+            self._quit(self.driver)
+            self.driver = None
+
+    def run(self, state, work):
+        """
+        Выполняет work(); при потере сессии перезапускает драйвер и повторяет не более max_retries раз.
+
+        :param state: Единица работы (NavState) - для журнала и метрик восстановления
+        :raises DriverRecoveryError: Если сессия умирает и после всех повторов
+        """
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if self.dead or self.driver is None:
+                started = time.time()
+                print(f"Сторож: сессия браузера потеряна ({error or self.last_error}), перезапуск для {state} "
+                      f"(попытка {attempt}/{self.max_retries}).")
+                try:
+                    self.restart()
+                except Exception as e:
+                    error = e
+                    self.recoveries.append({'state': repr(state), 'error': str(e), 'seconds': time.time() - started,
+                                            'ok': False})
+                    continue
+                self.recoveries.append({'state': repr(state), 'error': str(error or self.last_error),
+                                        'seconds': time.time() - started, 'ok': True})
+
+            try:
+                result = work()
+            except Exception as e:
+                if not (self.dead or is_dead_session_error(e)):
+                    raise
+                self.dead = True
+                error = e
+                continue
+            if not self.dead:
+                return result
+            error = self.last_error
+        raise DriverRecoveryError(f"Не удалось выполнить {state} после {self.max_retries} перезапусков драйвера: {error}")
+
+    def metrics(self):
+        return {
+            'restarts': self.restarts,
+            'recovery_seconds': round(sum(r['seconds'] for r in self.recoveries), 2),
+            'recoveries': list(self.recoveries),
+        }
+
+    def report(self):
+        if not self.recoveries:
+            return
+        metrics = self.metrics()
+        print(f"\nСторож драйвера: перезапусков {metrics['restarts']}, "
+              f"на восстановление ушло {metrics['recovery_seconds']} сек.")
+        for r in self.recoveries:
+            status = "восстановлено" if r['ok'] else "ошибка"
+            print(f"  {r['state']}: {status} за {r['seconds']:.1f} сек. ({r['error'][:120]})")
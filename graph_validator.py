@@ -0,0 +1,240 @@
+import csv
+import json
+import time
+from collections import deque
+from data_utils import roman_to_int
+
+NODE_TYPES = ('vehicle', 'folder')
+GROUP_SUFFIX = '_group'
+
+# Проверки и их серьезность: ошибки останавливают конвейер до загрузки в БД
+CHECKS = {
+    'empty_ids':              'error',
+    'duplicate_ids':          'error',
+    'unknown_node_types':     'error',
+    'missing_parents':        'error',
+    'dangling_dependencies':  'error',
+    'self_dependencies':      'error',
+    'cycles':                 'error',
+    # Узлы неизвестных наций и типов загрузчик пропускает намеренно
+    'unknown_nations':        'warning',
+    'unknown_vehicle_types':  'warning',
+    # id группы на вики совпадает с id ее первой техники - та оказывается своим родителем
+    'self_parents':           'warning',
+    'rank_not_monotonic':     'warning',
+    'duplicate_dependencies': 'warning',
+    'empty_groups':           'warning',
+}
+
+
+class GraphValidationError(ValueError):
+    """Данные для загрузки не прошли проверку целостности."""
+
+    def __init__(self, report):
+        self.report = report
+        failed = ', '.join(f"{name} ({check['count']})" for name, check in report['checks'].items()
+                           if check['severity'] == 'error' and check['count'])
+        super().__init__(f"Проверка графа техники не пройдена: {failed}")
+
+
+def _rank(value):
+    value = (value or '').strip()
+    if not value:
+        return None
+    return int(value) if value.isdigit() else roman_to_int(value) or None
+
+
+def resolve_parent(parent_id, ids):
+    """Родитель так же, как его ищет NodesMerger.extract_node_dependencies: id или id + '_group'."""
+    if parent_id in ids:
+        return parent_id
+    if parent_id + GROUP_SUFFIX in ids:
+        return parent_id + GROUP_SUFFIX
+    return None
+
+
+def _cycles(edges, remaining):
+    """
+    Циклы среди узлов, не упорядоченных сортировкой Кана. Сначала отбрасываются узлы,
+    которые только достижимы из циклов, затем обход по одному ребру внутрь remaining
+    из каждого непосещенного узла замыкается в цикл. Все за O(V+E).
+    """
+    outdegree = {node_id: sum(1 for t in edges[node_id] if t in remaining) for node_id in remaining}
+    reverse = {}
+    for node_id in remaining:
+        for target in edges[node_id]:
+            if target in remaining:
+                reverse.setdefault(target, []).append(node_id)
+    stack = [node_id for node_id, degree in outdegree.items() if degree == 0]
+    while stack:
+        node_id = stack.pop()
+        remaining.discard(node_id)
+        for source in reverse.get(node_id, ()):
+            outdegree[source] -= 1
+            if outdegree[source] == 0:
+                stack.append(source)
+
+    cycles = []
+    visited = set()
+    for start in sorted(remaining):
+        path, index = [], {}
+        node = start
+        while node not in visited:
+            visited.add(node)
+            index[node] = len(path)
+            path.append(node)
+            node = next(target for target in edges[node] if target in remaining)
+        if node in index:
+            cycles.append({'cycle': path[index[node]:] + [node]})
+    return cycles
+
+
+def validate_graph(merged_data, dependencies, known_nations, known_types, ignore=()):
+    """
+    Проверяет граф техники за O(V+E): один проход по узлам, один по ребрам и сортировка Кана.
+
+    Ребра графа - зависимости из dependencies.csv и ссылки parent_external_id (узел -> требуемый узел).
+
+    :param merged_data: Строки vehicles_merged.csv
+    :param dependencies: Строки dependencies.csv
+    :param known_nations: Допустимые имена наций (country_flags.csv)
+    :param known_types: Допустимые типы техники (разделы сбора)
+    :param ignore: Проверки, ошибки которых понижаются до предупреждений
+    :return: Отчет: {'ok', 'summary', 'checks': {проверка: {'severity', 'count', 'items'}}}
+    """
+    found = {name: [] for name in CHECKS}
+    nodes = {}
+
+    for index, node in enumerate(merged_data):
+        node_id = (node.get('data_ulist_id') or node.get('external_id') or '').strip()
+        if not node_id:
+            found['empty_ids'].append({'row': index + 2, 'name': node.get('name')})
+            continue
+        if node_id in nodes:
+            found['duplicate_ids'].append({'id': node_id, 'row': index + 2})
+            continue
+        nodes[node_id] = node
+        nation = (node.get('country') or '').strip().lower()
+        if nation not in known_nations:
+            found['unknown_nations'].append({'id': node_id, 'nation': nation})
+        vehicle_type = (node.get('vehicle_category') or '').strip()
+        if vehicle_type not in known_types:
+            found['unknown_vehicle_types'].append({'id': node_id, 'vehicle_type': vehicle_type})
+        if node.get('type') not in NODE_TYPES:
+            found['unknown_node_types'].append({'id': node_id, 'type': node.get('type')})
+
+    edges = {node_id: [] for node_id in nodes}
+    edge_set = set()
+
+    def add_edge(source, target):
+        if (source, target) not in edge_set:
+            edge_set.add((source, target))
+            edges[source].append(target)
+
+    children = {}
+    for node_id, node in nodes.items():
+        parent = (node.get('parent_external_id') or '').strip()
+        if not parent:
+            continue
+        resolved = resolve_parent(parent, nodes)
+        if resolved is None:
+            found['missing_parents'].append({'id': node_id, 'parent': parent})
+            continue
+        if resolved == node_id:
+            found['self_parents'].append({'id': node_id})
+            continue
+        children[resolved] = children.get(resolved, 0) + 1
+        add_edge(node_id, resolved)
+
+    dependency_pairs = set()
+    for row in dependencies:
+        source = (row.get('node_external_id') or '').strip()
+        target = (row.get('prerequisite_external_id') or '').strip()
+        if (source, target) in dependency_pairs:
+            found['duplicate_dependencies'].append({'node': source, 'prerequisite': target})
+            continue
+        dependency_pairs.add((source, target))
+        missing = [value for value in (source, target) if value not in nodes]
+        if missing:
+            found['dangling_dependencies'].append({'node': source, 'prerequisite': target, 'missing': missing})
+            continue
+        if source == target:
+            found['self_dependencies'].append({'id': source})
+            continue
+        add_edge(source, target)
+
+    for node_id, node in nodes.items():
+        if node.get('type') == 'folder' and not children.get(node_id):
+            found['empty_groups'].append({'id': node_id, 'name': node.get('name')})
+
+    # Ранг требуемого узла не выше ранга зависящего от него
+    ranks = {node_id: _rank(node.get('rank')) for node_id, node in nodes.items()}
+    for source, target in edge_set:
+        source_rank, target_rank = ranks[source], ranks[target]
+        if source_rank is not None and target_rank is not None and target_rank > source_rank:
+            found['rank_not_monotonic'].append({'node': source, 'rank': source_rank,
+                                                'prerequisite': target, 'prerequisite_rank': target_rank})
+
+    # Сортировка Кана: узлы, которые не удалось упорядочить, лежат на циклах или достижимы из них
+    indegree = {node_id: 0 for node_id in nodes}
+    for source, target in edge_set:
+        indegree[target] += 1
+    queue = deque(node_id for node_id, degree in indegree.items() if degree == 0)
+    ordered = 0
+    while queue:
+        node_id = queue.popleft()
+        ordered += 1
+        for target in edges[node_id]:
+            indegree[target] -= 1
+            if indegree[target] == 0:
+                queue.append(target)
+    if ordered < len(nodes):
+        found['cycles'] = _cycles(edges, {node_id for node_id, degree in indegree.items() if degree > 0})
+
+    checks = {name: {'severity': 'warning' if name in ignore else severity,
+                     'count': len(found[name]), 'items': found[name]}
+              for name, severity in CHECKS.items()}
+    errors = sum(c['count'] for c in checks.values() if c['severity'] == 'error')
+    warnings = sum(c['count'] for c in checks.values() if c['severity'] == 'warning')
+    return {
+        'ok': errors == 0,
+        'generated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'summary': {'nodes': len(nodes), 'edges': len(edge_set), 'errors': errors, 'warnings': warnings},
+        'checks': checks,
+    }
+
+
+def validate_files(merged_csv, deps_csv, country_csv, known_types, report_file=None, ignore=()):
+    """
+    Проверяет vehicles_merged.csv и dependencies.csv, печатает сводку и сохраняет отчет в JSON.
+
+    :raises GraphValidationError: Если найдены ошибки (отчет к этому моменту уже сохранен)
+    """
+    with open(merged_csv, encoding='utf-8') as f:
+        merged_data = list(csv.DictReader(f))
+    try:
+        with open(deps_csv, encoding='utf-8') as f:
+            dependencies = list(csv.DictReader(f))
+    except FileNotFoundError:
+        print(f"Файл {deps_csv} не найден, проверяются только ссылки на родителей")
+        dependencies = []
+    with open(country_csv, encoding='utf-8') as f:
+        known_nations = {row['country'].strip().lower() for row in csv.DictReader(f)}
+
+    report = validate_graph(merged_data, dependencies, known_nations, set(known_types), ignore)
+    report['inputs'] = {'merged_csv': merged_csv, 'deps_csv': deps_csv, 'country_csv': country_csv}
+    if report_file:
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+
+    summary = report['summary']
+    print(f"Проверка графа: {summary['nodes']} узлов, {summary['edges']} ребер, "
+          f"ошибок {summary['errors']}, предупреждений {summary['warnings']}"
+          + (f" (отчет: {report_file})" if report_file else ""))
+    for name, check in report['checks'].items():
+        if check['count']:
+            label = 'ОШИБКА' if check['severity'] == 'error' else 'предупреждение'
+            print(f"  {label}: {name} - {check['count']}, например: {check['items'][0]}")
+    if not report['ok']:
+        raise GraphValidationError(report)
+    return report
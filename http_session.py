@@ -0,0 +1,260 @@
+import json
+import os
+import threading
+import time
+import requests
+from http.cookiejar import Cookie
+from rate_limiter import RateLimitedAdapter, get_shared_limiter
+
+DEFAULT_USER_AGENT = "Mozilla/5.0"
+CHALLENGE_TITLE = "<title>human verification</title>"
+
+
+def _cookie_from_selenium(c):
+    """Преобразует cookie из формата WebDriver в http.cookiejar.Cookie."""
+    domain = c.get('domain') or ''
+    expiry = c.get('expiry')
+    return Cookie(
+        version=0, name=c['name'], value=c['value'],
+        port=None, port_specified=False,
+        domain=domain, domain_specified=domain.startswith('.'), domain_initial_dot=domain.startswith('.'),
+        path=c.get('path') or '/', path_specified=True,
+        secure=bool(c.get('secure')),
+        expires=int(expiry) if expiry is not None else None,
+        discard=expiry is None,
+        comment=None, comment_url=None,
+        rest={'HttpOnly': None} if c.get('httpOnly') else {},
+    )
+
+
+def _cookie_to_dict(cookie):
+    data = {
+        'name': cookie.name,
+        'value': cookie.value,
+        'domain': cookie.domain,
+        'path': cookie.path,
+        'secure': cookie.secure,
+        'httpOnly': cookie.has_nonstandard_attr('HttpOnly'),
+    }
+    if cookie.expires is not None:
+        data['expiry'] = cookie.expires
+    return data
+
+
+class SessionBridge:
+    """
+    Общая HTTP-сессия для загрузок без браузера (страницы техники, datamine).
+
+    Переносит cookies и User-Agent из WebDriver в пул соединений requests,
+    обновляет их при истечении или при встрече страницы Human Verification
+    и сохраняет между запусками в cookie_jar_file.
+
+    WebDriver не потокобезопасен: к драйверу сессия обращается только под driver_lock, который
+    шаги браузера держат на время каждой единицы работы (раздел или нация). Пока единица идет,
+    плановое обновление cookies пропускается, а проход Human Verification ждет ее окончания.
+    """
+
+    def __init__(self, cookie_file='session_cookies.json', max_age=1800, pool_size=16, limiter=None):
+        """
+        :param cookie_file: Файл для хранения cookies и User-Agent между запусками (None - не сохранять)
+        :param max_age: Через сколько секунд cookies перечитываются из браузера
+        :param pool_size: Размер пула соединений на хост
+        :param limiter: RateLimiter для всех запросов сессии (по умолчанию - общий)
+        """
+        self.cookie_file = cookie_file
+        self.max_age = max_age
+        self.session = requests.Session()
+        adapter = RateLimitedAdapter(limiter or get_shared_limiter(),
+                                     pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['User-Agent'] = DEFAULT_USER_AGENT
+        self.driver = None
+        self.helper = None
+        self.synced_at = 0
+        self.recorder = None
+        self.driver_lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        """Загружает сохраненные cookies и User-Agent."""
+        if not self.cookie_file or not os.path.exists(self.cookie_file):
+            return
+        try:
+            with open(self.cookie_file, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Предупреждение: Не удалось прочитать файл cookies '{self.cookie_file}': {e}")
+            return
+        if state.get('user_agent'):
+            self.session.headers['User-Agent'] = state['user_agent']
+        now = time.time()
+        loaded = 0
+        for c in state.get('cookies', []):
+            if c.get('expiry') is not None and c['expiry'] <= now:
+                continue
+            self.session.cookies.set_cookie(_cookie_from_selenium(c))
+            loaded += 1
+        self.synced_at = state.get('synced_at', 0)
+        print(f"Загружено {loaded} cookies из {self.cookie_file}")
+
+    def save(self):
+        if not self.cookie_file:
+            return
+        state = {
+            'user_agent': self.session.headers.get('User-Agent'),
+            'synced_at': self.synced_at,
+            'cookies': [_cookie_to_dict(c) for c in self.session.cookies],
+        }
+        try:
+            with open(self.cookie_file, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"Предупреждение: Не удалось сохранить cookies в '{self.cookie_file}': {e}")
+
+    def attach_driver(self, driver, helper=None):
+        """Привязывает браузер как источник cookies и сразу синхронизирует их."""
+        self.driver = driver
+        self.helper = helper
+        self.sync_from_driver()
+
+    def detach_driver(self):
+        self.driver = None
+        self.helper = None
+
+    def sync_from_driver(self, blocking=True):
+        """
+        Копирует cookies и User-Agent текущего браузера в HTTP-сессию.
+
+        :param blocking: Ждать, пока драйвер освободится; иначе при занятом драйвере вернуть False
+        """
+        if self.driver is None:
+            return False
+        if not self.driver_lock.acquire(blocking=blocking):
+            return False
+        try:
+            if self.driver is None:
+                return False
+            try:
+                cookies = self.driver.get_cookies()
+                user_agent = self.driver.execute_script("return navigator.userAgent;")
+            except Exception as e:
+                print(f"Предупреждение: Не удалось получить cookies из браузера: {e}")
+                return False
+            # Истекшие cookies удаляются: браузер их уже не отдает, а needs_refresh иначе срабатывал бы всегда
+            self.session.cookies.clear_expired_cookies()
+            now = time.time()
+            for c in cookies:
+                if c.get('expiry') is not None and c['expiry'] <= now:
+                    continue
+                self.session.cookies.set_cookie(_cookie_from_selenium(c))
+            if user_agent:
+                self.session.headers['User-Agent'] = user_agent
+            self.synced_at = time.time()
+            self.save()
+            print(f"Сессия синхронизирована с браузером: {len(cookies)} cookies")
+            return True
+        finally:
+            self.driver_lock.release()
+
+    def needs_refresh(self):
+        if self.driver is None:
+            return False
+        if time.time() - self.synced_at > self.max_age:
+            return True
+        now = time.time()
+        return any(c.expires is not None and c.expires <= now for c in self.session.cookies)
+
+    @staticmethod
+    def is_challenge(response):
+        """Похож ли ответ на страницу Human Verification."""
+        if response.status_code not in (200, 403, 429, 503):
+            return False
+        content_type = response.headers.get('Content-Type', '')
+        if 'html' not in content_type:
+            return False
+        return CHALLENGE_TITLE in response.text[:4096].lower()
+
+    def _pass_challenge_in_browser(self, url):
+        """
+        Открывает url в отдельной вкладке браузера, ждет прохождения проверки и забирает cookies.
+        Если пока ждали драйвер, cookies уже обновил другой поток, вкладка не открывается.
+        """
+        synced_at = self.synced_at
+        if not self.driver_lock.acquire(blocking=False):
+            print("Браузер занят единицей сбора, проверка будет пройдена после ее окончания.")
+            self.driver_lock.acquire()
+        try:
+            driver = self.driver
+            if driver is None:
+                raise RuntimeError("браузер уже закрыт")
+            if self.synced_at != synced_at:
+                return
+            original = driver.current_window_handle
+            try:
+                driver.switch_to.new_window('tab')
+                driver.get(url)
+                if self.helper:
+                    self.helper.wait_for_human_verification()
+                self.sync_from_driver()
+            finally:
+                try:
+                    driver.close()
+                finally:
+                    driver.switch_to.window(original)
+        finally:
+            self.driver_lock.release()
+
+    def request(self, method, url, **kwargs):
+        if self.needs_refresh():
+            # Драйвер занят шагом браузера - cookies обновятся при следующем запросе
+            self.sync_from_driver(blocking=False)
+        response = self.session.request(method, url, **kwargs)
+        if self.driver is not None and self.is_challenge(response):
+            print(f"Получена страница Human Verification для {url}, обновляю cookies через браузер.")
+            try:
+                self._pass_challenge_in_browser(url)
+            except Exception as e:
+                print(f"Предупреждение: Не удалось обновить cookies через браузер: {e}")
+                return response
+            response = self.session.request(method, url, **kwargs)
+        if self.recorder is not None:
+            self.recorder.add_response(method, url, response)
+        return response
+
+    def use_archive(self, archive):
+        """Переключает сессию на ответы из ScrapeArchive: без сети, браузера и записи cookies."""
+        from scrape_archive import ArchiveAdapter
+        adapter = ArchiveAdapter(archive)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.detach_driver()
+        self.cookie_file = None
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+
+_shared_session = None
+_shared_lock = threading.Lock()
+
+
+def configure_shared_session(config):
+    """Создает общую сессию по настройкам config.txt."""
+    global _shared_session
+    with _shared_lock:
+        _shared_session = SessionBridge(
+            cookie_file=config.get('cookie_jar_file', 'session_cookies.json') or None,
+            max_age=int(config.get('session_max_age', '1800')),
+            pool_size=int(config.get('http_pool_size', '16')),
+        )
+    return _shared_session
+
+
+def get_shared_session():
+    """Возвращает общую сессию (создается с настройками по умолчанию при первом обращении)."""
+    global _shared_session
+    with _shared_lock:
+        if _shared_session is None:
+            _shared_session = SessionBridge()
+        return _shared_session
@@ -0,0 +1,111 @@
+import csv
+import io
+from http_session import get_shared_session
+
+UNITS_LANG_URL = "https://cdn.jsdelivr.net/gh/gszabi99/War-Thunder-Datamine@master/lang.vromfs.bin_u/lang/units.csv"
+
+# Коды локалей -> столбцы units.csv датамайна ("<English>", "<German>", ...)
+LOCALE_COLUMNS = {
+    'en': 'English', 'fr': 'French', 'it': 'Italian', 'de': 'German', 'es': 'Spanish', 'ru': 'Russian',
+    'pl': 'Polish', 'cs': 'Czech', 'tr': 'Turkish', 'zh': 'Chinese', 'ja': 'Japanese', 'pt': 'Portuguese',
+    'uk': 'Ukrainian', 'sr': 'Serbian', 'hu': 'Hungarian', 'ko': 'Korean', 'be': 'Belarusian',
+    'ro': 'Romanian', 'zh-tw': 'TChinese', 'vi': 'Vietnamese',
+}
+# Ключи строк units.csv в порядке предпочтения: короткое имя дерева, полное имя, id как есть
+NAME_KEYS = ('{id}_shop', '{id}_0', '{id}', 'shop/group/{id}')
+
+
+def parse_locales(value):
+    """'en, de' -> ['en', 'de'] (без повторов, в нижнем регистре)."""
+    locales = []
+    for code in (value or '').split(','):
+        code = code.strip().lower()
+        if code and code not in locales:
+            locales.append(code)
+    return locales
+
+
+def fetch_units_lang(url=UNITS_LANG_URL):
+    """Скачивает units.csv локализации датамайна (один файл со всеми языками)."""
+    response = get_shared_session().get(url)
+    response.raise_for_status()
+    return response.content.decode('utf-8-sig', errors='replace')
+
+
+def parse_units_lang(text, ids, locales):
+    """
+    Имена техники из units.csv только для нужных id и языков.
+
+    :param ids: data_ulist_id узлов
+    :param locales: Коды языков (LOCALE_COLUMNS) или имена столбцов units.csv
+    :return: ({id: {локаль: имя}}, [локали, которых нет в файле])
+    """
+    reader = csv.reader(io.StringIO(text), delimiter=';', quotechar='"')
+    header = [name.strip().strip('<>').split('|')[0].lower() for name in next(reader, [])]
+    columns, missing = {}, []
+    for locale in locales:
+        column = LOCALE_COLUMNS.get(locale, locale).lower()
+        if column in header:
+            columns[locale] = header.index(column)
+        else:
+            missing.append(locale)
+
+    # Ключ строки -> id узла: строки файла читаются один раз, лишние сразу отбрасываются
+    wanted = {}
+    for node_id in ids:
+        for priority, template in enumerate(NAME_KEYS):
+            wanted.setdefault(template.format(id=node_id).lower(), []).append((node_id, priority))
+
+    found = {}
+    for row in reader:
+        if not row or row[0].lower() not in wanted:
+            continue
+        for node_id, priority in wanted[row[0].lower()]:
+            for locale, index in columns.items():
+                value = row[index].strip() if index < len(row) else ''
+                if not value:
+                    continue
+                best = found.setdefault(node_id, {}).get(locale)
+                if best is None or priority < best[0]:
+                    found[node_id][locale] = (priority, value)
+    names = {node_id: {locale: value for locale, (_, value) in by_locale.items()}
+             for node_id, by_locale in found.items()}
+    return names, missing
+
+
+def build_locale_overlay(merged_csv, output_csv, locales, url=UNITS_LANG_URL):
+    """
+    Сохраняет имена узлов vehicles_merged.csv на других языках в отдельную таблицу:
+    data_ulist_id, name (как на вики) и name_<локаль> для каждого языка.
+
+    :return: Число узлов, для которых найдено имя хотя бы на одном языке
+    """
+    with open(merged_csv, encoding='utf-8') as f:
+        nodes = [row for row in csv.DictReader(f) if row.get('data_ulist_id')]
+    ids = [node['data_ulist_id'] for node in nodes]
+    check_ru = 'ru' not in locales
+
+    print(f"Загрузка локализации имен ({', '.join(locales)}) для {len(ids)} узлов: {url}")
+    names, missing = parse_units_lang(fetch_units_lang(url), ids, locales + (['ru'] if check_ru else []))
+    if missing:
+        print(f"Предупреждение: В units.csv нет языков: {', '.join(missing)}")
+
+    fieldnames = ['data_ulist_id', 'name'] + [f"name_{locale}" for locale in locales]
+    found = 0
+    with open(output_csv, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for node in nodes:
+            localized = names.get(node['data_ulist_id'], {})
+            found += any(localized.get(locale) for locale in locales)
+            row = {'data_ulist_id': node['data_ulist_id'], 'name': node.get('name', '')}
+            row.update({f"name_{locale}": localized.get(locale, '') for locale in locales})
+            writer.writerow(row)
+
+    # Русские имена датамайна против имен вики - проверка, что ключи units.csv сопоставлены верно
+    compared = [(node.get('name', '').strip(), names.get(node['data_ulist_id'], {}).get('ru'))
+                for node in nodes if names.get(node['data_ulist_id'], {}).get('ru')]
+    agreement = sum(1 for wiki, datamine in compared if wiki == datamine) / len(compared) if compared else 0
+    print(f"Имена на других языках найдены для {found}/{len(nodes)} узлов, сохранены в {output_csv}; "
+          f"совпадение русских имен датамайна с вики: {agreement:.0%}")
+    return found
@@ -1,6 +1,7 @@
 import os
 import time
 import json
+import argparse
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.firefox.options import Options
@@ -8,11 +9,62 @@ from selenium.webdriver.firefox.service import Service
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException 
 from rank_requirements_extractor import run_rank_requirements_extraction
-from db_uploader import upload_all_data
+from db_uploader import upload_all_data, build_upload_payload, save_upload_payload, load_upload_payload
+from db_copy_loader import load_all_data
+from db_shadow_loader import load_all_data_shadow
 from page_helper import PageHelper
-from vehicle_get_required_exp import VehicleDataFetcher
 from node_merger import NodesMerger
-from data_utils import save_to_csv, save_dependencies_to_csv, get_all_nation_tree_data, save_country_flags_to_csv
+from request_filter import RequestFilter
+from navigator import Navigator, NavState
+from http_session import configure_shared_session, get_shared_session
+from rate_limiter import configure_shared_limiter
+from page_payload import configure_shared_capture, get_shared_capture
+from build_graph import BuildGraph, Stage
+from stage_scheduler import StageScheduler
+from webdriver_tracer import install_tracer
+from unit_card_parser import UNIT_CARD_FIELDNAMES, UNIT_CARD_NODE_FIELDS
+from graph_validator import validate_files
+from snapshot_store import snapshot_files
+from locale_overlay import build_locale_overlay, parse_locales, UNITS_LANG_URL
+from bundle_exporter import export_bundles, INDEX_FILE as BUNDLE_INDEX_FILE
+from upstream_probe import UpstreamProbe
+from playwright_backend import PlaywrightBrowserSession
+from work_queue import Coordinator, unit_spec, start_local_workers, stop_local_workers
+from asset_mirror import mirror_assets, load_asset_urls, MANIFEST_FILE as ASSET_MANIFEST_FILE
+from driver_supervisor import DriverSupervisor, DriverRecoveryError
+from snapshot_pipeline import SnapshotParser
+from scrape_archive import ScrapeArchive, ReplayBrowserSession, record_page, start_recording, stop_recording
+from data_utils import (save_to_csv, save_dependencies_to_csv, get_all_nation_tree_data, save_country_flags_to_csv,
+                        get_section_list_data, get_nation_tree_data, open_section, show_tree_view,
+                        load_from_csv, filter_tree_data, fetch_unit_cards, get_tree_data_pipelined)
+
+TARGET_SECTIONS = [
+    'Авиация',
+    'Вертолёты',
+    'Наземная техника',
+    'Большой флот',
+    'Малый флот'
+]
+
+LIST_CSV = "vehicles_list.csv"
+UNIT_CARDS_CSV = "unit_cards.csv"
+FLAGS_CSV = "country_flags.csv"
+TREE_RAW_CSV = "vehicles_tree_raw.csv"
+TREE_FILTERED_CSV = "vehicles_tree_filtered.csv"
+MERGED_CSV = "vehicles_merged.csv"
+DEPS_CSV = "dependencies.csv"
+RANK_CSV = "rank_requirements.csv"
+PAYLOAD_JSON = "upload_payload.json"
+VALIDATION_JSON = "validation_report.json"
+NAMES_CSV = "vehicle_names.csv"
+
+TREE_INT_FIELDS = ('column_index', 'row_index', 'order_in_folder')
+MERGED_FIELDNAMES = [
+    "data_ulist_id", "external_id", "link", "name", "country", "battle_rating",
+    "silver", "rank", "vehicle_category", "type", "required_exp", "tech_category",
+    "image_url", "parent_external_id", "column_index", "row_index", "order_in_folder"
+]
+MERGED_FIELDNAMES += [field for field in UNIT_CARD_NODE_FIELDS if field not in MERGED_FIELDNAMES]
 
 def read_config(config_path='config.txt'):
     """Читает конфигурационный файл."""
@@ -49,8 +101,12 @@ def load_override_rules(filepath="override_rules.json"):
         print(f"Непредвиденная ошибка при загрузке строгих правил из '{filepath}': {e}. Продолжение без строгих правил.")
         return {}
 
-def configure_driver(config):
-    """Настраивает и возвращает экземпляр WebDriver."""
+def configure_driver(config, request_filter=None):
+    """
+    Настраивает и возвращает экземпляр WebDriver.
+
+    :param request_filter: Запущенный RequestFilter (прокси, кэш и блокировки) или None
+    """
     options = Options()
     required = ['geckodriver_path', 'start_url']
     for param in required:
@@ -69,9 +125,12 @@ def configure_driver(config):
         print("Загрузка изображений отключена.")
 
     options.set_preference("dom.ipc.plugins.enabled.libflashplayer.so", False)
-    options.set_preference("browser.cache.disk.enable", False)
-    options.set_preference("browser.cache.memory.enable", False)
-    options.set_preference("network.http.use-cache", False)
+    if request_filter:
+        request_filter.apply_to_options(options)
+    else:
+        options.set_preference("browser.cache.disk.enable", False)
+        options.set_preference("browser.cache.memory.enable", False)
+        options.set_preference("network.http.use-cache", False)
 
     log_path = os.devnull if config.get('disable_logs', 'false').lower() == 'true' else "geckodriver.log"
     if log_path == os.devnull:
@@ -86,7 +145,6 @@ def configure_driver(config):
         print("Инициализация драйвера Firefox...")
         driver = webdriver.Firefox(service=service, options=options)
         print("Драйвер Firefox успешно инициализирован.")
-        return driver
     except Exception as e:
         print(f"КРИТИЧЕСКАЯ ОШИБКА инициализации драйвера Firefox: {e}")
         print(f"Проверьте путь к geckodriver: {config.get('geckodriver_path')}")
@@ -94,18 +152,35 @@ def configure_driver(config):
              print(f"Проверьте путь к бинарнику Firefox: {config.get('firefox_binary')}")
         raise
 
-def main():
-    driver = None
     try:
-        start_time = time.time()
-        print("Чтение конфигурационного файла...")
-        config = read_config()
-        print("Конфиг успешно загружен:")
-        for key, value in config.items():
-            print(f"  {key}: {value}")
-
-        driver = configure_driver(config)
-
+        install_tracer(driver, config)
+    except Exception as e:
+        print(f"Предупреждение: Трассировка команд WebDriver не включена: {e}")
+    return driver
+
+def upload_data(config, **kwargs):
+    """
+    Загружает данные в БД через бэкенд из config.txt (db_backend=postgrest|copy).
+    Для copy при upload_mode=shadow данные сначала грузятся в staging-таблицы и подменяются атомарно.
+    """
+    backend = config.get('db_backend', 'postgrest').lower()
+    if backend == 'copy' and config.get('upload_mode', 'direct').lower() == 'shadow':
+        load_all_data_shadow(config, **kwargs)
+    elif backend == 'copy':
+        load_all_data(config, **kwargs)
+    elif backend == 'postgrest':
+        upload_all_data(config, **kwargs)
+    else:
+        raise ValueError(f"Неизвестный db_backend в config.txt: {backend}")
+
+def start_browser_session(config, request_filter=None):
+    """
+    Запускает браузер, открывает стартовую страницу и дожидается меню навигации.
+
+    :return: Кортеж (driver, helper)
+    """
+    driver = configure_driver(config, request_filter)
+    try:
         helper = PageHelper(driver, wait_timeout=20)
         start_url = config['start_url']
         print(f"\nЗагрузка стартовой страницы: {start_url}")
@@ -116,238 +191,548 @@ def main():
         helper.wait_for_human_verification()
 
         if not helper.wait_for_container():
-            print("КРИТИЧЕСКАЯ ОШИБКА: Не удалось обнаружить контейнер с меню навигации, завершаем работу.")
+            raise RuntimeError("КРИТИЧЕСКАЯ ОШИБКА: Не удалось обнаружить контейнер с меню навигации, завершаем работу.")
+    except Exception:
+        driver.quit()
+        raise
+    return driver, helper
+
+class BrowserSession:
+    """
+    Браузер и связанные с ним объекты. Запускается при первом обращении шага, которому он нужен.
+    Работа с браузером идет единицами (раздел, вид, нация) под DriverSupervisor: при потере сессии
+    драйвер перезапускается, а единица выполняется заново.
+    """
+
+    def __init__(self, config, request_filter=None):
+        self.config = config
+        self.request_filter = request_filter
+        self.driver = None
+        self.helper = None
+        self.navigator = None
+        self.supervisor = DriverSupervisor.from_config(
+            config, lambda: start_browser_session(self.config, self.request_filter))
+        self.supervisor.on_restart = self._bind
+
+    def _bind(self, driver, helper):
+        self.driver, self.helper = driver, helper
+        get_shared_session().attach_driver(driver, helper)
+        self.navigator = Navigator.from_config(helper, self.config)
+
+    def start(self):
+        if self.driver is None:
+            self._bind(*self.supervisor.start())
+        return self
+
+    def run_unit(self, state, work):
+        """
+        Выполняет work() для состояния state с перезапуском драйвера при потере сессии.
+        На время единицы берется driver_lock общей HTTP-сессии: между единицами потоки загрузок
+        могут пройти Human Verification во вкладке браузера.
+        """
+        self.start()
+        with get_shared_session().driver_lock:
+            return self.supervisor.run(state, work)
+
+    def open_flags_page(self, section):
+        """Открывает раздел с кнопками стран (при записи архива - сохраняет его снимок)."""
+        self.start()
+        open_section(self.helper, section, settle=1)
+        record_page(self.driver, section, 'flags')
+
+    def collect_resource_stats(self):
+        if self.request_filter and self.driver:
+            with get_shared_session().driver_lock:
+                self.request_filter.collect_resource_stats(self.driver)
+
+    def close(self):
+        self.supervisor.report()
+        get_shared_capture().report()
+        if not self.driver:
             return
-
-        target_sections = [
-            'Авиация',
-            'Вертолёты',
-            'Наземная техника',
-            'Большой флот',
-            'Малый флот'
-        ]
-
-        ## 1. Сбор данных из List View
-        print("\nНачало сбора данных из List View ")
-        vehicles_data = []
-        for section in target_sections:
+        get_shared_session().detach_driver()
+        try:
+            self.driver.quit()
+            print("Браузер закрыт.")
+        except Exception as e:
+            print(f"Ошибка при закрытии браузера: {e}")
+        self.driver = None
+
+def run_list_stage(browser, target_sections):
+    """Сбор данных из List View."""
+    browser.start()
+    print("\nНачало сбора данных из List View ")
+    vehicles_data = []
+    for section in target_sections:
+        browser.collect_resource_stats()
+        vehicles_data.extend(browser.run_unit(
+            NavState(section, 'list'),
+            lambda: get_section_list_data(browser.helper, section, navigator=browser.navigator, fetch_exp=False,
+                                          strict=True)))
+
+    print(f"\nСбор данных из List View завершен. Всего записей: {len(vehicles_data)}")
+    save_to_csv(vehicles_data, filename=LIST_CSV)
+
+def collect_country_flags(browser, section):
+    print(f"Переход в раздел '{section}' для сбора информации о странах.")
+    browser.open_flags_page(section)
+    helper = browser.helper
+
+    country_button_container = helper.wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "div.unit-filter_country-buttons")))
+    print("Блок кнопок стран найден.")
+    time.sleep(0.5)
+
+    country_images = helper.get_country_buttons()
+    print(f"Собрано {len(country_images)} стран с флагами.")
+    return country_images
+
+def run_flags_stage(browser, target_sections):
+    """Сбор информации о странах."""
+    print("\nСбор информации о странах ")
+    country_images = {}
+    first_section = target_sections[0] if target_sections else 'Авиация'
+    try:
+        country_images = browser.run_unit(NavState(first_section, 'flags'),
+                                          lambda: collect_country_flags(browser, first_section))
+    except Exception as e:
+        print(f"Ошибка при сборе информации о странах в разделе '{first_section}': {e}")
+    save_country_flags_to_csv(country_images, filename=FLAGS_CSV)
+
+def get_section_tree_data_supervised(browser, section):
+    """
+    Tree View раздела через навигатор; каждая нация - отдельная единица работы сторожа драйвера.
+
+    :return: [(состояние нации, узлы или None, если нацию собрать не удалось)] в порядке вкладок
+    """
+    states = browser.run_unit(NavState(section, 'tree'), lambda: browser.navigator.tree_states(section))
+    per_nation = []
+    for state in states:
+        try:
+            nation_data = browser.run_unit(state, lambda: get_nation_tree_data(browser.navigator, state))
+        except DriverRecoveryError:
+            raise
+        except Exception as e:
+            print(f"Ошибка при извлечении дерева нации '{state.nation_label or state.nation}' в разделе '{section}': {e}")
+            nation_data = None
+        per_nation.append((state, nation_data))
+    return per_nation
+
+def collect_section_tree_by_clicks(browser, section, nations=None):
+    open_section(browser.helper, section)
+    show_tree_view(browser.helper)
+    return get_all_nation_tree_data(browser.helper, section, nations=nations, strict=True)
+
+def take_failed_tree_states(navigator, section):
+    """Забирает из failed_states навигатора нации раздела, которые не удалось собрать (без повторов)."""
+    failed = {}
+    for state in navigator.failed_states:
+        if state.section == section and state.view == 'tree' and state.nation:
+            failed.setdefault(state.nation, state)
+    navigator.failed_states = [state for state in navigator.failed_states if state.section != section]
+    return list(failed.values())
+
+def retry_failed_nations_by_clicks(browser, section, per_nation):
+    """
+    Повторяет по кликам нации, которые навигатор не собрал; узлы повтора встают на место нации.
+
+    :param per_nation: Результат get_section_tree_data_supervised
+    :return: (узлы раздела в порядке вкладок, состояния наций, которые не удалось собрать и так)
+    """
+    nodes, unrecovered = [], []
+    for state, nation_data in per_nation:
+        if nation_data is None:
+            nation_label = state.nation_label or state.nation
+            print(f"Навигатор не собрал нацию '{nation_label}' раздела '{section}', повтор по кликам.")
             try:
-                print(f"\nОбработка раздела (List View): {section}")
-                nav_item = helper.wait.until(
-                    EC.element_to_be_clickable(
-                        (By.XPATH, f"//a[contains(@class, 'layout-nav_item')]//span[normalize-space(text())='{section}']/..")
-                    )
-                )
-                nav_item.click()
-                print(f"Переход в раздел '{section}' выполнен.")
-                time.sleep(1.5) 
-
-                list_button = helper.wait_for_id('wt-show-list')
-                if list_button:
-                    try:
-                        driver.execute_script("arguments[0].scrollIntoView(true);", list_button)
-                        helper.wait.until(EC.element_to_be_clickable(list_button)).click()
-                    except Exception as e:
-                        print(f"Предупреждение: Обычный клик по кнопке List не сработал: {e}. Пробую JS click.")
-                        driver.execute_script("arguments[0].click();", list_button)
-                    print("Кнопка 'List' активирована.")
-
-                    rows = helper.get_vehicle_rows()
-                    total_rows = len(rows)
-                    print(f"Найдено строк техники: {total_rows}")
-                    processed_count = 0
-                    for idx, row in enumerate(rows, start=1):
-                        try:
-                            data = helper.parse_vehicle_row(row, section)
-                            if data is None:
-                                continue
-
-                            if data.get('silver') and str(data['silver']).isdigit() and int(data['silver']) > 0:
-                                try:
-                                     data = VehicleDataFetcher.fetch_required_exp(data)
-                                except Exception as fetch_exp:
-                                    print(f"Предупреждение: Не удалось получить required_exp для {data.get('name', data.get('data_ulist_id'))}: {fetch_exp}")
-
-                            if data.get('silver'):
-                                try:
-                                    silver_str = str(data['silver']).replace(',', '').replace(' ', '').strip()
-                                    if silver_str.isdigit():
-                                         data['silver'] = int(silver_str)
-                                    else:
-                                         data['silver'] = None
-                                except (ValueError, TypeError):
-                                     print(f"Предупреждение: Не удалось конвертировать 'silver' в число для {data.get('name')}: '{data.get('silver')}'")
-                                     data['silver'] = None
-
-                            vehicles_data.append(data)
-                            processed_count += 1
-                        except Exception as e:
-                            print(f"Ошибка при обработке строки {idx} в разделе '{section}' (List View): {e}")
-                    print(f"Успешно обработано строк в разделе '{section}': {processed_count}/{total_rows}")
-                else:
-                    print(f"Предупреждение: Не удалось найти кнопку 'List' для раздела {section}")
-
-            except TimeoutException as e:
-                 print(f"Ошибка (тайм-аут) при обработке раздела '{section}' (List View): {e}")
+                nation_data = browser.run_unit(state, lambda: collect_section_tree_by_clicks(browser, section,
+                                                                                            nations=[nation_label]))
+            except DriverRecoveryError:
+                raise
             except Exception as e:
-                print(f"Непредвиденная ошибка при обработке раздела '{section}' (List View): {e}")
+                print(f"Ошибка повтора нации '{nation_label}' раздела '{section}' по кликам: {e}")
+                nation_data = None
+            if not nation_data:
+                unrecovered.append(state)
+        nodes.extend(nation_data or [])
+    return nodes, unrecovered
+
+def run_tree_stage(browser, target_sections, parse_workers=0):
+    """
+    Сбор сырых данных из Tree View.
+
+    :param parse_workers: Если > 0 и есть навигатор, снимки страниц разбираются в пуле из стольких процессов
+    """
+    browser.start()
+    print("\n--- Начало сбора данных из Tree View ---")
+    pipelined = {}
+    if browser.navigator and parse_workers > 0:
+        print(f"Разбор снимков Tree View в {parse_workers} процессах параллельно с навигацией.")
+        try:
+            with SnapshotParser(workers=parse_workers) as parser:
+                pipelined = get_tree_data_pipelined(browser.navigator, target_sections, parser,
+                                                    driver_lock=get_shared_session().driver_lock)
+        except Exception as e:
+            print(f"Ошибка конвейерного сбора Tree View, продолжаю по разделам: {e}")
+        supervisor = getattr(browser, 'supervisor', None)
+        if supervisor and supervisor.dead:
+            # Снимки после потери сессии неполные - разделы собираются заново под сторожем
+            print("Сессия браузера потеряна во время конвейерного сбора, разделы будут собраны заново.")
+            pipelined = {}
+
+    tree_view_data_raw = []
+    unrecovered = []
+    dropped = []
+    for section in target_sections:
+        browser.collect_resource_stats()
+        try:
+            print(f"\nОбработка раздела (Tree View): {section}")
+            section_tree_data = pipelined.get(section, [])
+            if browser.navigator:
+                # Неудачи конвейерного прохода: раздел с потерянными нациями собирается заново по нациям,
+                # чтобы повторенные нации встали на свое место в порядке вкладок
+                if take_failed_tree_states(browser.navigator, section) and section_tree_data:
+                    print(f"Конвейерный сбор потерял нации раздела '{section}', раздел собирается по нациям.")
+                    section_tree_data = []
+            if browser.navigator and not section_tree_data:
+                per_nation = get_section_tree_data_supervised(browser, section)
+                take_failed_tree_states(browser.navigator, section)
+                if any(nation_data for _, nation_data in per_nation):
+                    # Раздел собран частично - недостающие нации добираются кликами, а не теряются
+                    section_tree_data, section_unrecovered = retry_failed_nations_by_clicks(browser, section, per_nation)
+                    unrecovered.extend(section_unrecovered)
+                else:
+                    print(f"Навигатор не собрал данные раздела '{section}', переход по кликам.")
+            if not section_tree_data:
+                section_tree_data = browser.run_unit(NavState(section, 'tree'),
+                                                     lambda: collect_section_tree_by_clicks(browser, section))
+            print(f"Собрано узлов из Tree View для раздела '{section}': {len(section_tree_data)}")
+            if not section_tree_data:
+                dropped.append(section)
+            tree_view_data_raw.extend(section_tree_data)
+
+        except DriverRecoveryError:
+            raise
+        except TimeoutException as e:
+             print(f"Ошибка (тайм-аут) при обработке раздела '{section}' (Tree View): {e}")
+             dropped.append(section)
+        except Exception as e:
+            print(f"Непредвиденная ошибка при обработке раздела '{section}' (Tree View): {e}")
+            dropped.append(section)
+
+    if browser.request_filter:
+        browser.collect_resource_stats()
+        browser.request_filter.report()
+
+    # Неполный Tree View не сохраняется: иначе следующие шаги и манифест upstream_probe приняли бы его за полный
+    if dropped or unrecovered:
+        raise RuntimeError("Tree View собран не полностью, не удалось собрать: "
+                           + ", ".join(dropped + [f"{state.section}/{state.nation_label or state.nation}"
+                                                  for state in unrecovered]))
+
+    print(f"\nСбор сырых данных из Tree View завершен. Всего узлов: {len(tree_view_data_raw)} ")
+    save_to_csv(tree_view_data_raw, filename=TREE_RAW_CSV)
+
+def run_unit_cards_stage(config):
+    """Загрузка карточек со страниц техники (только HTTP, параллельно с шагами браузера)."""
+    vehicles_data = load_from_csv(LIST_CSV)
+    cards = fetch_unit_cards(vehicles_data, max_workers=int(config.get('http_pool_size', '16')),
+                             researchable_only=config.get('unit_cards', 'all').lower() == 'researchable')
+    save_to_csv([card.as_row() for card in cards], filename=UNIT_CARDS_CSV, fieldnames=UNIT_CARD_FIELDNAMES)
+
+def run_list_stage_distributed(coordinator, target_sections):
+    """List View по разделам на работниках очереди (distributed=true)."""
+    done, _ = coordinator.run('list', [unit_spec('list', index, {'section': section}, [index])
+                                       for index, section in enumerate(target_sections)])
+    vehicles_data = [row for _, _, rows in done for row in rows]
+    print(f"\nСбор данных из List View завершен. Всего записей: {len(vehicles_data)}")
+    save_to_csv(vehicles_data, filename=LIST_CSV)
+
+def run_flags_stage_distributed(coordinator, target_sections):
+    first_section = target_sections[0] if target_sections else 'Авиация'
+    done, _ = coordinator.run('flags', [unit_spec('flags', 0, {'section': first_section}, [0])])
+    save_country_flags_to_csv(done[0][2] if done else {}, filename=FLAGS_CSV)
+
+def run_tree_stage_distributed(coordinator, target_sections):
+    """Tree View на работниках: единица раздела порождает единицы наций, узлы собираются в порядке (раздел, нация)."""
+    done, _ = coordinator.run('tree', [unit_spec('tree_section', index, {'section': section}, [index])
+                                       for index, section in enumerate(target_sections)])
+    tree_view_data_raw = [node for _, _, nodes in done for node in nodes]
+    print(f"\nСбор сырых данных из Tree View завершен. Всего узлов: {len(tree_view_data_raw)} ")
+    save_to_csv(tree_view_data_raw, filename=TREE_RAW_CSV)
+
+def run_unit_cards_stage_distributed(config, coordinator):
+    """Карточки техники пачками по distributed_card_batch страниц на единицу."""
+    vehicles_data = [data for data in load_from_csv(LIST_CSV) if data.get('link')]
+    size = max(1, int(config.get('distributed_card_batch', '50')))
+    researchable_only = config.get('unit_cards', 'all').lower() == 'researchable'
+    done, _ = coordinator.run('unit_cards', [
+        unit_spec('unit_cards', index, {'vehicles': vehicles_data[start:start + size],
+                                        'researchable_only': researchable_only}, [index])
+        for index, start in enumerate(range(0, len(vehicles_data), size))])
+    cards = [card for _, _, rows in done for card in rows]
+    print(f"Получено карточек: {len(cards)}")
+    save_to_csv(cards, filename=UNIT_CARDS_CSV, fieldnames=UNIT_CARD_FIELDNAMES)
+
+def distributed_enabled(config, browser):
+    """Сбор на работниках очереди: distributed=true и не воспроизведение архива."""
+    return config.get('distributed', 'false').lower() == 'true' and not isinstance(browser, ReplayBrowserSession)
+
+def run_filter_stage():
+    """Фильтрация данных из Tree View."""
+    print("\nФильтрация данных из Tree View ")
+    tree_view_data_raw = load_from_csv(TREE_RAW_CSV, int_fields=TREE_INT_FIELDS)
+    save_to_csv(filter_tree_data(tree_view_data_raw), filename=TREE_FILTERED_CSV)
+
+def run_merge_stage():
+    """Объединение данных List View и отфильтрованных Tree View."""
+    print("\nОбъединение данных List View и отфильтрованных Tree View ")
+    vehicles_data = load_from_csv(LIST_CSV)
+    unit_cards = load_from_csv(UNIT_CARDS_CSV) if os.path.exists(UNIT_CARDS_CSV) else []
+    unique_tree_data = load_from_csv(TREE_FILTERED_CSV, int_fields=TREE_INT_FIELDS)
+    merger = NodesMerger(vehicles_data, unique_tree_data, unit_cards)
+    merged_data = merger.merge_data()
+    print(f"Объединение завершено. Всего объединенных узлов: {len(merged_data)}")
+    save_to_csv(merged_data, filename=MERGED_CSV, fieldnames=MERGED_FIELDNAMES)
+
+def run_dependencies_stage():
+    """Извлечение зависимостей из объединенных данных."""
+    print("\nИзвлечение зависимостей")
+    merged_data = load_from_csv(MERGED_CSV, int_fields=TREE_INT_FIELDS)
+    dependencies = NodesMerger([], []).extract_node_dependencies(merged_data)
+    print(f"Извлечено зависимостей: {len(dependencies)}")
+
+    dep_fieldnames = ["node_external_id", "prerequisite_external_id"]
+    save_dependencies_to_csv(dependencies, filename=DEPS_CSV, fieldnames=dep_fieldnames)
+
+def run_rank_stage():
+    """Извлечение требований для открытия следующего ранга."""
+    try:
+        run_rank_requirements_extraction()
+        print("Сбор требований по рангам завершен.")
+    except Exception as e:
+         print(f"Ошибка при сборе требований по рангам: {e}")
+    if not os.path.exists(RANK_CSV):
+         try:
+             with open(RANK_CSV, 'w', newline='') as f:
+                 pass
+             print(f"Создан пустой файл '{RANK_CSV}'.")
+         except Exception as e:
+             print(f"Предупреждение: Не удалось создать пустой файл '{RANK_CSV}': {e}")
+
+def run_validate_stage(config, target_sections):
+    """Проверка целостности графа техники до загрузки в БД (при ошибках конвейер останавливается)."""
+    print("\nПроверка целостности графа техники")
+    ignore = [name.strip() for name in config.get('validation_ignore', '').split(',') if name.strip()]
+    validate_files(MERGED_CSV, DEPS_CSV, FLAGS_CSV, known_types=target_sections, report_file=VALIDATION_JSON,
+                   ignore=ignore)
+
+def run_snapshot_stage(config):
+    """Снимок проверенных данных в хранилище версий (только изменившиеся записи)."""
+    snapshot_files(config, files={'node': MERGED_CSV, 'dependency': DEPS_CSV, 'rank': RANK_CSV})
+
+def run_bundles_stage(config, target_sections):
+    """Статические бандлы дерева по (нация, тип техники) для калькулятора."""
+    export_bundles(MERGED_CSV, DEPS_CSV, RANK_CSV, config.get('bundle_dir', 'bundles'), target_sections,
+                   asset_urls=mirrored_asset_urls(config))
+
+def run_assets_stage(config):
+    """Локальное зеркало изображений техники и флагов (asset_mirror=true)."""
+    try:
+        mirror_assets(config, MERGED_CSV, FLAGS_CSV)
+    except Exception as e:
+        print(f"Ошибка при зеркалировании изображений: {e}")
 
-        print(f"\nСбор данных из List View завершен. Всего записей: {len(vehicles_data)}")
-        save_to_csv(vehicles_data, filename="vehicles_list.csv")
+def asset_mirror_enabled(config):
+    return config.get('asset_mirror', 'false').lower() == 'true'
 
-        # 1.1 Сбор информации о странах
-        print("\nСбор информации о странах ")
-        country_images = {}
-        if vehicles_data or target_sections:
-            first_section = target_sections[0] if target_sections else 'Авиация' 
-            try:
-                print(f"Переход в раздел '{first_section}' для сбора информации о странах.")
-                nav_item = helper.wait.until(
-                    EC.element_to_be_clickable(
-                        (By.XPATH, f"//a[contains(@class, 'layout-nav_item')]//span[normalize-space(text())='{first_section}']/..")
-                    )
-                )
-                nav_item.click()
-                time.sleep(1)
-
-                country_button_container = helper.wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "div.unit-filter_country-buttons")))
-                print("Блок кнопок стран найден.")
-                time.sleep(0.5)
-
-                country_images = helper.get_country_buttons()
-                print(f"Собрано {len(country_images)} стран с флагами.")
+def mirrored_asset_urls(config):
+    """Ссылки на зеркало для payload и бандлов; пусто, если зеркало выключено или asset_base_url не задан."""
+    if not asset_mirror_enabled(config):
+        return {}
+    return load_asset_urls(config.get('asset_dir', 'assets'), config.get('asset_base_url', ''))
+
+def run_locales_stage(config):
+    """Имена техники на других языках (locales) из локализации датамайна - без повторного сбора браузером."""
+    locales = parse_locales(config.get('locales', 'en'))
+    if not locales:
+        print("Языки не заданы (locales), шаг пропущен.")
+        return
+    try:
+        build_locale_overlay(MERGED_CSV, NAMES_CSV, locales, url=config.get('locale_units_url', UNITS_LANG_URL))
+    except Exception as e:
+        print(f"Ошибка при загрузке локализации имен: {e}")
+
+def run_payload_stage(config, target_sections):
+    """Подготовка данных для загрузки в БД (с применением строгих правил)."""
+    override_rules = load_override_rules(config.get('override_rules_file', 'override_rules.json'))
+    payload = build_upload_payload(target_sections, override_rules,
+                                   country_csv=FLAGS_CSV, merged_csv=MERGED_CSV,
+                                   deps_csv=DEPS_CSV, rank_csv=RANK_CSV,
+                                   asset_urls=mirrored_asset_urls(config))
+    save_upload_payload(payload, PAYLOAD_JSON)
+
+def run_upload_stage(config, target_sections):
+    """Вставка подготовленных данных в БД."""
+    print("Загрузка данных в БД...")
+    upload_data(config=config, target_sections=target_sections, payload=load_upload_payload(PAYLOAD_JSON))
+    print("Загрузка данных в БД успешно завершена.")
+
+def build_pipeline(config, browser, target_sections=TARGET_SECTIONS):
+    """
+    Описывает конвейер как граф шагов: входы, выходы и ключи config.txt каждого шага.
+    Шаги list, unit_cards, flags, tree, rank, locales и assets получают данные извне (source) и без --offline выполняются всегда.
+    При distributed=true шаги list, unit_cards, flags и tree выполняют работники очереди (scrape_worker.py).
+    Шаг assets есть в графе только при asset_mirror=true; тогда payload и bundles берут ссылки из его манифеста.
+    Шаги браузера (resource='browser') выполняются по одному, сетевые - параллельно с ними;
+    к драйверу сетевые шаги обращаются только между единицами работы браузера (BrowserSession.run_unit).
+    """
+    graph = BuildGraph(config, manifest_path=config.get('build_manifest', '.build_manifest.json'))
+    rules_file = config.get('override_rules_file', 'override_rules.json')
+    if distributed_enabled(config, browser):
+        # Браузеры - у работников, здесь шаги только ждут очередь и могут идти одновременно
+        coordinator = Coordinator.from_config(config)
+        graph.add(Stage('list', lambda: run_list_stage_distributed(coordinator, target_sections),
+                        outputs=[LIST_CSV], source=True))
+        graph.add(Stage('unit_cards', lambda: run_unit_cards_stage_distributed(config, coordinator),
+                        inputs=[LIST_CSV], outputs=[UNIT_CARDS_CSV], config_keys=['unit_cards'], source=True,
+                        optional_outputs=[UNIT_CARDS_CSV]))
+        graph.add(Stage('flags', lambda: run_flags_stage_distributed(coordinator, target_sections),
+                        outputs=[FLAGS_CSV], source=True))
+        graph.add(Stage('tree', lambda: run_tree_stage_distributed(coordinator, target_sections),
+                        outputs=[TREE_RAW_CSV], source=True))
+    else:
+        graph.add(Stage('list', lambda: run_list_stage(browser, target_sections),
+                        outputs=[LIST_CSV], source=True, resource='browser'))
+        graph.add(Stage('unit_cards', lambda: run_unit_cards_stage(config),
+                        inputs=[LIST_CSV], outputs=[UNIT_CARDS_CSV], config_keys=['unit_cards'], source=True,
+                        optional_outputs=[UNIT_CARDS_CSV]))
+        graph.add(Stage('flags', lambda: run_flags_stage(browser, target_sections),
+                        outputs=[FLAGS_CSV], source=True, resource='browser'))
+        parse_workers = int(config.get('tree_parse_workers', '0'))
+        graph.add(Stage('tree', lambda: run_tree_stage(browser, target_sections, parse_workers),
+                        outputs=[TREE_RAW_CSV], source=True, resource='browser'))
+    graph.add(Stage('filter', run_filter_stage,
+                    inputs=[TREE_RAW_CSV], outputs=[TREE_FILTERED_CSV]))
+    graph.add(Stage('merge', run_merge_stage,
+                    inputs=[LIST_CSV, UNIT_CARDS_CSV, TREE_FILTERED_CSV], outputs=[MERGED_CSV]))
+    graph.add(Stage('dependencies', run_dependencies_stage,
+                    inputs=[MERGED_CSV], outputs=[DEPS_CSV]))
+    graph.add(Stage('rank', run_rank_stage,
+                    outputs=[RANK_CSV], source=True))
+    graph.add(Stage('locales', lambda: run_locales_stage(config),
+                    inputs=[MERGED_CSV], outputs=[NAMES_CSV], config_keys=['locales', 'locale_units_url'],
+                    source=True, optional_outputs=[NAMES_CSV]))
+    asset_inputs = []
+    if asset_mirror_enabled(config):
+        asset_manifest = os.path.join(config.get('asset_dir', 'assets'), ASSET_MANIFEST_FILE)
+        graph.add(Stage('assets', lambda: run_assets_stage(config),
+                        inputs=[MERGED_CSV, FLAGS_CSV], outputs=[asset_manifest],
+                        config_keys=['asset_sprites', 'asset_sprite_max_px'], source=True,
+                        optional_outputs=[asset_manifest]))
+        asset_inputs = [asset_manifest]
+    graph.add(Stage('validate', lambda: run_validate_stage(config, target_sections),
+                    inputs=[MERGED_CSV, DEPS_CSV, FLAGS_CSV], outputs=[VALIDATION_JSON],
+                    config_keys=['validation_ignore']))
+    graph.add(Stage('snapshot', lambda: run_snapshot_stage(config),
+                    inputs=[MERGED_CSV, DEPS_CSV, RANK_CSV, VALIDATION_JSON],
+                    outputs=[config.get('snapshot_db', 'snapshots.sqlite')],
+                    config_keys=['snapshot_patch']))
+    graph.add(Stage('bundles', lambda: run_bundles_stage(config, target_sections),
+                    inputs=[MERGED_CSV, DEPS_CSV, RANK_CSV, VALIDATION_JSON] + asset_inputs,
+                    outputs=[os.path.join(config.get('bundle_dir', 'bundles'), BUNDLE_INDEX_FILE)],
+                    config_keys=['asset_mirror', 'asset_base_url']))
+    graph.add(Stage('payload', lambda: run_payload_stage(config, target_sections),
+                    inputs=[MERGED_CSV, DEPS_CSV, RANK_CSV, FLAGS_CSV, VALIDATION_JSON, rules_file] + asset_inputs,
+                    outputs=[PAYLOAD_JSON], config_keys=['override_rules_file', 'asset_mirror', 'asset_base_url']))
+    graph.add(Stage('upload', lambda: run_upload_stage(config, target_sections),
+                    inputs=[PAYLOAD_JSON],
+                    config_keys=['db_backend', 'upload_mode', 'base_url', 'pg_dsn', 'shadow_min_ratio']))
+    return graph
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Сбор данных War Thunder Wiki и загрузка в БД.")
+    parser.add_argument('targets', nargs='*',
+                        help="Целевые шаги (list, unit_cards, flags, tree, filter, merge, dependencies, rank, locales, "
+                             "assets, validate, snapshot, bundles, payload, upload); "
+                             "по умолчанию - все. Нужные им шаги добавляются автоматически.")
+    parser.add_argument('--force', action='store_true',
+                        help="Выполнить шаги, даже если они актуальны и источники не изменились (upstream_probe)")
+    parser.add_argument('--offline', action='store_true',
+                        help="Не запускать браузер и сетевые шаги, использовать их готовые CSV")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Сколько шагов выполнять одновременно (по умолчанию pipeline_workers из config.txt или 4)")
+    parser.add_argument('--config', default='config.txt', help="Путь к конфигурационному файлу")
+    parser.add_argument('--record', metavar='ARCHIVE',
+                        help="Записать снимки страниц и HTTP-ответы в zip-архив для последующего --replay")
+    parser.add_argument('--replay', metavar='ARCHIVE',
+                        help="Выполнить шаги сбора по архиву --record без браузера и сети "
+                             "(по умолчанию - до шага dependencies)")
+    args = parser.parse_args(argv)
+    if args.replay and (args.record or args.offline):
+        parser.error("--replay нельзя сочетать с --record и --offline")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    browser = None
+    request_filter = None
+    archive = None
+    local_workers = []
+    try:
+        start_time = time.time()
+        print("Чтение конфигурационного файла...")
+        config = read_config(args.config)
+        print("Конфиг успешно загружен:")
+        for key, value in config.items():
+            print(f"  {key}: {value}")
 
-            except Exception as e:
-                print(f"Ошибка при сборе информации о странах в разделе '{first_section}': {e}")
+        rate_limiter = configure_shared_limiter(config)
+        http_session = configure_shared_session(config)
+        configure_shared_capture(config)
+        targets = args.targets or None
+        probe = None
+        if (config.get('upstream_probe', 'false').lower() == 'true' and not targets
+                and not args.offline and not args.replay):
+            probe = UpstreamProbe.from_config(config)
+            if args.force:
+                probe.probe()
+            elif probe.unchanged():
+                print(f"\nЗапуск не требуется (--force - выполнить все равно), "
+                      f"проверка заняла {time.time() - start_time:.2f} сек.")
+                return
+        target_sections = TARGET_SECTIONS
+        if args.replay:
+            archive = ScrapeArchive(args.replay)
+            http_session.use_archive(archive)
+            browser = ReplayBrowserSession(archive)
+            targets = targets or ['dependencies']
+            target_sections = [section for section in TARGET_SECTIONS if archive.find_pages(section)]
+            print(f"Разделы в архиве: {', '.join(target_sections) or 'нет'}")
         else:
-             print("Нет данных List View и нет разделов, информация о странах не собиралась.")
-        save_country_flags_to_csv(country_images, filename="country_flags.csv")
-
-        ## 2. Сбор данных из Tree View
-        print("\n--- Начало сбора данных из Tree View ---")
-        tree_view_data_raw = []
-        for section in target_sections:
-            try:
-                print(f"\nОбработка раздела (Tree View): {section}")
-                nav_item = helper.wait.until(
-                    EC.element_to_be_clickable(
-                        (By.XPATH, f"//a[contains(@class, 'layout-nav_item')]//span[normalize-space(text())='{section}']/..")
-                    )
-                )
-                nav_item.click()
-                print(f"Переход в раздел '{section}' выполнен.")
-                time.sleep(1.5)
-
-                tree_button = helper.wait.until(EC.presence_of_element_located((By.ID, "wt-show-tree")))
-                try:
-                     driver.execute_script("arguments[0].scrollIntoView(true);", tree_button)
-                     time.sleep(0.5)
-                     helper.wait.until(EC.element_to_be_clickable(tree_button)).click()
-                except Exception as e:
-                    print(f"Предупреждение: Обычный клик по кнопке Tree не сработал: {e}. Пробую JS click.")
-                    driver.execute_script("arguments[0].click();", tree_button)
-                print("Кнопка 'Tree' активирована.")
-                time.sleep(2.5)
-
-                section_tree_data = get_all_nation_tree_data(helper, section)
-                print(f"Собрано узлов из Tree View для раздела '{section}': {len(section_tree_data)}")
-                tree_view_data_raw.extend(section_tree_data)
-
-            except TimeoutException as e:
-                 print(f"Ошибка (тайм-аут) при обработке раздела '{section}' (Tree View): {e}")
-            except Exception as e:
-                print(f"Непредвиденная ошибка при обработке раздела '{section}' (Tree View): {e}")
-
-        print(f"\nСбор сырых данных из Tree View завершен. Всего узлов: {len(tree_view_data_raw)} ")
-        save_to_csv(tree_view_data_raw, filename="vehicles_tree_raw.csv")
-
-        ## 2.1 Фильтрация данных из Tree View
-        print("\nФильтрация данных из Tree View ")
-        time.sleep(20)
-        # Шаг 1: Фильтруем ПАПКИ без имени
-        filtered_tree_data_step1 = []
-        folders_without_name_count = 0
-        for node in tree_view_data_raw:
-            if node.get('type') == 'folder' and not node.get('name'):
-                folders_without_name_count += 1
-                continue
-            filtered_tree_data_step1.append(node)
-        print(f"Узлов после фильтрации папок без имени: {len(filtered_tree_data_step1)} (удалено папок без имени: {folders_without_name_count})")
-
-        # Шаг 2: Фильтруем ВСЕ узлы по уникальности ID
-        unique_tree_data = []
-        seen_ids = set()
-        duplicates_count = 0
-        nodes_without_id_count = 0
-        for node in filtered_tree_data_step1:
-            node_id = node.get('data_ulist_id') or node.get('external_id')
-
-            if node_id:
-                if node_id not in seen_ids:
-                    unique_tree_data.append(node)
-                    seen_ids.add(node_id)
-                else:
-                    duplicates_count += 1
+            request_filter = RequestFilter.from_config(config)
+            if request_filter:
+                request_filter.start()
+            if args.record:
+                archive = start_recording(args.record)
+                http_session.recorder = archive
+            if config.get('browser_backend', 'selenium').strip().lower() == 'playwright':
+                browser = PlaywrightBrowserSession(config, target_sections, request_filter)
             else:
-                 nodes_without_id_count += 1
-
-        print(f"Узлов после фильтрации по уникальности ID: {len(unique_tree_data)} (удалено дубликатов: {duplicates_count}, узлов без ID: {nodes_without_id_count})")
-
-        save_to_csv(unique_tree_data, filename="vehicles_tree_filtered.csv")
-        override_rules = load_override_rules(config.get('override_rules_file', 'override_rules.json'))
-    
-        ## 3. Объединение данных и формирование зависимостей
-        print("\nОбъединение данных List View и отфильтрованных Tree View ")
-        merger = NodesMerger(vehicles_data, unique_tree_data)
-        merged_data = merger.merge_data()
-        print(f"Объединение завершено. Всего объединенных узлов: {len(merged_data)}")
-
-        merged_fieldnames = [
-            "data_ulist_id", "external_id", "link", "name", "country", "battle_rating",
-            "silver", "rank", "vehicle_category", "type", "required_exp", "tech_category",
-            "image_url", "parent_external_id", "column_index", "row_index", "order_in_folder"
-        ]
-        save_to_csv(merged_data, filename="vehicles_merged.csv", fieldnames=merged_fieldnames)
-
-        print("\nИзвлечение зависимостей")
-        dependencies = merger.extract_node_dependencies(merged_data)
-        print(f"Извлечено зависимостей: {len(dependencies)}")
-
-        dep_fieldnames = ["node_external_id", "prerequisite_external_id"]
-        save_dependencies_to_csv(dependencies, filename="dependencies.csv", fieldnames=dep_fieldnames)
-
-        ## 4. Извлечение требований для открытия следующего ранга
-        try:
-            run_rank_requirements_extraction()
-            print("Сбор требований по рангам завершен.")
-        except Exception as e:
-             print(f"Ошибка при сборе требований по рангам: {e}")
-        rank_req_file = "rank_requirements.csv"
-        if not os.path.exists(rank_req_file):
-             try:
-                 with open(rank_req_file, 'w', newline='') as f:
-                     pass
-                 print(f"Создан пустой файл '{rank_req_file}'.")
-             except Exception as e:
-                 print(f"Предупреждение: Не удалось создать пустой файл '{rank_req_file}': {e}")
-
-        ## 5. Вставка извлеченных данных в БД
-        #print("Загрузка данных в БД...")
-        #try:
-        #    upload_all_data(
-        #        config=config,
-        #        target_sections=target_sections,
-        #        country_csv="country_flags.csv",
-        #        merged_csv="vehicles_merged.csv",
-        #        deps_csv="dependencies.csv",
-        #        rank_csv=rank_req_file
-        #    )
-        #    print("Загрузка данных в БД успешно завершена.")
-        #except NameError:
-        #     print("Предупреждение: Функция upload_all_data не найдена. Пропуск шага.")
-        #except Exception as e:
-        #    print(f"Ошибка при загрузке данных в БД: {e}")
-
+                browser = BrowserSession(config, request_filter)
+
+        graph = build_pipeline(config, browser, target_sections)
+        if distributed_enabled(config, browser):
+            local_workers = start_local_workers(int(config.get('distributed_local_workers', '0')), args.config)
+        workers = args.workers or int(config.get('pipeline_workers', '4'))
+        scheduler = StageScheduler(graph, max_workers=workers)
+        results = scheduler.run(targets=targets, force=args.force, offline=args.offline)
+        skipped = [name for name, status in results.items() if status == 'skipped']
+        if skipped:
+            print(f"\nПропущены актуальные шаги: {', '.join(skipped)}")
+
+        if probe:
+            probe.save()
+        rate_limiter.report()
 
         end_time = time.time()
         elapse_time = end_time - start_time
@@ -359,32 +744,17 @@ def main():
         print("Traceback:")
         print(traceback.format_exc())
     finally:
-        if driver:
-            try:
-                driver.quit()
-                print("Браузер закрыт.")
-            except Exception as e:
-                print(f"Ошибка при закрытии браузера: {e}")
+        stop_local_workers(local_workers)
+        if browser:
+            browser.close()
+        if request_filter:
+            request_filter.stop()
+        if archive:
+            get_shared_session().recorder = None
+            if args.record:
+                stop_recording()
+            else:
+                archive.close()
 
 if __name__ == "__main__":
-    #main()
-    config = read_config()
-
-    override_rules = load_override_rules()
-
-    target_sections = [
-        'Авиация', 
-        'Вертолёты', 
-        'Наземная техника',
-        'Большой флот', 
-        'Малый флот'
-    ]
-    upload_all_data(
-        config=config,
-        target_sections=target_sections,
-        override_rules_data=override_rules,
-        country_csv="country_flags.csv",
-        merged_csv="vehicles_merged.csv",
-        deps_csv="dependencies.csv",
-        rank_csv="rank_requirements.csv"
-    )
+    main()
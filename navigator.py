@@ -0,0 +1,240 @@
+import re
+from urllib.parse import urljoin
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+VIEW_CODES = {'tree': 't', 'list': 'l'}
+DEFAULT_URL_TEMPLATE = "{section_url}?v={view_code}&t_c={nation}"
+
+# Ссылки разделов из навигационного меню: [{text, href}]
+SECTION_LINKS_SCRIPT = """
+return Array.from(document.querySelectorAll('a.layout-nav_item')).map(a => {
+    const span = a.querySelector('span');
+    return {text: (span ? span.textContent : a.textContent).trim(), href: a.href};
+});
+"""
+
+# Вкладки наций Tree View: ключ берется из data-атрибутов или из onclick
+NATION_TABS_SCRIPT = """
+return Array.from(document.querySelectorAll('div.navtabs_wrapper div.navtabs_item')).map((tab, i) => {
+    const label = tab.querySelector('div.navtabs_item-label');
+    const onclick = tab.getAttribute('onclick') || '';
+    const quoted = onclick.match(/['"]([^'"]+)['"]/);
+    const key = tab.dataset.country || tab.dataset.value || tab.dataset.tab || (quoted ? quoted[1] : '');
+    return {
+        index: i,
+        key: key,
+        label: label ? label.textContent.trim() : '',
+        active: /active|selected|current/.test(tab.className)
+    };
+});
+"""
+
+# Активирует вкладку нации собственным обработчиком вики, без прокрутки и клика мышью
+ACTIVATE_TAB_SCRIPT = """
+const tabs = document.querySelectorAll('div.navtabs_wrapper div.navtabs_item');
+const tab = tabs[arguments[0]];
+if (!tab) return false;
+tab.dispatchEvent(new MouseEvent('click', {bubbles: true, cancelable: true}));
+return true;
+"""
+
+# Состояние страницы для проверки: текущий вид, активная вкладка и первый узел дерева
+PAGE_STATE_SCRIPT = """
+const tree = document.querySelectorAll('div.wt-tree_item').length;
+const rows = document.querySelectorAll('tr.wt-ulist_unit').length;
+const active = Array.from(document.querySelectorAll('div.navtabs_wrapper div.navtabs_item'))
+    .filter(t => /active|selected|current/.test(t.className))
+    .map(t => t.outerHTML.slice(0, 400) + ' ' + t.textContent.trim());
+const first = document.querySelector('div.wt-tree_item');
+return {
+    tree_items: tree,
+    list_rows: rows,
+    active_tabs: active,
+    first_node: first ? (first.getAttribute('data-unit-id') || first.getAttribute('data-ulist-id') || '') : ''
+};
+"""
+
+
+class NavState:
+    """Состояние страницы вики: раздел, вид (tree/list) и нация (для tree)."""
+
+    def __init__(self, section, view, nation=None, nation_label=None):
+        self.section = section
+        self.view = view
+        self.nation = nation
+        self.nation_label = nation_label
+
+    def __repr__(self):
+        return f"NavState({self.section!r}, {self.view!r}, {self.nation!r})"
+
+
+class Navigator:
+    """
+    Переход к нужному состоянию (раздел, вид, нация) напрямую, без цепочки кликов.
+
+    Сначала открывается прямая ссылка по шаблону nav_url_template; если проверка
+    состояния не проходит, вкладка нации активируется собственным обработчиком
+    вики через JS. Используется вместо кликов по меню и вкладкам в main().
+    """
+
+    def __init__(self, helper, url_template=None, timeout=None):
+        """
+        :param helper: Экземпляр PageHelper
+        :param url_template: Шаблон прямой ссылки ({section_url}, {view}, {view_code}, {nation})
+        :param timeout: Время ожидания проверки состояния (по умолчанию - как у helper)
+        """
+        self.helper = helper
+        self.driver = helper.driver
+        self.url_template = url_template or DEFAULT_URL_TEMPLATE
+        self.timeout = timeout or helper.wait_timeout
+        self.section_urls = {}
+        self.failed_states = []
+        self.nation_urls_work = True
+        self._first_nodes = {}
+        self._current_section = None
+
+    @classmethod
+    def from_config(cls, helper, config):
+        """Создает навигатор по config.txt или возвращает None при navigation_mode=click."""
+        if config.get('navigation_mode', 'deep_link').lower() != 'deep_link':
+            return None
+        return cls(helper, url_template=config.get('nav_url_template') or None)
+
+    def discover_sections(self):
+        """Считывает адреса разделов из навигационного меню."""
+        links = self.driver.execute_script(SECTION_LINKS_SCRIPT) or []
+        self.section_urls = {link['text']: link['href'] for link in links if link.get('text') and link.get('href')}
+        print(f"Навигатор: найдено ссылок разделов: {len(self.section_urls)}")
+        return self.section_urls
+
+    def section_url(self, section):
+        if not self.section_urls:
+            self.discover_sections()
+        href = self.section_urls.get(section)
+        if not href:
+            raise ValueError(f"Навигатор: нет ссылки для раздела '{section}'")
+        return urljoin(self.driver.current_url, href).split('?')[0].split('#')[0]
+
+    def build_url(self, state):
+        return self.url_template.format(
+            section_url=self.section_url(state.section),
+            view=state.view,
+            view_code=VIEW_CODES.get(state.view, state.view),
+            nation=state.nation or '',
+        )
+
+    def nation_tabs(self):
+        """Вкладки наций текущего раздела в Tree View: [{index, key, label, active}]."""
+        try:
+            return self.driver.execute_script(NATION_TABS_SCRIPT) or []
+        except WebDriverException as e:
+            print(f"Навигатор: не удалось прочитать вкладки наций: {e}")
+            return []
+
+    def _page_state(self):
+        try:
+            return self.driver.execute_script(PAGE_STATE_SCRIPT) or {}
+        except WebDriverException:
+            return {}
+
+    def _matches(self, state, page):
+        if state.view == 'tree' and not page.get('tree_items'):
+            return False
+        if state.view == 'list' and not page.get('list_rows'):
+            return False
+        if state.view != 'tree' or not state.nation:
+            return True
+
+        active = page.get('active_tabs') or []
+        if active:
+            wanted = [state.nation.lower()] + ([state.nation_label.lower()] if state.nation_label else [])
+            text = ' '.join(active).lower()
+            return any(re.search(r"(?<![a-zа-яё0-9])" + re.escape(w) + r"(?![a-zа-яё0-9])", text) for w in wanted)
+
+        # Активную вкладку определить нельзя: дерево другой нации того же раздела
+        # не должно совпадать с уже виденным (иначе параметр нации проигнорирован)
+        owner = self._first_nodes.get((state.section, page.get('first_node')))
+        return owner is None or owner == state.nation
+
+    def verify(self, state):
+        """Ждет, пока страница придет в нужное состояние. Возвращает True/False."""
+        try:
+            WebDriverWait(self.driver, self.timeout, poll_frequency=0.25).until(
+                lambda d: self._matches(state, self._page_state())
+            )
+        except TimeoutException:
+            return False
+        if state.view == 'tree' and state.nation:
+            self._first_nodes[(state.section, self._page_state().get('first_node'))] = state.nation
+        return True
+
+    def _activate_tab(self, state):
+        for tab in self.nation_tabs():
+            if tab.get('key') == state.nation or (state.nation_label and tab.get('label') == state.nation_label):
+                return bool(self.driver.execute_script(ACTIVATE_TAB_SCRIPT, tab['index']))
+        return False
+
+    def goto(self, state):
+        """Переходит в состояние state и проверяет его. Возвращает True/False."""
+        try:
+            by_tab = state.view == 'tree' and state.nation and not self.nation_urls_work
+            if by_tab and self._current_section == state.section:
+                # Прямые ссылки на нации не работают - раздел уже открыт, переключаем вкладку
+                if self._activate_tab(state) and self.verify(state):
+                    return True
+            else:
+                url = self.build_url(state)
+                self.driver.get(url)
+                self.helper.wait_for_human_verification()
+                self._current_section = state.section
+                if self.verify(state):
+                    return True
+
+                if state.view == 'tree' and state.nation:
+                    print(f"Навигатор: ссылка {url} не привела к {state}, активирую вкладку через JS.")
+                    if self._activate_tab(state) and self.verify(state):
+                        self.nation_urls_work = False
+                        return True
+        except (WebDriverException, ValueError) as e:
+            print(f"Навигатор: ошибка перехода к {state}: {e}")
+
+        print(f"Навигатор: не удалось перейти к {state}")
+        self.failed_states.append(state)
+        return False
+
+    def tree_states(self, section):
+        """Список состояний Tree View для всех наций раздела."""
+        base = NavState(section, 'tree')
+        if not self.goto(base):
+            return []
+        tabs = self.nation_tabs()
+        states = []
+        for tab in tabs:
+            key = tab.get('key') or tab.get('label')
+            if key:
+                states.append(NavState(section, 'tree', key, tab.get('label')))
+        return states
+
+    def iter_states(self, sections, views=('tree',), nations=None):
+        """
+        Перебирает все состояния (раздел, вид, нация), переходя в каждое напрямую.
+        Отдает только проверенные состояния; неудачные попадают в failed_states.
+
+        :param nations: Необязательный фильтр по ключам или подписям наций
+        """
+        wanted = {n.lower() for n in nations} if nations else None
+        for section in sections:
+            for view in views:
+                if view != 'tree':
+                    state = NavState(section, view)
+                    if self.goto(state):
+                        yield state
+                    continue
+
+                for state in self.tree_states(section):
+                    if wanted is not None and state.nation.lower() not in wanted \
+                            and (state.nation_label or '').lower() not in wanted:
+                        continue
+                    if self.goto(state):
+                        yield state
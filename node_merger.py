@@ -1,13 +1,19 @@
+from unit_card_parser import UnitCard, UNIT_CARD_NODE_FIELDS
+
+
 class NodesMerger:
     """
-    Объединяет данные узлов из List View и Tree View.
+    Объединяет данные узлов из List View и Tree View (и карточек страниц техники).
     """
-    def __init__(self, list_view_data, tree_view_data):
+    def __init__(self, list_view_data, tree_view_data, unit_cards=None):
         """
         Инициализирует NodesMerger.
+
+        :param unit_cards: Необязательные карточки техники (UnitCard или строки unit_cards.csv)
         """
         self.list_view_data = list_view_data if list_view_data is not None else []
         self.tree_view_data = tree_view_data if tree_view_data is not None else []
+        self.unit_cards = [card.as_row() if isinstance(card, UnitCard) else card for card in (unit_cards or [])]
         print(f"Инициализация NodesMerger с {len(self.list_view_data)} элементами List View, "
               f"{len(self.tree_view_data)} элементами Tree View ")
         print(f"Инициализация NodesMerger с {len(self.list_view_data)} элементами List View и {len(self.tree_view_data)} элементами Tree View.")
@@ -85,6 +91,20 @@ class NodesMerger:
         print(f"Обновлено из Tree View: {updated_count}")
         print(f"Добавлено из Tree View: {added_count} (пропущено без ID: {skipped_tree_view_no_id})")
 
+        # 2.1. Поля карточек страниц техники (непустые значения карточки приоритетнее List View)
+        cards_applied = 0
+        for card in self.unit_cards:
+            node = merged_dict_by_id.get(card.get('data_ulist_id'))
+            if node is None:
+                continue
+            for field in UNIT_CARD_NODE_FIELDS:
+                value = card.get(field)
+                if value not in (None, ''):
+                    node[field] = value
+            cards_applied += 1
+        if self.unit_cards:
+            print(f"Применено карточек техники: {cards_applied}/{len(self.unit_cards)}")
+
         # 3. Преобразование в список
         merged_data = list(merged_dict_by_id.values())
         print(f"Всего узлов перед обработкой папок: {len(merged_data)}")
@@ -180,7 +200,7 @@ class NodesMerger:
             node_id = self._get_definitive_id(item)
             parent_ext_id = item.get('parent_external_id')
 
-            if node_id and parent_ext_id:
+            if node_id and parent_ext_id and parent_ext_id != node_id:
                 if parent_ext_id in nodes_by_definitive_id:
                     dependencies.append({
                         'node_external_id': node_id,
@@ -114,53 +114,67 @@ class PageHelper:
         return countries    
 
     def parse_vehicle_row(self, row: WebElement, category: str) -> Optional[dict]:
-        data = {}
-        data['data_ulist_id'] = row.get_attribute("data-ulist-id") or ""
+        fields = {'data_ulist_id': row.get_attribute("data-ulist-id") or ""}
         try:
             link_el = row.find_element(By.CSS_SELECTOR, '.wt-ulist_unit-name a')
-            data['link'] = link_el.get_attribute('href')
+            fields['link'] = link_el.get_attribute('href')
         except:
-            data['link'] = ''
+            fields['link'] = ''
         try:
-            data['name'] = row.find_element(By.CSS_SELECTOR, '.wt-ulist_unit-name a span').text.strip()
+            fields['name'] = row.find_element(By.CSS_SELECTOR, '.wt-ulist_unit-name a span').text.strip()
         except:
-            data['name'] = ''
+            fields['name'] = ''
         try:
             country_el = row.find_element(By.CSS_SELECTOR, 'td.wt-ulist_unit-country')
-            data['country'] = country_el.get_attribute('data-value')
+            fields['country'] = country_el.get_attribute('data-value')
         except:
-            data['country'] = ''
+            fields['country'] = ''
         try:
-            data['battle_rating'] = row.find_element(By.CSS_SELECTOR, 'td.br').text.strip()
+            fields['battle_rating'] = row.find_element(By.CSS_SELECTOR, 'td.br').text.strip()
         except:
-            data['battle_rating'] = ''
-        
+            fields['battle_rating'] = ''
         cells = row.find_elements(By.TAG_NAME, 'td')
-        if len(cells) >= 6:
-            raw = cells[5].text.strip().lower()
-            if raw == "бесплатно":
-                silver = "0"
-            elif raw == "—" or raw == "":
-                silver = ""
-            else:
-                silver = raw.replace(" ", "")
-        else:
-            silver = ""
+        fields['rank'] = cells[3].text if len(cells) > 3 else ''
+        fields['silver'] = cells[5].text if len(cells) >= 6 else None
+        fields['classes'] = row.get_attribute("class") or ""
+        return build_vehicle_row(fields, category)
+
+
+def build_vehicle_row(fields: dict, category: str) -> Optional[dict]:
+    """
+    Запись List View из сырых полей строки (их собирает parse_vehicle_row по элементам
+    или page_payload одним скриптом): ссылка, имя, нация, БР, тексты ячеек ранга (4-я) и цены (6-я),
+    классы строки. silver - None, если в строке меньше шести ячеек.
+    """
+    data = {}
+    data['data_ulist_id'] = fields.get('data_ulist_id') or ""
+    data['link'] = fields.get('link') or ''
+    data['name'] = fields.get('name') or ''
+    data['country'] = fields.get('country') or ''
+    data['battle_rating'] = fields.get('battle_rating') or ''
 
-        classes = row.get_attribute("class") or ""
-        if "--prem" in classes or "--squad" in classes:
+    if fields.get('silver') is not None:
+        raw = fields['silver'].strip().lower()
+        if raw == "бесплатно":
+            silver = "0"
+        elif raw == "—" or raw == "":
             silver = ""
+        else:
+            silver = raw.replace(" ", "")
+    else:
+        silver = ""
 
-        data["silver"] = silver
+    classes = fields.get('classes') or ""
+    if "--prem" in classes or "--squad" in classes:
+        silver = ""
 
-        try:
-            data['rank'] = cells[3].text.strip() if len(cells) > 3 else ''
-        except:
-            data['rank'] = ''
-        data['vehicle_category'] = category
-        data['type'] = 'vehicle'
+    data["silver"] = silver
 
-        if not data.get('battle_rating') or data['battle_rating'] == '—':
-            return None
-        print(f'Ищвлечен узел из ListView: {data}')
-        return data
+    data['rank'] = (fields.get('rank') or '').strip()
+    data['vehicle_category'] = category
+    data['type'] = 'vehicle'
+
+    if not data.get('battle_rating') or data['battle_rating'] == '—':
+        return None
+    print(f'Ищвлечен узел из ListView: {data}')
+    return data
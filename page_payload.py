@@ -0,0 +1,254 @@
+import threading
+from page_helper import build_vehicle_row
+from tree_data_extractor import extract_image_url
+
+CAPTURE_MODES = ('dom', 'script')
+
+# Общие функции скриптов: повторяют XPath-запросы экстракторов (ancestor::td[1], tr/td, tbody/tr)
+_JS_HELPERS = r"""
+const text = el => el ? (el.innerText || el.textContent || '').replace(/\s+/g, ' ').trim() : '';
+const attr = (el, name) => el ? el.getAttribute(name) : null;
+const own = (parent, tag) => parent ? Array.from(parent.children).filter(c => c.tagName === tag) : [];
+const gridCell = el => {
+    const td = el.closest('td');
+    const tr = td && td.closest('tr');
+    const tbody = tr && tr.closest('tbody');
+    if (!tbody) return [null, null];
+    return [own(tr, 'TD').indexOf(td), own(tbody, 'TR').indexOf(tr)];
+};
+"""
+
+# Все узлы Tree View за один вызов WebDriver вместо нескольких команд на каждый элемент
+TREE_PAYLOAD_JS = _JS_HELPERS + r"""
+const vehicles = Array.from(document.querySelectorAll('div.wt-tree_item')).map(el => {
+    const [column, row] = gridCell(el);
+    let order = null, groupId = null;
+    const container = el.parentElement && el.parentElement.closest('div[class*="wt-tree_group-items"]');
+    if (container) {
+        const index = Array.from(container.children)
+            .filter(c => c.tagName === 'DIV' && c.classList.contains('wt-tree_item')).indexOf(el);
+        if (index >= 0) {
+            order = index;
+            const group = container.parentElement && container.parentElement.closest('div[class*="wt-tree_group"]');
+            groupId = group ? (attr(group, 'data-ulist-id') || attr(group, 'data-unit-id') || '') : null;
+        }
+    }
+    return {
+        ulist_id: attr(el, 'data-ulist-id'), unit_id: attr(el, 'data-unit-id'), req: attr(el, 'data-unit-req'),
+        name: text(el.querySelector('.wt-tree_item-text span')),
+        style: attr(el.querySelector('.wt-tree_item-icon'), 'style'),
+        classes: attr(el, 'class'), column: column, row: row, order: order, group_id: groupId,
+    };
+});
+const folders = Array.from(document.querySelectorAll(
+        'div.wt-tree_group[data-unit-id], div.wt-tree_group[data-ulist-id]')).map(el => {
+    const [column, row] = gridCell(el);
+    return {
+        ulist_id: attr(el, 'data-ulist-id'), unit_id: attr(el, 'data-unit-id'), req: attr(el, 'data-unit-req'),
+        name: text(el.querySelector('.wt-tree_group-folder_inner .wt-tree_item-text span')),
+        style: attr(el.querySelector('.wt-tree_group-folder_inner .wt-tree_item-icon'), 'style'),
+        column: column, row: row,
+    };
+});
+return {vehicles: vehicles, folders: folders};
+"""
+
+# Все строки List View за один вызов: те же поля, что parse_vehicle_row собирает по элементам
+LIST_PAYLOAD_JS = _JS_HELPERS + r"""
+return Array.from(document.querySelectorAll('tr.wt-ulist_unit')).map(row => {
+    const link = row.querySelector('.wt-ulist_unit-name a');
+    const cells = row.querySelectorAll('td');
+    const br = row.querySelector('td.br');
+    return {
+        data_ulist_id: attr(row, 'data-ulist-id') || '',
+        link: link ? link.href : '',
+        name: text(row.querySelector('.wt-ulist_unit-name a span')),
+        country: attr(row.querySelector('td.wt-ulist_unit-country'), 'data-value') || '',
+        battle_rating: br ? text(br) : '',
+        rank: cells.length > 3 ? text(cells[3]) : '',
+        silver: cells.length >= 6 ? text(cells[5]) : null,
+        classes: attr(row, 'class') || '',
+    };
+});
+"""
+
+# Встроенное состояние и JSON-ответы страницы: что из данных приходит не в виде готовой разметки
+PROBE_JS = r"""
+const globals = ['__NUXT__', '__NEXT_DATA__', '__INITIAL_STATE__', '__APOLLO_STATE__', '__PRELOADED_STATE__',
+                 'initialState', 'wtUnitList', 'unitsData']
+    .filter(name => window[name] !== undefined && window[name] !== null);
+const scripts = Array.from(document.querySelectorAll(
+        'script[type="application/json"], script[type="application/ld+json"], script[id*="data"]'))
+    .map(s => ({id: s.id || '', type: s.type || '', length: (s.textContent || '').length}));
+const requests = (performance.getEntriesByType('resource') || [])
+    .filter(e => e.initiatorType === 'xmlhttprequest' || e.initiatorType === 'fetch')
+    .map(e => ({url: e.name, bytes: e.transferSize || e.encodedBodySize || 0}));
+return {globals: globals, json_scripts: scripts, requests: requests};
+"""
+
+
+class PayloadCapture:
+    """
+    Извлечение данных страницы одним execute_script вместо тысяч команд WebDriver по элементам.
+
+    Дерево и список на вики приходят готовой разметкой (снимки page_source разбираются теми же
+    экстракторами), поэтому скрипт собирает в браузере те же атрибуты и тексты, что и
+    TreeDataExtractor / PageHelper.parse_vehicle_row, и возвращает их одним JSON. Записи строятся
+    по тем же правилам. Если скрипт недоступен (воспроизведение архива) или упал, вызывающий код
+    возвращается к разбору по элементам.
+    """
+
+    def __init__(self, mode='dom'):
+        if mode not in CAPTURE_MODES:
+            raise ValueError(f"Неизвестный capture_mode '{mode}', допустимы: {', '.join(CAPTURE_MODES)}")
+        self.mode = mode
+        self.stats = {'tree_pages': 0, 'list_pages': 0, 'nodes': 0, 'rows': 0, 'fallbacks': 0}
+        self.probed = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('capture_mode', 'dom').strip().lower())
+
+    @property
+    def enabled(self):
+        return self.mode == 'script'
+
+    def _count(self, **values):
+        with self._lock:
+            for name, value in values.items():
+                self.stats[name] += value
+
+    def _run(self, driver, script, what):
+        try:
+            payload = driver.execute_script(script)
+        except Exception as e:
+            print(f"Предупреждение: Скрипт извлечения ({what}) не выполнен ({e}), разбор по элементам.")
+            payload = None
+        if payload is None:
+            self._count(fallbacks=1)
+        return payload
+
+    def tree_nodes(self, driver):
+        """Узлы Tree View текущей страницы или None, если нужно разбирать по элементам."""
+        if not self.enabled:
+            return None
+        payload = self._run(driver, TREE_PAYLOAD_JS, 'Tree View')
+        if not isinstance(payload, dict):
+            return None
+        nodes = tree_nodes_from_payload(payload)
+        self._count(tree_pages=1, nodes=len(nodes))
+        return nodes
+
+    def list_rows(self, driver, category):
+        """Записи List View по строкам страницы (None для строк без БР, как parse_vehicle_row) или None."""
+        if not self.enabled:
+            return None
+        payload = self._run(driver, LIST_PAYLOAD_JS, 'List View')
+        if not isinstance(payload, list):
+            return None
+        rows = [build_vehicle_row(fields, category) for fields in payload]
+        self._count(list_pages=1, rows=sum(1 for row in rows if row is not None))
+        return rows
+
+    def probe(self, driver, key):
+        """
+        Один раз для key печатает, какие данные страница получает в виде JSON (глобальные объекты
+        состояния, JSON в <script>, XHR/fetch) - кандидаты для чтения данных без разметки.
+        """
+        if not self.enabled or key in self.probed:
+            return None
+        self.probed.add(key)
+        try:
+            found = driver.execute_script(PROBE_JS)
+        except Exception as e:
+            print(f"Предупреждение: Не удалось проверить источники данных страницы {key}: {e}")
+            return None
+        if not isinstance(found, dict):
+            return None
+        requests = found.get('requests') or []
+        print(f"Источники данных {key}: глобальные объекты {found.get('globals') or 'нет'}, "
+              f"JSON в <script>: {len(found.get('json_scripts') or [])}, XHR/fetch: {len(requests)}"
+              + "".join(f"\n  {r['url']} ({r['bytes']} Б)" for r in requests[:10]))
+        return found
+
+    def report(self):
+        if not self.enabled:
+            return
+        s = self.stats
+        print(f"Извлечение скриптом: страниц Tree View {s['tree_pages']} ({s['nodes']} узлов), "
+              f"List View {s['list_pages']} ({s['rows']} строк), возвратов к разбору по элементам {s['fallbacks']}")
+
+
+def _node_ids(node, raw):
+    """Правила TreeDataExtractor для data-ulist-id / data-unit-id: недостающий id берется из другого."""
+    node['data_ulist_id'] = raw.get('ulist_id')
+    node['external_id'] = raw.get('unit_id')
+    if not node['data_ulist_id'] and node['external_id']:
+        node['data_ulist_id'] = node['external_id']
+    elif not node['external_id'] and node['data_ulist_id']:
+        node['external_id'] = node['data_ulist_id']
+
+
+def tree_nodes_from_payload(payload):
+    """
+    Узлы из результата TREE_PAYLOAD_JS - те же записи, что TreeDataExtractor.extract_nodes:
+    сначала техника, затем папки, без повторов data_ulist_id.
+    """
+    nodes, seen = [], set()
+
+    def add(node):
+        node_id = node.get('data_ulist_id')
+        if node_id and node_id not in seen:
+            seen.add(node_id)
+            nodes.append(node)
+
+    for raw in payload.get('vehicles') or []:
+        node = {}
+        _node_ids(node, raw)
+        if not node['data_ulist_id']:
+            print(f"КРИТИЧЕСКОЕ ПРЕДУПРЕЖДЕНИЕ: Узел техники не имеет ни data-ulist-id, ни data-unit-id! "
+                  f"Проблемный узел (возможно): {raw.get('name')}")
+            continue
+        node['parent_external_id'] = raw.get('req') or ""
+        node['name'] = raw.get('name') or ""
+        node['image_url'] = extract_image_url(raw.get('style') or "")
+        node['tech_category'] = "premium" if "wt-tree_item--prem" in (raw.get('classes') or "") else "standard"
+        node['type'] = "vehicle"
+        node['column_index'], node['row_index'] = raw.get('column'), raw.get('row')
+        node['order_in_folder'] = raw.get('order')
+        if node['order_in_folder'] is not None and not node['parent_external_id']:
+            node['parent_external_id'] = raw.get('group_id') or ""
+        add(node)
+
+    for raw in payload.get('folders') or []:
+        node = {}
+        _node_ids(node, raw)
+        name = raw.get('name') or ""
+        node['name'] = name
+        if not node['data_ulist_id']:
+            gen_id = name.lower().replace(" ", "_") + "_group" if name else "unknown_folder_group"
+            node['data_ulist_id'] = gen_id
+            node['external_id'] = gen_id
+            print(f"Предупреждение: Сгенерирован ID '{gen_id}' для папки без ID с именем '{name}'")
+        node['parent_external_id'] = raw.get('req') or ""
+        node['type'] = "folder"
+        node['tech_category'] = "standard"
+        node['image_url'] = extract_image_url(raw.get('style') or "")
+        node['column_index'], node['row_index'] = raw.get('column'), raw.get('row')
+        node['order_in_folder'] = None
+        add(node)
+    return nodes
+
+
+_shared_capture = PayloadCapture()
+
+
+def configure_shared_capture(config):
+    global _shared_capture
+    _shared_capture = PayloadCapture.from_config(config)
+    return _shared_capture
+
+
+def get_shared_capture():
+    return _shared_capture
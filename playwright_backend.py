@@ -0,0 +1,290 @@
+import asyncio
+import time
+from page_helper import PageHelper
+from navigator import (NavState, DEFAULT_URL_TEMPLATE, VIEW_CODES, SECTION_LINKS_SCRIPT, NATION_TABS_SCRIPT,
+                       ACTIVATE_TAB_SCRIPT)
+from scrape_archive import ReplayDriver, ReplayNavigator
+
+try:
+    from playwright.async_api import async_playwright
+except ImportError:
+    async_playwright = None
+
+# Признак того, что страница нужного вида отрисована: на него ждет автоожидание локатора
+VIEW_READY_SELECTORS = {
+    'tree': 'div.wt-tree_item',
+    'list': 'tr.wt-ulist_unit',
+    'flags': 'div.unit-filter_country-buttons button',
+}
+BLOCKED_RESOURCE_TYPES = ('image', 'media', 'font')
+
+# Активная вкладка совпадает с нацией - то же условие, что Navigator._matches. Если активную вкладку
+# определить нельзя, первый узел дерева не должен принадлежать другой нации раздела (taken).
+# Возвращает {first_node} или false, пока страница не в нужном состоянии
+_ACTIVE_TAB_JS = r"""
+([key, label, taken]) => {
+    const first = document.querySelector('div.wt-tree_item');
+    if (!first) return false;
+    const firstNode = first.getAttribute('data-unit-id') || first.getAttribute('data-ulist-id') || '';
+    const active = Array.from(document.querySelectorAll('div.navtabs_wrapper div.navtabs_item'))
+        .filter(t => /active|selected|current/.test(t.className))
+        .map(t => t.outerHTML.slice(0, 400) + ' ' + t.textContent.trim()).join(' ').toLowerCase();
+    if (!active) return taken.includes(firstNode) ? false : {first_node: firstNode};
+    const escape = w => w.replace(/[.*+?^${}()|[\]\\]/g, '\\$&');
+    const matched = [key, label].filter(Boolean).some(w =>
+        new RegExp('(?<![a-zа-яё0-9])' + escape(w.toLowerCase()) + '(?![a-zа-яё0-9])').test(active));
+    return matched ? {first_node: firstNode} : false;
+}
+"""
+
+
+async def _block_heavy_resources(route):
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+def _webdriver_script(script):
+    """Скрипт execute_script (тело функции с return и arguments[N]) для page.evaluate."""
+    return "function() {\n" + script + "\n}"
+
+
+class PlaywrightCapture:
+    """
+    Снятие страниц вики асинхронным Playwright: один процесс браузера и много легких изолированных
+    контекстов - по одному на задание (раздел, вид, нация), не больше max_contexts одновременно.
+    Вместо WebDriverWait и пауз - автоожидание локаторов и wait_for_function.
+
+    Возвращаются снимки DOM (page.content()); узлы и строки из них извлекают те же PageHelper и
+    TreeDataExtractor, что при воспроизведении архива, поэтому файлы совпадают с сбором через Selenium.
+    """
+
+    def __init__(self, start_url, browser_name='firefox', headless=True, max_contexts=8, timeout=20.0,
+                 retries=2, block_images=True, url_template=None, proxy_port=None):
+        if async_playwright is None:
+            raise RuntimeError("Для browser_backend=playwright нужен пакет playwright "
+                               "(pip install playwright && playwright install firefox)")
+        self.start_url = start_url
+        self.browser_name = browser_name
+        self.headless = headless
+        self.max_contexts = max(1, max_contexts)
+        self.timeout_ms = timeout * 1000
+        self.retries = retries
+        self.block_images = block_images
+        self.url_template = url_template or DEFAULT_URL_TEMPLATE
+        self.proxy_port = proxy_port
+        self.section_urls = {}
+        self.storage_state = None
+        # {(раздел, id первого узла дерева): нация} - как Navigator._first_nodes
+        self._first_nodes = {}
+        self.stats = {'pages': 0, 'retries': 0, 'failed': 0, 'seconds': 0.0}
+
+    @classmethod
+    def from_config(cls, config, request_filter=None):
+        return cls(config['start_url'],
+                   browser_name=config.get('playwright_browser', 'firefox').strip().lower(),
+                   headless=config.get('headless', 'true').strip().lower() == 'true',
+                   max_contexts=int(config.get('playwright_contexts', '8')),
+                   timeout=float(config.get('playwright_timeout', '20')),
+                   retries=int(config.get('playwright_retries', '2')),
+                   block_images=config.get('load_images', 'true').strip().lower() == 'false',
+                   url_template=config.get('nav_url_template') or None,
+                   proxy_port=request_filter.port if request_filter else None)
+
+    def build_url(self, state):
+        return self.url_template.format(section_url=self.section_urls[state.section], view=state.view,
+                                        view_code=VIEW_CODES.get(state.view, state.view), nation=state.nation or '')
+
+    async def _new_page(self, browser):
+        context = await browser.new_context(storage_state=self.storage_state)
+        if self.block_images:
+            await context.route('**/*', _block_heavy_resources)
+        page = await context.new_page()
+        page.set_default_timeout(self.timeout_ms)
+        return context, page
+
+    async def _pass_verification(self, page):
+        if (await page.title()).strip().lower() != "human verification":
+            return
+        if self.headless:
+            raise RuntimeError("Страница требует Human Verification - запустите с headless=false")
+        await asyncio.get_running_loop().run_in_executor(
+            None, input, "Страница требует прохождения Human Verification. Пройдите проверку и нажмите Enter...")
+
+    async def _bootstrap(self, browser):
+        """Стартовая страница: ссылки разделов и cookies, которые получат все следующие контексты."""
+        context, page = await self._new_page(browser)
+        try:
+            await page.goto(self.start_url)
+            await self._pass_verification(page)
+            await page.locator('a.layout-nav_item').first.wait_for(state='attached')
+            links = await page.evaluate(_webdriver_script(SECTION_LINKS_SCRIPT)) or []
+            self.section_urls = {link['text']: link['href'].split('?')[0].split('#')[0]
+                                 for link in links if link.get('text') and link.get('href')}
+            self.storage_state = await context.storage_state()
+            print(f"Playwright: найдено ссылок разделов: {len(self.section_urls)}")
+        finally:
+            await context.close()
+
+    async def _wait_for_nation(self, page, state, **kwargs):
+        """Ждет дерево нации state и закрепляет за ней первый узел дерева."""
+        taken = [node for (section, node), nation in self._first_nodes.items()
+                 if section == state.section and nation != state.nation]
+        found = await page.wait_for_function(_ACTIVE_TAB_JS, arg=[state.nation, state.nation_label, taken], **kwargs)
+        first_node = (await found.json_value())['first_node']
+        self._first_nodes.setdefault((state.section, first_node), state.nation)
+
+    async def _snapshot(self, browser, limit, state, nation_tabs=False):
+        """
+        Открывает state в собственном контексте и возвращает (html, url, вкладки наций или None).
+        Для нации вкладка при необходимости активируется обработчиком вики, как в Navigator.goto.
+        """
+        async with limit:
+            for attempt in range(self.retries + 1):
+                context, page = await self._new_page(browser)
+                try:
+                    url = self.section_urls[state.section] if state.view == 'flags' else self.build_url(state)
+                    await page.goto(url)
+                    await self._pass_verification(page)
+                    await page.locator(VIEW_READY_SELECTORS[state.view]).first.wait_for(state='attached')
+                    if state.view == 'tree' and state.nation:
+                        try:
+                            await self._wait_for_nation(page, state, timeout=self.timeout_ms / 2)
+                        except Exception:
+                            tabs = await page.evaluate(_webdriver_script(NATION_TABS_SCRIPT)) or []
+                            index = next((tab['index'] for tab in tabs if tab.get('key') == state.nation
+                                          or (state.nation_label and tab.get('label') == state.nation_label)), None)
+                            if index is None or not await page.evaluate(_webdriver_script(ACTIVATE_TAB_SCRIPT), index):
+                                raise RuntimeError(f"нет вкладки нации {state.nation}")
+                            await self._wait_for_nation(page, state)
+                    tabs = await page.evaluate(_webdriver_script(NATION_TABS_SCRIPT)) if nation_tabs else None
+                    self.stats['pages'] += 1
+                    return await page.content(), page.url, tabs
+                except Exception as e:
+                    if attempt < self.retries:
+                        self.stats['retries'] += 1
+                        print(f"Playwright: повтор {state} после ошибки: {e}")
+                    else:
+                        self.stats['failed'] += 1
+                        print(f"Playwright: не удалось снять {state}: {e}")
+                finally:
+                    await context.close()
+        return None
+
+    async def _capture(self, view, sections):
+        started = time.time()
+        pages = []
+        async with async_playwright() as playwright:
+            launcher = getattr(playwright, self.browser_name)
+            proxy = {'server': f"http://127.0.0.1:{self.proxy_port}"} if self.proxy_port else None
+            browser = await launcher.launch(headless=self.headless, proxy=proxy)
+            try:
+                await self._bootstrap(browser)
+                sections = [section for section in sections if section in self.section_urls]
+                limit = asyncio.Semaphore(self.max_contexts)
+                if view != 'tree':
+                    states = [NavState(section, view) for section in sections]
+                    snapshots = await asyncio.gather(*(self._snapshot(browser, limit, s) for s in states))
+                else:
+                    # Вкладки наций каждого раздела, затем все нации всех разделов одновременно
+                    section_pages = await asyncio.gather(*(
+                        self._snapshot(browser, limit, NavState(section, 'tree'), nation_tabs=True)
+                        for section in sections))
+                    states = [NavState(section, 'tree', tab.get('key') or tab.get('label'), tab.get('label'))
+                              for section, snapshot in zip(sections, section_pages) if snapshot
+                              for tab in snapshot[2] or [] if tab.get('key') or tab.get('label')]
+                    snapshots = await asyncio.gather(*(self._snapshot(browser, limit, s) for s in states))
+            finally:
+                await browser.close()
+        for state, snapshot in zip(states, snapshots):
+            if snapshot:
+                html, url, _ = snapshot
+                pages.append({'section': state.section, 'view': state.view, 'nation': state.nation,
+                              'nation_label': state.nation_label, 'url': url, 'html': html})
+        elapsed = time.time() - started
+        self.stats['seconds'] += elapsed
+        print(f"Playwright: снято страниц {view}: {len(pages)}/{len(states)} за {elapsed:.1f} сек. "
+              f"({self.max_contexts} контекстов)")
+        return pages
+
+    def capture(self, view, sections):
+        """Снимки страниц вида view для разделов sections в порядке (раздел, вкладка нации)."""
+        return asyncio.run(self._capture(view, sections))
+
+    def report(self):
+        s = self.stats
+        if s['pages'] or s['failed']:
+            print(f"Playwright: страниц {s['pages']}, повторов {s['retries']}, не снято {s['failed']}, "
+                  f"время снятия {s['seconds']:.1f} сек.")
+
+
+class PlaywrightPageSource:
+    """
+    Страницы для ReplayNavigator (интерфейс ScrapeArchive для чтения), которые снимаются живым
+    браузером при первом обращении к виду - сразу по всем разделам, параллельно.
+    """
+
+    def __init__(self, capture, sections):
+        self.capture = capture
+        self.sections = list(sections)
+        self.pages = []
+        self._html = {}
+        self._captured = set()
+
+    def _ensure(self, view):
+        if view in self._captured:
+            return
+        self._captured.add(view)
+        sections = self.sections[:1] if view == 'flags' else self.sections
+        for page in self.capture.capture(view, sections):
+            page['file'] = f"pages/{len(self.pages):04d}.html"
+            self._html[page['file']] = page.pop('html')
+            self.pages.append(page)
+
+    def find_pages(self, section=None, view=None):
+        for name in ([view] if view else VIEW_READY_SELECTORS):
+            self._ensure(name)
+        return [p for p in self.pages
+                if (section is None or p['section'] == section) and (view is None or p['view'] == view)]
+
+    def read_page(self, page):
+        return self._html[page['file']]
+
+
+class PlaywrightBrowserSession:
+    """
+    Замена BrowserSession при browser_backend=playwright: шаги работают с PageHelper поверх снимков
+    (как при воспроизведении архива), а снимки параллельно снимает PlaywrightCapture.
+    """
+
+    def __init__(self, config, target_sections, request_filter=None):
+        self.config = config
+        self.request_filter = request_filter
+        self.capture = PlaywrightCapture.from_config(config, request_filter)
+        self.archive = PlaywrightPageSource(self.capture, target_sections)
+        self.driver = None
+        self.helper = None
+        self.navigator = None
+
+    def start(self):
+        if self.driver is None:
+            self.driver = ReplayDriver()
+            self.helper = PageHelper(self.driver, wait_timeout=1)
+            self.navigator = ReplayNavigator(self.helper, self.archive)
+        return self
+
+    def open_flags_page(self, section):
+        self.start()
+        self.navigator.goto(NavState(section, 'flags'))
+
+    def run_unit(self, state, work):
+        self.start()
+        return work()
+
+    def collect_resource_stats(self):
+        pass
+
+    def close(self):
+        self.capture.report()
+        self.driver = None
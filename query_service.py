@@ -0,0 +1,408 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from build_graph import value_hash
+from data_utils import roman_to_int
+
+INT_FIELDS = ('column_index', 'row_index', 'order_in_folder', 'silver', 'required_exp', 'purchase_cost', 'crew',
+              'repair_arcade', 'repair_realistic', 'repair_simulator')
+FLOAT_FIELDS = ('battle_rating', 'br_arcade', 'br_realistic', 'br_simulator')
+RESPONSE_CACHE_SIZE = 4096
+LATENCY_WINDOW = 10000
+
+
+def _read_csv(path, required=True):
+    """(строки, sha256 прочитанных байтов или None, если файла нет)."""
+    if not os.path.exists(path):
+        if required:
+            raise FileNotFoundError(path)
+        return [], None
+    with open(path, 'rb') as f:
+        data = f.read()
+    return list(csv.DictReader(io.StringIO(data.decode('utf-8'), newline=''))), hashlib.sha256(data).hexdigest()
+
+
+def _number(value, kind):
+    if value in (None, ''):
+        return None
+    try:
+        return kind(str(value).replace(',', '.')) if kind is float else int(value)
+    except ValueError:
+        return None
+
+
+def node_record(row):
+    """Строка vehicles_merged.csv в запись ответа: пустые значения -> None, числа - числами."""
+    node = {key: (value if value != '' else None) for key, value in row.items()}
+    node['id'] = (row.get('data_ulist_id') or row.get('external_id') or '').strip()
+    node['country'] = (row.get('country') or '').strip().lower() or None
+    rank = (row.get('rank') or '').strip()
+    node['rank'] = (int(rank) if rank.isdigit() else roman_to_int(rank)) if rank else None
+    for field in INT_FIELDS:
+        if field in node:
+            node[field] = _number(node[field], int)
+    for field in FLOAT_FIELDS:
+        if field in node:
+            node[field] = _number(node[field], float)
+    return node
+
+
+def _tree_order(node):
+    return (node.get('column_index') if node.get('column_index') is not None else 1 << 30,
+            node.get('row_index') if node.get('row_index') is not None else 1 << 30,
+            node.get('order_in_folder') if node.get('order_in_folder') is not None else -1,
+            node['id'])
+
+
+class TreeIndex:
+    """
+    Неизменяемый снимок данных дерева с вторичными индексами.
+    Сервис подменяет снимок целиком, поэтому запрос всегда видит согласованные данные одной версии.
+    """
+
+    def __init__(self, merged_csv, deps_csv, rank_csv):
+        self.files = (merged_csv, deps_csv, rank_csv)
+        self.loaded_at = time.strftime('%Y-%m-%d %H:%M:%S')
+        # Каждый файл читается один раз: и индексы, и версия строятся из одних и тех же байтов
+        merged_rows, merged_hash = _read_csv(merged_csv)
+        deps_rows, deps_hash = _read_csv(deps_csv, required=False)
+        rank_rows, rank_hash = _read_csv(rank_csv, required=False)
+        self.hashes = dict(zip(self.files, (merged_hash, deps_hash, rank_hash)))
+        self.version = value_hash([merged_hash, deps_hash, rank_hash])[:16]
+
+        self.nodes = {}
+        for row in merged_rows:
+            node = node_record(row)
+            if node['id'] and node['id'] not in self.nodes:
+                self.nodes[node['id']] = node
+        ordered = sorted(self.nodes.values(), key=_tree_order)
+
+        self.by_branch = {}
+        self.by_rank = {}
+        self.children = {}
+        for node in ordered:
+            self.by_branch.setdefault((node['country'], node.get('vehicle_category')), []).append(node['id'])
+            self.by_rank.setdefault(node['rank'], []).append(node['id'])
+            parent = node.get('parent_external_id')
+            if parent and parent != node['id']:
+                self.children.setdefault(parent, []).append(node['id'])
+
+        # Отсортированные массивы BR (всего и по рангам) для поиска диапазона через bisect
+        self.br_all = self._br_array(ordered)
+        self.br_by_rank = {rank: self._br_array(self.nodes[i] for i in ids) for rank, ids in self.by_rank.items()}
+
+        self.prerequisites = {}
+        self.dependents = {}
+        for row in deps_rows:
+            node_id = (row.get('node_external_id') or '').strip()
+            prerequisite = (row.get('prerequisite_external_id') or '').strip()
+            if node_id and prerequisite:
+                self.prerequisites.setdefault(node_id, []).append(prerequisite)
+                self.dependents.setdefault(prerequisite, []).append(node_id)
+
+        self.rank_requirements = {}
+        for row in rank_rows:
+            key = (row.get('nation', '').strip().lower(), row.get('vehicle_type', ''))
+            self.rank_requirements.setdefault(key, []).append({
+                'nation': key[0], 'vehicle_type': key[1],
+                'target_rank': int(row['target_rank']), 'previous_rank': int(row['previous_rank']),
+                'required_units': int(row['required_units']),
+            })
+
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @staticmethod
+    def _br_array(nodes):
+        pairs = sorted((node['battle_rating'], node['id']) for node in nodes if node.get('battle_rating') is not None)
+        return [br for br, _ in pairs], [node_id for _, node_id in pairs]
+
+    def _get(self, ids):
+        return [self.nodes[node_id] for node_id in ids if node_id in self.nodes]
+
+    def branch(self, nation, vehicle_type=None, rank=None):
+        if vehicle_type is not None:
+            ids = self.by_branch.get((nation, vehicle_type), [])
+        else:
+            ids = [i for (n, _), branch in self.by_branch.items() if n == nation for i in branch]
+        nodes = self._get(ids)
+        return [n for n in nodes if n['rank'] == rank] if rank is not None else nodes
+
+    def br_range(self, low, high, rank=None, nation=None, vehicle_type=None):
+        brs, ids = self.br_by_rank.get(rank, ([], [])) if rank is not None else self.br_all
+        nodes = self._get(ids[bisect_left(brs, low):bisect_right(brs, high)])
+        return [n for n in nodes
+                if (nation is None or n['country'] == nation)
+                and (vehicle_type is None or n.get('vehicle_category') == vehicle_type)]
+
+    def cached(self, key, build):
+        """Готовое тело ответа из кэша снимка (строится один раз на версию данных)."""
+        with self._cache_lock:
+            body = self._cache.get(key)
+            if body is not None:
+                self._cache.move_to_end(key)
+                return body
+        body = build()
+        with self._cache_lock:
+            self._cache[key] = body
+            if len(self._cache) > RESPONSE_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return body
+
+    def stats(self):
+        return {
+            'version': self.version,
+            'loaded_at': self.loaded_at,
+            'nodes': len(self.nodes),
+            'branches': len(self.by_branch),
+            'dependencies': sum(len(v) for v in self.prerequisites.values()),
+            'rank_requirements': sum(len(v) for v in self.rank_requirements.values()),
+        }
+
+
+def manifest_mismatch(manifest, hashes):
+    """
+    Первый файл снимка, который не согласован с манифестом сборки, или None.
+
+    Файл согласован, если его байты совпадают с выходом шага, записавшего его последним, а шаг,
+    который строил его из других файлов снимка (dependencies из vehicles_merged.csv), видел те же их версии.
+    Файлы, которых нет среди выходов шагов, не проверяются.
+    """
+    hashes = {os.path.normpath(path): digest for path, digest in hashes.items()}
+    for record in manifest.values():
+        if not isinstance(record, dict):
+            continue
+        outputs = {os.path.normpath(path): digest for path, digest in record.get('outputs', {}).items()}
+        produced = [path for path in outputs if path in hashes]
+        for path in produced:
+            if outputs[path] != hashes[path]:
+                return path
+        if produced:
+            for path, digest in record.get('inputs', {}).items():
+                path = os.path.normpath(path)
+                if path in hashes and digest != hashes[path]:
+                    return produced[0]
+    return None
+
+
+class QueryService:
+    """
+    Локальный сервис чтения данных дерева: индексы в памяти, ETag по версии данных
+    и атомарная перезагрузка, когда конвейер завершает запись новых CSV.
+    """
+
+    def __init__(self, merged_csv='vehicles_merged.csv', deps_csv='dependencies.csv',
+                 rank_csv='rank_requirements.csv', reload_interval=2.0, marker='.build_manifest.json'):
+        self.files = (merged_csv, deps_csv, rank_csv)
+        self.reload_interval = reload_interval
+        self.marker = marker
+        self.index = TreeIndex(*self.files)
+        self.reloads = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self._stamp = self._marker_stamp()
+        self._stopping = threading.Event()
+        print(f"Сервис запросов: загружено {len(self.index.nodes)} узлов (версия {self.index.version})")
+
+    def _marker_stamp(self):
+        try:
+            st = os.stat(self.marker)
+            return st.st_mtime_ns, st.st_size
+        except FileNotFoundError:
+            return None
+
+    def _load_marker(self):
+        with open(self.marker, encoding='utf-8') as f:
+            return json.load(f)
+
+    def watch(self):
+        """
+        Перестраивает индекс, когда конвейер обновил манифест сборки (query_reload_marker) - его шаги
+        записывают после того, как выходной файл готов. Манифест читается до CSV: если прочитанные байты
+        файлов с ним не согласованы (шаг еще пишет файл, или dependencies.csv еще не пересобран после
+        vehicles_merged.csv), снимок отбрасывается и проверка повторяется при следующем опросе.
+        Новый снимок строится в стороне и подменяет старый одним присваиванием.
+        """
+        reported = None
+        while not self._stopping.wait(self.reload_interval):
+            stamp = self._marker_stamp()
+            if stamp is None or stamp == self._stamp:
+                continue
+            try:
+                manifest = self._load_marker()
+                index = TreeIndex(*self.files)
+            except Exception as e:
+                if reported != stamp:
+                    reported = stamp
+                    print(f"Сервис запросов: не удалось перечитать данные, остается версия {self.index.version}: {e}")
+                continue
+            mismatch = manifest_mismatch(manifest, index.hashes)
+            if mismatch:
+                if reported != stamp:
+                    reported = stamp
+                    print(f"Сервис запросов: {mismatch} не согласован с {self.marker}, ожидание окончания сборки.")
+                continue
+            self._stamp = stamp
+            if index.version != self.index.version:
+                self.index = index
+                self.reloads += 1
+                print(f"Сервис запросов: данные перезагружены ({len(index.nodes)} узлов, версия {index.version})")
+
+    def stop(self):
+        self._stopping.set()
+
+    def record_latency(self, seconds):
+        self.latencies.append(seconds)
+
+    def status(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(fraction):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000, 3)
+
+        status = self.index.stats()
+        status.update({'reloads': self.reloads, 'requests': len(latencies),
+                       'p50_ms': percentile(0.5), 'p99_ms': percentile(0.99)})
+        return status
+
+    def handle(self, path, params):
+        """
+        Возвращает (код, тело JSON в байтах) для запроса. Тело берется из кэша снимка,
+        поэтому повторный запрос той же версии данных не сериализуется заново.
+        """
+        index = self.index
+        parts = [p for p in path.split('/') if p]
+        key = (path, tuple(sorted((k, tuple(v)) for k, v in params.items())))
+
+        def one(name, kind=str):
+            values = params.get(name)
+            if not values:
+                return None
+            return kind(values[0])
+
+        def build():
+            if parts == ['nodes']:
+                nation = (one('nation') or '').lower()
+                if not nation:
+                    raise ValueError("Нужен параметр nation")
+                return index.branch(nation, one('vehicle_type'), one('rank', int))
+            if len(parts) == 2 and parts[0] == 'nodes':
+                return index.nodes.get(parts[1])
+            if len(parts) == 3 and parts[0] == 'nodes':
+                node_id, relation = parts[1], parts[2]
+                if node_id not in index.nodes:
+                    return None
+                if relation == 'children':
+                    return index._get(index.children.get(node_id, []))
+                if relation == 'prerequisites':
+                    return index._get(index.prerequisites.get(node_id, []))
+                if relation == 'dependents':
+                    return index._get(index.dependents.get(node_id, []))
+            if parts == ['br']:
+                low, high = one('min', float), one('max', float)
+                if low is None or high is None:
+                    raise ValueError("Нужны параметры min и max")
+                nation = one('nation')
+                return index.br_range(low, high, one('rank', int), nation.lower() if nation else None,
+                                      one('vehicle_type'))
+            if parts == ['rank_requirements']:
+                nation = (one('nation') or '').lower()
+                return index.rank_requirements.get((nation, one('vehicle_type') or ''), [])
+            raise LookupError(path)
+
+        def encode():
+            result = build()
+            if result is None:
+                raise LookupError(path)
+            return json.dumps(result, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+        return index.version, index.cached(key, encode)
+
+
+class _QueryRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело уходят отдельными записями - без TCP_NODELAY ответ ждет отложенного ACK (~40 мс)
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, etag=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        if etag:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(status, json.dumps({'error': message}, ensure_ascii=False).encode('utf-8'))
+
+    def do_GET(self):
+        service = self.server.query_service
+        started = time.perf_counter()
+        url = urlsplit(self.path)
+        if url.path == '/status':
+            self._send(200, json.dumps(service.status(), ensure_ascii=False).encode('utf-8'))
+            return
+        try:
+            version, body = service.handle(url.path, parse_qs(url.query))
+        except LookupError:
+            self._error(404, 'not found')
+            return
+        except ValueError as e:
+            self._error(400, str(e))
+            return
+        etag = f'"{version}"'
+        service.record_latency(time.perf_counter() - started)
+        if etag in [tag.strip() for tag in (self.headers.get('If-None-Match') or '').split(',')]:
+            self._send(304, b'', etag)
+        else:
+            self._send(200, body, etag)
+
+
+def run_query_service(config):
+    """Запускает HTTP API сервиса запросов и поток слежения за файлами."""
+    service = QueryService(
+        merged_csv=config.get('query_merged_csv', 'vehicles_merged.csv'),
+        deps_csv=config.get('query_deps_csv', 'dependencies.csv'),
+        rank_csv=config.get('query_rank_csv', 'rank_requirements.csv'),
+        reload_interval=float(config.get('query_reload_interval', '2')),
+        marker=config.get('query_reload_marker') or config.get('build_manifest', '.build_manifest.json'),
+    )
+    host = config.get('query_host', '127.0.0.1')
+    port = int(config.get('query_port', '8766'))
+    server = ThreadingHTTPServer((host, port), _QueryRequestHandler)
+    server.daemon_threads = True
+    server.query_service = service
+
+    watcher = threading.Thread(target=service.watch, daemon=True)
+    watcher.start()
+
+    print(f"Сервис запросов запущен на http://{host}:{port} "
+          f"(GET /nodes?nation=&vehicle_type=&rank=, /nodes/<id>[/children|/prerequisites|/dependents], "
+          f"/br?min=&max=&rank=, /rank_requirements?nation=&vehicle_type=, /status)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nОстановка сервиса запросов...")
+    finally:
+        service.stop()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    from main import read_config
+    run_query_service(read_config())
@@ -1,7 +1,7 @@
-import requests
 import json
 import csv
 import re
+from http_session import get_shared_session
 
 DATA_URL = "https://cdn.jsdelivr.net/gh/gszabi99/War-Thunder-Datamine@master/char.vromfs.bin_u/config/rank.blkx"
 
@@ -17,7 +17,7 @@ pattern = re.compile(r"needBuyToOpenNextInEra([A-Za-z]+)(\d+)")
 
 def fetch_rank_data(url=DATA_URL):
     """Скачивает данные с указанного URL."""
-    response = requests.get(url)
+    response = get_shared_session().get(url)
     response.raise_for_status()
     return response.text
 
@@ -0,0 +1,247 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout
+
+THROTTLE_STATUSES = (429, 503)
+CHALLENGE_TITLE = b"<title>human verification</title>"
+MAX_EVENTS = 200
+
+
+def parse_retry_after(value):
+    """Разбирает заголовок Retry-After (секунды или HTTP-дата). Возвращает секунды или None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class HostLimiter:
+    """
+    Token bucket одного хоста с AIMD-регулировкой скорости и числа параллельных запросов.
+
+    Успешный ответ увеличивает скорость аддитивно, 429/503 или страница проверки -
+    уменьшают ее мультипликативно и приостанавливают запросы на Retry-After.
+    """
+
+    def __init__(self, host, rate, min_rate, max_rate, concurrency, max_concurrency,
+                 increase=0.5, decrease=0.5, default_backoff=5.0):
+        self.host = host
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.concurrency = float(concurrency)
+        self.max_concurrency = max_concurrency
+        self.increase = increase
+        self.decrease = decrease
+        self.default_backoff = default_backoff
+        self.tokens = 1.0
+        self.in_flight = 0
+        self.backoff_until = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.waited = 0.0
+        self.events = []
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(max(1.0, self.rate), self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Блокирует поток, пока хост не разрешит очередной запрос."""
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.backoff_until:
+                    delay = self.backoff_until - now
+                elif self.in_flight >= int(self.concurrency):
+                    delay = 1.0
+                elif self.tokens < 1.0:
+                    delay = (1.0 - self.tokens) / self.rate
+                else:
+                    self.tokens -= 1.0
+                    self.in_flight += 1
+                    self.requests += 1
+                    self.waited += now - started
+                    return
+                self._cond.wait(delay)
+
+    def release(self, throttled=False, retry_after=None, reason='', neutral=False):
+        """
+        Освобождает слот и подстраивает скорость по результату запроса.
+
+        :param neutral: Только освободить слот, не меняя скорость (запрос не дошел до сервера по нашей вине)
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self.concurrency = max(1.0, self.concurrency * self.decrease)
+                pause = retry_after if retry_after is not None else self.default_backoff
+                self.backoff_until = max(self.backoff_until, time.monotonic() + pause)
+                self.events.append({
+                    'time': time.time(),
+                    'reason': reason,
+                    'pause': round(pause, 2),
+                    'rate': round(self.rate, 3),
+                    'concurrency': int(self.concurrency),
+                })
+                del self.events[:-MAX_EVENTS]
+                print(f"Ограничение скорости {self.host}: {reason}, пауза {pause:.1f} сек., "
+                      f"скорость {self.rate:.2f} запр./сек., параллельно {int(self.concurrency)}")
+            elif neutral:
+                pass
+            else:
+                # Прибавка делится на скорость: за секунду успешных запросов скорость растет на increase
+                self.rate = min(self.max_rate, self.rate + self.increase / max(1.0, self.rate))
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1.0 / self.concurrency)
+            self._cond.notify_all()
+
+    def metrics(self):
+        return {
+            'rate': round(self.rate, 3),
+            'concurrency': int(self.concurrency),
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'throttled': self.throttled,
+            'wait_seconds': round(self.waited, 2),
+            'backoff_events': list(self.events),
+        }
+
+
+class RateLimiter:
+    """Набор HostLimiter по хостам с общими настройками."""
+
+    def __init__(self, rate=5.0, min_rate=0.5, max_rate=20.0, concurrency=4, max_concurrency=16,
+                 increase=0.5, decrease=0.5, default_backoff=5.0):
+        # Скорость делит время ожидания токена в acquire и не должна опускаться до нуля
+        if min_rate <= 0:
+            raise ValueError(f"rate_limit_min должен быть больше 0 (указано {min_rate:g})")
+        if rate < min_rate or max_rate < rate:
+            raise ValueError(f"Нужно rate_limit_min <= rate_limit_initial <= rate_limit_max "
+                             f"(указано {min_rate:g}, {rate:g}, {max_rate:g})")
+        self.settings = {
+            'rate': rate, 'min_rate': min_rate, 'max_rate': max_rate,
+            'concurrency': concurrency, 'max_concurrency': max_concurrency,
+            'increase': increase, 'decrease': decrease, 'default_backoff': default_backoff,
+        }
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            rate=float(config.get('rate_limit_initial', '5')),
+            min_rate=float(config.get('rate_limit_min', '0.5')),
+            max_rate=float(config.get('rate_limit_max', '20')),
+            concurrency=int(config.get('rate_limit_concurrency', '4')),
+            max_concurrency=int(config.get('rate_limit_max_concurrency', '16')),
+            increase=float(config.get('rate_limit_increase', '0.5')),
+            decrease=float(config.get('rate_limit_decrease', '0.5')),
+            default_backoff=float(config.get('rate_limit_backoff', '5')),
+        )
+
+    def host(self, host):
+        with self._lock:
+            limiter = self._hosts.get(host)
+            if limiter is None:
+                limiter = self._hosts[host] = HostLimiter(host, **self.settings)
+            return limiter
+
+    def metrics(self):
+        with self._lock:
+            return {host: limiter.metrics() for host, limiter in self._hosts.items()}
+
+    def report(self):
+        """Печатает итоговую статистику по хостам."""
+        metrics = self.metrics()
+        if not metrics:
+            return metrics
+        print("\nСтатистика ограничения скорости HTTP:")
+        for host, m in sorted(metrics.items()):
+            print(f"  {host}: запросов {m['requests']}, ограничений {m['throttled']}, "
+                  f"скорость {m['rate']} запр./сек., параллельно {m['concurrency']}, "
+                  f"ожидание {m['wait_seconds']} сек.")
+        return metrics
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    Транспорт requests, пропускающий каждый запрос через RateLimiter.
+    Ответы 429/503 повторяются после паузы (не более max_throttle_retries раз).
+    """
+
+    def __init__(self, limiter, max_throttle_retries=3, **kwargs):
+        self.limiter = limiter
+        self.max_throttle_retries = max_throttle_retries
+        super().__init__(**kwargs)
+
+    @staticmethod
+    def _is_challenge(response):
+        if 'html' not in response.headers.get('Content-Type', ''):
+            return False
+        return CHALLENGE_TITLE in (response.content[:4096] or b'').lower()
+
+    def send(self, request, **kwargs):
+        host_limiter = self.limiter.host(urlsplit(request.url).hostname or '')
+        attempt = 0
+        while True:
+            host_limiter.acquire()
+            try:
+                response = super().send(request, **kwargs)
+            except (RequestsConnectionError, Timeout) as e:
+                # Обрыв соединения и тайм-аут - признак перегрузки, скорость снижается как при 429
+                host_limiter.release(throttled=True, reason=type(e).__name__)
+                raise
+            except Exception:
+                host_limiter.release(neutral=True)
+                raise
+
+            if response.status_code in THROTTLE_STATUSES:
+                host_limiter.release(
+                    throttled=True,
+                    retry_after=parse_retry_after(response.headers.get('Retry-After')),
+                    reason=f"HTTP {response.status_code}",
+                )
+                if attempt < self.max_throttle_retries:
+                    attempt += 1
+                    response.close()
+                    continue
+            elif self._is_challenge(response):
+                host_limiter.release(throttled=True, reason="Human Verification")
+            else:
+                host_limiter.release()
+            return response
+
+
+_shared_limiter = None
+_shared_lock = threading.Lock()
+
+
+def configure_shared_limiter(config):
+    """Создает общий RateLimiter по настройкам config.txt."""
+    global _shared_limiter
+    with _shared_lock:
+        _shared_limiter = RateLimiter.from_config(config)
+    return _shared_limiter
+
+
+def get_shared_limiter():
+    """Возвращает общий RateLimiter (с настройками по умолчанию, если не был настроен)."""
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter()
+        return _shared_limiter
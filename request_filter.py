@@ -0,0 +1,311 @@
+import os
+import select
+import socket
+import threading
+import http.client
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# Хосты, запросы к которым не нужны для сбора данных
+CATEGORY_HOSTS = {
+    'analytics': [
+        'google-analytics.com',
+        'googletagmanager.com',
+        'doubleclick.net',
+        'mc.yandex.ru',
+        'an.yandex.ru',
+        'top-fwz1.mail.ru',
+        'connect.facebook.net',
+    ],
+    'fonts': [
+        'fonts.googleapis.com',
+        'fonts.gstatic.com',
+        'use.typekit.net',
+    ],
+    'media': [
+        'youtube.com',
+        'www.youtube.com',
+        'i.ytimg.com',
+        'player.vimeo.com',
+    ],
+}
+
+# Расширения, по которым блокируются незашифрованные (http) запросы
+CATEGORY_EXTENSIONS = {
+    'fonts': ('.woff', '.woff2', '.ttf', '.otf', '.eot'),
+    'media': ('.mp4', '.webm', '.ogg', '.mp3', '.m4a', '.wav'),
+}
+
+# Настройки Firefox, дополняющие блокировку на уровне прокси
+CATEGORY_PREFERENCES = {
+    'fonts': {'gfx.downloadable_fonts.enabled': False},
+    'media': {'media.autoplay.default': 5},
+}
+
+# Считывает статистику Resource Timing и очищает буфер, чтобы не считать записи дважды
+RESOURCE_STATS_SCRIPT = """
+const entries = performance.getEntriesByType('resource');
+let total = 0, cached = 0, transferred = 0, savedBytes = 0;
+for (const e of entries) {
+    total += 1;
+    transferred += e.transferSize || 0;
+    if (e.transferSize === 0 && e.decodedBodySize > 0) {
+        cached += 1;
+        savedBytes += e.encodedBodySize || e.decodedBodySize;
+    }
+}
+performance.clearResourceTimings();
+performance.setResourceTimingBufferSize(5000);
+return {total: total, cached: cached, transferred: transferred, saved_bytes: savedBytes};
+"""
+
+
+def _parse_list(value):
+    return [item.strip().lower() for item in (value or '').split(',') if item.strip()]
+
+
+def _host_matches(host, patterns):
+    host = (host or '').lower()
+    return any(host == p or host.endswith('.' + p) for p in patterns)
+
+
+class _FilterProxyHandler(BaseHTTPRequestHandler):
+    """Обработчик локального прокси: пропускает разрешенные запросы и отклоняет остальные."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_CONNECT(self):
+        host, _, port = self.path.partition(':')
+        category = self.server.request_filter.match(host, '')
+        if category:
+            self.server.request_filter.count_blocked(category)
+            self.send_response(403)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        try:
+            upstream = socket.create_connection((host, int(port or 443)), timeout=30)
+        except OSError:
+            self.send_response(502)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200, 'Connection Established')
+        self.end_headers()
+        self.close_connection = True
+        self._tunnel(upstream)
+
+    def _tunnel(self, upstream):
+        sockets = [self.connection, upstream]
+        transferred = 0
+        try:
+            while True:
+                readable, _, errored = select.select(sockets, [], sockets, 60)
+                if errored or not readable:
+                    break
+                for sock in readable:
+                    chunk = sock.recv(65536)
+                    if not chunk:
+                        return
+                    other = upstream if sock is self.connection else self.connection
+                    other.sendall(chunk)
+                    if sock is upstream:
+                        transferred += len(chunk)
+        except OSError:
+            pass
+        finally:
+            upstream.close()
+            self.server.request_filter.count_transferred(transferred)
+
+    def _forward(self):
+        parts = urlsplit(self.path)
+        category = self.server.request_filter.match(parts.hostname, parts.path)
+        if category:
+            self.server.request_filter.count_blocked(category)
+            self.send_response(403)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in ('proxy-connection', 'connection')}
+        path = parts.path + ('?' + parts.query if parts.query else '')
+
+        try:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            conn.request(self.command, path or '/', body=body, headers=headers)
+            response = conn.getresponse()
+            payload = response.read()
+        except (OSError, http.client.HTTPException):
+            self.send_response(502)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(response.status, response.reason)
+        for key, value in response.getheaders():
+            if key.lower() not in ('transfer-encoding', 'connection', 'content-length'):
+                self.send_header(key, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        conn.close()
+        self.server.request_filter.count_transferred(len(payload))
+
+    do_GET = _forward
+    do_POST = _forward
+    do_HEAD = _forward
+    do_PUT = _forward
+    do_DELETE = _forward
+    do_OPTIONS = _forward
+
+
+class RequestFilter:
+    """
+    Фильтрация сетевых запросов Firefox во время сбора данных.
+
+    Поднимает локальный прокси с allow/deny списками по категориям (analytics, fonts, media),
+    включает постоянный дисковый кэш вместо полного отключения кэша и считает,
+    сколько запросов и байт было сэкономлено за запуск.
+    """
+
+    def __init__(self, categories=None, deny_hosts=None, allow_hosts=None, cache_dir=None, port=0):
+        """
+        :param categories: Список блокируемых категорий ('analytics', 'fonts', 'media')
+        :param deny_hosts: Дополнительные хосты для блокировки
+        :param allow_hosts: Хосты, которые никогда не блокируются
+        :param cache_dir: Каталог постоянного кэша Firefox (None - кэш не трогаем)
+        :param port: Порт прокси (0 - выбрать свободный)
+        """
+        self.categories = list(categories or [])
+        self.deny_hosts = list(deny_hosts or [])
+        self.allow_hosts = list(allow_hosts or [])
+        self.cache_dir = os.path.abspath(cache_dir) if cache_dir else None
+        self.port = port
+        self._server = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {
+            'blocked_requests': 0,
+            'blocked_by_category': {},
+            'proxied_bytes': 0,
+            'page_requests': 0,
+            'cached_requests': 0,
+            'cached_bytes': 0,
+            'transferred_bytes': 0,
+        }
+
+    @classmethod
+    def from_config(cls, config):
+        """Создает фильтр по настройкам config.txt или возвращает None, если фильтр выключен."""
+        if config.get('request_filter', 'false').lower() != 'true':
+            return None
+        return cls(
+            categories=_parse_list(config.get('filter_block', 'analytics,fonts,media')),
+            deny_hosts=_parse_list(config.get('filter_deny_hosts')),
+            allow_hosts=_parse_list(config.get('filter_allow_hosts')),
+            cache_dir=config.get('browser_cache_dir', 'browser_cache') or None,
+            port=int(config.get('filter_proxy_port', '0') or 0),
+        )
+
+    def match(self, host, path):
+        """Возвращает категорию, по которой запрос должен быть заблокирован, или None."""
+        if not host or _host_matches(host, self.allow_hosts):
+            return None
+        if _host_matches(host, self.deny_hosts):
+            return 'deny_list'
+        for category in self.categories:
+            if _host_matches(host, CATEGORY_HOSTS.get(category, [])):
+                return category
+            if path and path.lower().endswith(CATEGORY_EXTENSIONS.get(category, ())):
+                return category
+        return None
+
+    def count_blocked(self, category):
+        with self._lock:
+            self.stats['blocked_requests'] += 1
+            by_category = self.stats['blocked_by_category']
+            by_category[category] = by_category.get(category, 0) + 1
+
+    def count_transferred(self, size):
+        with self._lock:
+            self.stats['proxied_bytes'] += size
+
+    def start(self):
+        """Запускает прокси в фоновом потоке."""
+        self._server = ThreadingHTTPServer(('127.0.0.1', self.port), _FilterProxyHandler)
+        self._server.daemon_threads = True
+        self._server.request_filter = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        print(f"Фильтрующий прокси запущен на 127.0.0.1:{self.port} (категории: {', '.join(self.categories) or '-'})")
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def apply_to_options(self, options):
+        """Прописывает прокси, кэш и блокировки категорий в настройки Firefox."""
+        if self._server:
+            for scheme in ('http', 'ssl'):
+                options.set_preference(f"network.proxy.{scheme}", '127.0.0.1')
+                options.set_preference(f"network.proxy.{scheme}_port", self.port)
+            options.set_preference("network.proxy.type", 1)
+            options.set_preference("network.proxy.no_proxies_on", "")
+            options.set_preference("network.proxy.allow_hijacking_localhost", True)
+
+        for category in self.categories:
+            for key, value in CATEGORY_PREFERENCES.get(category, {}).items():
+                options.set_preference(key, value)
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            options.set_preference("browser.cache.disk.enable", True)
+            options.set_preference("browser.cache.memory.enable", True)
+            options.set_preference("network.http.use-cache", True)
+            options.set_preference("browser.cache.disk.parent_directory", self.cache_dir)
+            options.set_preference("browser.cache.disk.smart_size.enabled", False)
+            options.set_preference("browser.cache.disk.capacity", 1048576)
+            options.set_preference("browser.cache.check_doc_frequency", 3)
+            print(f"Постоянный кэш браузера: {self.cache_dir}")
+        else:
+            options.set_preference("browser.cache.disk.enable", False)
+            options.set_preference("browser.cache.memory.enable", False)
+            options.set_preference("network.http.use-cache", False)
+
+    def collect_resource_stats(self, driver):
+        """
+        Снимает статистику загруженных ресурсов текущей страницы (Resource Timing API).
+        Вызывается перед каждой сменой страницы/раздела.
+        """
+        try:
+            result = driver.execute_script(RESOURCE_STATS_SCRIPT) or {}
+        except Exception as e:
+            print(f"Предупреждение: Не удалось получить статистику ресурсов страницы: {e}")
+            return
+        with self._lock:
+            self.stats['page_requests'] += int(result.get('total') or 0)
+            self.stats['cached_requests'] += int(result.get('cached') or 0)
+            self.stats['cached_bytes'] += int(result.get('saved_bytes') or 0)
+            self.stats['transferred_bytes'] += int(result.get('transferred') or 0)
+
+    def report(self):
+        """Печатает итоговую статистику фильтрации и возвращает ее."""
+        stats = self.stats
+        print("\nСтатистика сетевых запросов браузера:")
+        print(f"  Заблокировано запросов: {stats['blocked_requests']}")
+        for category, count in sorted(stats['blocked_by_category'].items()):
+            print(f"    {category}: {count}")
+        print(f"  Запросов страницы: {stats['page_requests']}, из кэша: {stats['cached_requests']}")
+        print(f"  Сэкономлено кэшем: {stats['cached_bytes'] / 1024:.1f} КБ")
+        print(f"  Загружено по сети: {stats['transferred_bytes'] / 1024:.1f} КБ "
+              f"(через прокси: {stats['proxied_bytes'] / 1024:.1f} КБ)")
+        return stats
@@ -0,0 +1,402 @@
+import json
+import re
+import threading
+import time
+import zipfile
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import NoSuchElementException
+from page_helper import PageHelper
+from navigator import NavState
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+ARCHIVE_VERSION = 1
+URL_ATTRIBUTES = ('href', 'src')
+
+
+class ScrapeArchive:
+    """
+    Zip-архив записи сбора: снимки DOM страниц по (раздел, вид, нация) и HTTP-ответы
+    страниц техники и datamine. По нему шаги извлечения и объединения можно прогнать
+    без браузера и сети.
+
+    Структура: manifest.json, pages/NNNN.html, http/NNNNN.bin.
+    """
+
+    def __init__(self, path, mode='r'):
+        if mode not in ('r', 'w'):
+            raise ValueError(f"Неизвестный режим архива: {mode}")
+        self.path = path
+        self.mode = mode
+        self.pages = []
+        self.responses = {}
+        self._lock = threading.Lock()
+        self._http_count = 0
+        if mode == 'w':
+            self._zip = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=6)
+            self.created_at = time.strftime('%Y-%m-%d %H:%M:%S')
+            print(f"Запись страниц и HTTP-ответов в архив {path}")
+        else:
+            self._zip = zipfile.ZipFile(path)
+            manifest = json.loads(self._zip.read('manifest.json'))
+            if manifest.get('version') != ARCHIVE_VERSION:
+                raise ValueError(f"Неподдерживаемая версия архива {path}: {manifest.get('version')}")
+            self.created_at = manifest.get('created_at')
+            self.pages = manifest['pages']
+            self.responses = manifest['responses']
+            print(f"Архив {path} от {self.created_at}: {len(self.pages)} страниц, {len(self.responses)} HTTP-ответов")
+
+    @staticmethod
+    def _key(method, url):
+        return f"{method.upper()} {url}"
+
+    def add_page(self, section, view, html, url='', nation=None, nation_label=None):
+        with self._lock:
+            name = f"pages/{len(self.pages):04d}.html"
+            self._zip.writestr(name, html.encode('utf-8'))
+            self.pages.append({
+                'section': section, 'view': view, 'nation': nation, 'nation_label': nation_label,
+                'url': url, 'file': name,
+            })
+
+    def add_response(self, method, url, response):
+        """Сохраняет ответ по исходному URL запроса (повторная запись заменяет прежнюю)."""
+        with self._lock:
+            name = f"http/{self._http_count:05d}.bin"
+            self._http_count += 1
+            self._zip.writestr(name, response.content or b'')
+            self.responses[self._key(method, url)] = {
+                'file': name,
+                'url': response.url,
+                'status': response.status_code,
+                'reason': response.reason,
+                'encoding': response.encoding,
+                'headers': {k: v for k, v in response.headers.items()
+                            if k.lower() in ('content-type', 'etag', 'last-modified', 'date')},
+            }
+
+    def find_pages(self, section=None, view=None):
+        return [p for p in self.pages
+                if (section is None or p['section'] == section) and (view is None or p['view'] == view)]
+
+    def read_page(self, page):
+        return self._zip.read(page['file']).decode('utf-8')
+
+    def response(self, method, url):
+        """Возвращает (метаданные, тело) сохраненного ответа или None."""
+        entry = self.responses.get(self._key(method, url))
+        if entry is None:
+            return None
+        return entry, self._zip.read(entry['file'])
+
+    def close(self):
+        with self._lock:
+            if self._zip is None:
+                return
+            if self.mode == 'w':
+                manifest = {
+                    'version': ARCHIVE_VERSION,
+                    'created_at': self.created_at,
+                    'pages': self.pages,
+                    'responses': self.responses,
+                }
+                self._zip.writestr('manifest.json', json.dumps(manifest, ensure_ascii=False, indent=1))
+                print(f"Архив {self.path} сохранен: {len(self.pages)} страниц, {len(self.responses)} HTTP-ответов")
+            self._zip.close()
+            self._zip = None
+
+
+_recording_archive = None
+
+
+def start_recording(path):
+    """Открывает архив на запись; record_page и общая HTTP-сессия начинают писать в него."""
+    global _recording_archive
+    _recording_archive = ScrapeArchive(path, 'w')
+    return _recording_archive
+
+
+def stop_recording():
+    global _recording_archive
+    if _recording_archive is not None:
+        _recording_archive.close()
+        _recording_archive = None
+
+
+def record_page(driver, section, view, nation=None, nation_label=None, html=None):
+    """
+    Сохраняет текущий DOM страницы в архив, если идет запись. Ошибки записи не прерывают сбор.
+
+    :param html: Уже полученный page_source (чтобы не запрашивать его у браузера повторно)
+    """
+    archive = _recording_archive
+    if archive is None:
+        return
+    try:
+        archive.add_page(section, view, html if html is not None else driver.page_source, url=driver.current_url,
+                         nation=nation, nation_label=nation_label)
+    except Exception as e:
+        print(f"Предупреждение: Не удалось сохранить страницу '{section}' ({view}, {nation}) в архив: {e}")
+
+
+# --- Воспроизведение DOM: минимальная замена WebDriver поверх BeautifulSoup ---
+
+_XPATH_RE = re.compile(r"^\./(ancestor::)?([\w*-]+)((?:\[[^\]]+\])*)$")
+_PREDICATE_RE = re.compile(r"\[([^\]]+)\]")
+_CONTAINS_RE = re.compile(r"^contains\(@([\w-]+),\s*'([^']*)'\)$")
+_EQUALS_RE = re.compile(r"^@([\w-]+)\s*=\s*'([^']*)'$")
+
+
+def _attr_string(tag, name):
+    value = tag.get(name)
+    if isinstance(value, list):
+        return ' '.join(value)
+    return value
+
+
+def _matches_predicates(tag, predicates):
+    for predicate in predicates:
+        contains = _CONTAINS_RE.match(predicate)
+        equals = _EQUALS_RE.match(predicate)
+        if contains:
+            if contains.group(2) not in (_attr_string(tag, contains.group(1)) or ''):
+                return False
+        elif equals:
+            if _attr_string(tag, equals.group(1)) != equals.group(2):
+                return False
+        else:
+            raise ValueError(f"Условие XPath не поддерживается при воспроизведении: [{predicate}]")
+    return True
+
+
+def _select_xpath(tag, xpath):
+    """
+    Подмножество XPath, которое используют экстракторы: './tag' и './ancestor::tag[условия][N]'
+    с условиями contains(@attr, '...') и @attr='...'.
+    """
+    match = _XPATH_RE.match(xpath.strip())
+    if not match:
+        raise ValueError(f"XPath не поддерживается при воспроизведении: {xpath}")
+    ancestor, name, predicate_text = match.groups()
+    predicates = _PREDICATE_RE.findall(predicate_text)
+    position = None
+    if predicates and predicates[-1].isdigit():
+        position = int(predicates.pop())
+
+    candidates = tag.parents if ancestor else tag.find_all(recursive=False)
+    found = [t for t in candidates
+             if getattr(t, 'name', None) and (name == '*' or t.name == name) and _matches_predicates(t, predicates)]
+    if position is not None:
+        return found[position - 1:position]
+    return found
+
+
+class _ReplaySearch:
+    """Поиск элементов по локаторам Selenium внутри узла BeautifulSoup."""
+
+    def _root(self):
+        raise NotImplementedError
+
+    def find_elements(self, by=By.ID, value=None):
+        root = self._root()
+        if by == By.CSS_SELECTOR:
+            tags = root.select(value)
+        elif by == By.CLASS_NAME:
+            tags = root.select('.' + value)
+        elif by == By.TAG_NAME:
+            tags = root.find_all(value)
+        elif by == By.ID:
+            tags = root.select('#' + value)
+        elif by == By.XPATH:
+            tags = _select_xpath(root, value)
+        else:
+            raise ValueError(f"Локатор не поддерживается при воспроизведении: {by}")
+        return [ReplayElement(t, self._page) for t in tags]
+
+    def find_element(self, by=By.ID, value=None):
+        found = self.find_elements(by, value)
+        if not found:
+            raise NoSuchElementException(f"Элемент не найден в архивной странице: {by}={value}")
+        return found[0]
+
+
+class ReplayElement(_ReplaySearch):
+    """Элемент архивной страницы с интерфейсом WebElement, достаточным для экстракторов."""
+
+    def __init__(self, tag, page):
+        self.tag = tag
+        self._page = page
+
+    def _root(self):
+        return self.tag
+
+    def __eq__(self, other):
+        return isinstance(other, ReplayElement) and other.tag is self.tag
+
+    def __hash__(self):
+        return id(self.tag)
+
+    @property
+    def tag_name(self):
+        return self.tag.name
+
+    @property
+    def text(self):
+        text = self.tag.get_text(' ').replace('\xa0', ' ')
+        return ' '.join(text.split())
+
+    def get_attribute(self, name):
+        value = _attr_string(self.tag, name)
+        if value is not None and name in URL_ATTRIBUTES:
+            return urljoin(self._page.current_url, value)
+        return value
+
+    def click(self):
+        pass
+
+
+class ReplayDriver(_ReplaySearch):
+    """Заменяет WebDriver при воспроизведении: отдает элементы загруженной архивной страницы."""
+
+    def __init__(self):
+        self.soup = BeautifulSoup('', HTML_PARSER)
+        self.current_url = ''
+        self.page_source = ''
+        self._page = self
+
+    def load(self, html, url=''):
+        self.page_source = html
+        self.current_url = url
+        self.soup = BeautifulSoup(html, HTML_PARSER)
+
+    def _root(self):
+        return self.soup
+
+    @property
+    def title(self):
+        return self.soup.title.get_text().strip() if self.soup.title else ''
+
+    def execute_script(self, script, *args):
+        return None
+
+    def get_cookies(self):
+        return []
+
+    def quit(self):
+        pass
+
+
+class ReplayNavigator:
+    """Navigator для воспроизведения: переход в состояние загружает его архивный снимок."""
+
+    def __init__(self, helper, archive):
+        self.helper = helper
+        self.archive = archive
+        self.failed_states = []
+
+    def _page(self, state):
+        for page in self.archive.find_pages(state.section, state.view):
+            if state.nation is None or state.nation in (page['nation'], page['nation_label']):
+                return page
+        return None
+
+    def _load(self, page):
+        self.helper.driver.load(self.archive.read_page(page), page.get('url', ''))
+
+    def goto(self, state):
+        page = self._page(state)
+        if page is None:
+            print(f"В архиве нет страницы для {state}")
+            self.failed_states.append(state)
+            return False
+        self._load(page)
+        return True
+
+    def tree_states(self, section):
+        return [NavState(section, 'tree', page['nation'], page['nation_label'])
+                for page in self.archive.find_pages(section, 'tree')]
+
+    def iter_states(self, sections, views=('tree',), nations=None):
+        wanted = {n.lower() for n in nations} if nations else None
+        for section in sections:
+            for view in views:
+                for page in self.archive.find_pages(section, view):
+                    if wanted is not None and (page['nation'] or '').lower() not in wanted \
+                            and (page['nation_label'] or '').lower() not in wanted:
+                        continue
+                    self._load(page)
+                    yield NavState(section, view, page['nation'], page['nation_label'])
+
+
+class ReplayBrowserSession:
+    """Замена BrowserSession при воспроизведении: страницы берутся из архива, браузер не запускается."""
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.request_filter = None
+        self.driver = None
+        self.helper = None
+        self.navigator = None
+
+    def start(self):
+        if self.driver is None:
+            self.driver = ReplayDriver()
+            self.helper = PageHelper(self.driver, wait_timeout=1)
+            self.navigator = ReplayNavigator(self.helper, self.archive)
+        return self
+
+    def open_flags_page(self, section):
+        self.start()
+        self.navigator.goto(NavState(section, 'flags'))
+
+    def run_unit(self, state, work):
+        self.start()
+        return work()
+
+    def collect_resource_stats(self):
+        pass
+
+    def close(self):
+        self.driver = None
+
+
+# --- Воспроизведение HTTP ---
+
+class ArchiveAdapter(BaseAdapter):
+    """Транспорт requests, отдающий сохраненные в архиве ответы (404 для отсутствующих)."""
+
+    def __init__(self, archive):
+        super().__init__()
+        self.archive = archive
+
+    def send(self, request, **kwargs):
+        response = Response()
+        response.request = request
+        response.url = request.url
+        response._content_consumed = True
+        stored = self.archive.response(request.method, request.url)
+        if stored is None:
+            print(f"В архиве нет ответа для {request.method} {request.url}")
+            response.status_code = 404
+            response.reason = 'Not In Archive'
+            response._content = b''
+            return response
+        entry, body = stored
+        response.status_code = entry['status']
+        response.reason = entry.get('reason')
+        response.headers = CaseInsensitiveDict(entry.get('headers') or {})
+        response.encoding = entry.get('encoding')
+        response._content = body
+        return response
+
+    def close(self):
+        pass
@@ -0,0 +1,177 @@
+import argparse
+import signal
+import sys
+import threading
+import time
+import traceback
+from main import read_config, BrowserSession, collect_country_flags, collect_section_tree_by_clicks
+from navigator import NavState
+from data_utils import get_section_list_data, get_nation_tree_data, fetch_unit_cards
+from driver_supervisor import DriverRecoveryError
+from request_filter import RequestFilter
+from http_session import configure_shared_session
+from rate_limiter import configure_shared_limiter
+from page_payload import configure_shared_capture
+from work_queue import open_queue, unit_spec, worker_name
+
+
+class ScrapeWorker:
+    """
+    Работник распределенного сбора: берет единицы из общей очереди в аренду, выполняет их тем же
+    кодом, что и локальные шаги (PageHelper, TreeDataExtractor, VehicleDataFetcher), и отдает результат.
+    Пока единица выполняется, аренда продлевается в фоне; если работник умер, координатор
+    вернет единицу в очередь по истечении аренды.
+    """
+
+    def __init__(self, config, queue, request_filter=None, name=None):
+        self.config = config
+        self.queue = queue
+        self.request_filter = request_filter
+        self.name = name or worker_name()
+        self.lease_seconds = float(config.get('distributed_lease_seconds', '300'))
+        self.browser = BrowserSession(config, request_filter)
+        self.handlers = {
+            'flags': self.run_flags,
+            'list': self.run_list,
+            'tree_section': self.run_tree_section,
+            'tree': self.run_tree,
+            'unit_cards': self.run_unit_cards,
+        }
+        self.stats = {'done': 0, 'failed': 0, 'lost': 0}
+        self._stopping = threading.Event()
+
+    def run_flags(self, params, seq):
+        section = params['section']
+        return self.browser.run_unit(NavState(section, 'flags'), lambda: collect_country_flags(self.browser, section)), []
+
+    def run_list(self, params, seq):
+        self.browser.start()
+        section = params['section']
+        return self.browser.run_unit(
+            NavState(section, 'list'),
+            lambda: get_section_list_data(self.browser.helper, section, navigator=self.browser.navigator,
+                                          fetch_exp=False, strict=True)), []
+
+    def run_tree_section(self, params, seq):
+        """Нации раздела становятся отдельными единицами; без навигатора раздел собирается кликами целиком."""
+        self.browser.start()
+        section = params['section']
+        if self.browser.navigator:
+            states = self.browser.run_unit(NavState(section, 'tree'),
+                                           lambda: self.browser.navigator.tree_states(section))
+            if states:
+                return [], [unit_spec('tree', f"{section}/{state.nation}",
+                                      {'section': section, 'nation': state.nation, 'nation_label': state.nation_label},
+                                      seq + [index])
+                            for index, state in enumerate(states)]
+            print(f"Навигатор не нашел нации раздела '{section}', переход по кликам.")
+        return self.browser.run_unit(NavState(section, 'tree'),
+                                     lambda: collect_section_tree_by_clicks(self.browser, section)), []
+
+    def run_tree(self, params, seq):
+        self.browser.start()
+        state = NavState(params['section'], 'tree', params['nation'], params.get('nation_label'))
+        if not self.browser.navigator:
+            raise RuntimeError("Единицы tree по нациям требуют navigation_mode=deep_link")
+        nodes = self.browser.run_unit(state, lambda: get_nation_tree_data(self.browser.navigator, state))
+        if nodes is None:
+            raise RuntimeError(f"Не удалось перейти к {state}")
+        return nodes, []
+
+    def run_unit_cards(self, params, seq):
+        cards = fetch_unit_cards(params['vehicles'], max_workers=int(self.config.get('http_pool_size', '16')),
+                                 researchable_only=params.get('researchable_only', False))
+        return [card.as_row() for card in cards], []
+
+    def _keep_lease(self, unit, finished):
+        while not finished.wait(self.lease_seconds / 3):
+            if not self.queue.extend(unit, self.lease_seconds):
+                print(f"Работник {self.name}: аренда {unit} потеряна, результат будет отброшен.")
+                return
+
+    def execute(self, unit):
+        print(f"\nРаботник {self.name}: {unit.kind} {unit.params if unit.kind != 'unit_cards' else ''} ({unit})")
+        started = time.time()
+        finished = threading.Event()
+        heartbeat = threading.Thread(target=self._keep_lease, args=(unit, finished), daemon=True)
+        heartbeat.start()
+        try:
+            handler = self.handlers.get(unit.kind)
+            if handler is None:
+                raise ValueError(f"Неизвестный вид единицы: {unit.kind}")
+            result, children = handler(unit.params, unit.seq)
+        except Exception as e:
+            finished.set()
+            print(f"Работник {self.name}: ошибка {unit}: {e}")
+            print(traceback.format_exc())
+            self.queue.fail(unit, e)
+            self.stats['failed'] += 1
+            if isinstance(e, DriverRecoveryError):
+                # Сторож не смог восстановить драйвер - следующая единица начнет с нового браузера
+                self.browser.close()
+                self.browser = BrowserSession(self.config, self.request_filter)
+            return
+        finished.set()
+        if self.queue.complete(unit, result, children):
+            self.stats['done'] += 1
+            print(f"Работник {self.name}: {unit} выполнена за {time.time() - started:.1f} сек."
+                  + (f", новых единиц: {len(children)}" if children else ""))
+        else:
+            self.stats['lost'] += 1
+            print(f"Работник {self.name}: {unit} уже передана другому работнику, результат отброшен.")
+
+    def run(self, idle_exit=0, poll=1.0):
+        """Берет единицы, пока не остановлен; при idle_exit > 0 завершается после стольких секунд пустой очереди."""
+        print(f"Работник {self.name} запущен.")
+        idle_since = time.time()
+        while not self._stopping.is_set():
+            unit = self.queue.claim(self.name, self.lease_seconds)
+            if unit is None:
+                if idle_exit and time.time() - idle_since > idle_exit:
+                    print(f"Работник {self.name}: очередь пуста {idle_exit:g} сек., завершение.")
+                    break
+                time.sleep(poll)
+                continue
+            self.execute(unit)
+            idle_since = time.time()
+
+    def stop(self):
+        self._stopping.set()
+
+    def close(self):
+        self.browser.close()
+        s = self.stats
+        print(f"Работник {self.name}: выполнено {s['done']}, ошибок {s['failed']}, потеряно аренд {s['lost']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Работник распределенного сбора (distributed=true в config.txt).")
+    parser.add_argument('--config', default='config.txt', help="Путь к конфигурационному файлу")
+    parser.add_argument('--queue', help="Очередь (по умолчанию queue_url из config.txt)")
+    parser.add_argument('--idle-exit', type=float, default=0,
+                        help="Завершиться после стольких секунд пустой очереди (0 - работать, пока не остановят)")
+    args = parser.parse_args(argv)
+
+    config = read_config(args.config)
+    configure_shared_limiter(config)
+    configure_shared_session(config)
+    configure_shared_capture(config)
+    request_filter = RequestFilter.from_config(config)
+    if request_filter:
+        request_filter.start()
+    worker = ScrapeWorker(config, open_queue(args.queue or config.get('queue_url', 'sqlite:///work_queue.sqlite')),
+                          request_filter)
+    # SIGTERM от координатора - штатное завершение с закрытием браузера
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        worker.run(idle_exit=args.idle_exit)
+    except KeyboardInterrupt:
+        print("Работник остановлен.")
+    finally:
+        worker.close()
+        if request_filter:
+            request_filter.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+import json
+import queue
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from main import read_config, start_browser_session, TARGET_SECTIONS
+from data_utils import (get_section_list_data, get_all_nation_tree_data, get_section_tree_data_via_navigator,
+                        open_section, show_tree_view)
+from navigator import Navigator
+from vehicle_get_required_exp import VehicleDataFetcher
+from request_filter import RequestFilter
+from http_session import configure_shared_session
+from rate_limiter import configure_shared_limiter
+from page_payload import configure_shared_capture
+from driver_supervisor import is_dead_session_error
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+_DONE = object()
+
+
+class Job:
+    """Задание демона: тип, параметры и очередь событий для потоковой отдачи результата."""
+
+    def __init__(self, job_type, params):
+        self.job_type = job_type
+        self.params = params
+        self.events = queue.Queue()
+
+    def emit(self, event, **payload):
+        payload['event'] = event
+        self.events.put(payload)
+
+
+class ScraperDaemon:
+    """
+    Долгоживущий процесс с "теплым" браузером и PageHelper.
+
+    Задания принимаются по локальному HTTP API и выполняются строго по одному
+    в рабочем потоке, владеющем драйвером. Браузер перезапускается после
+    daemon_recycle_jobs заданий или при росте памяти выше daemon_max_rss_mb.
+    """
+
+    JOB_TYPES = ('refresh_section', 'refresh_nation_tree', 'required_exp')
+
+    def __init__(self, config, request_filter=None):
+        self.config = config
+        self.request_filter = request_filter
+        self.rate_limiter = configure_shared_limiter(config)
+        self.http_session = configure_shared_session(config)
+        configure_shared_capture(config)
+        self.recycle_jobs = int(config.get('daemon_recycle_jobs', '50'))
+        self.max_rss_mb = int(config.get('daemon_max_rss_mb', '2048'))
+        self.driver = None
+        self.helper = None
+        self.navigator = None
+        self.jobs_since_start = 0
+        self.jobs_total = 0
+        self.browser_starts = 0
+        self.current_job = None
+        self._jobs = queue.Queue()
+        self._stopping = threading.Event()
+
+    def submit(self, job_type, params):
+        if job_type not in self.JOB_TYPES:
+            raise ValueError(f"Неизвестный тип задания: {job_type}")
+        job = Job(job_type, params)
+        self._jobs.put(job)
+        return job
+
+    def status(self):
+        return {
+            'browser_running': self.driver is not None,
+            'browser_starts': self.browser_starts,
+            'jobs_total': self.jobs_total,
+            'jobs_since_start': self.jobs_since_start,
+            'queued': self._jobs.qsize(),
+            'current_job': self.current_job,
+            'browser_rss_mb': self._browser_rss_mb(),
+            'rate_limits': self.rate_limiter.metrics(),
+        }
+
+    def _ensure_browser(self):
+        if self.driver is None:
+            print("Демон: запуск браузера...")
+            self.driver, self.helper = start_browser_session(self.config, self.request_filter)
+            self.navigator = Navigator.from_config(self.helper, self.config)
+            self.http_session.attach_driver(self.driver, self.helper)
+            self.browser_starts += 1
+            self.jobs_since_start = 0
+
+    def _stop_browser(self):
+        if self.driver is not None:
+            self.http_session.detach_driver()
+            try:
+                self.driver.quit()
+                print("Демон: браузер закрыт.")
+            except Exception as e:
+                print(f"Ошибка при закрытии браузера: {e}")
+        self.driver = None
+        self.helper = None
+        self.navigator = None
+
+    def _browser_rss_mb(self):
+        """Суммарная память geckodriver и дочерних процессов Firefox (если доступен psutil)."""
+        if psutil is None or self.driver is None:
+            return None
+        try:
+            process = psutil.Process(self.driver.service.process.pid)
+            total = process.memory_info().rss
+            for child in process.children(recursive=True):
+                total += child.memory_info().rss
+            return round(total / (1024 * 1024), 1)
+        except Exception:
+            return None
+
+    def _maybe_recycle(self):
+        rss = self._browser_rss_mb()
+        if self.jobs_since_start >= self.recycle_jobs:
+            print(f"Демон: перезапуск браузера после {self.jobs_since_start} заданий.")
+            self._stop_browser()
+        elif rss is not None and rss > self.max_rss_mb:
+            print(f"Демон: перезапуск браузера, память {rss} МБ > {self.max_rss_mb} МБ.")
+            self._stop_browser()
+
+    def _run_job(self, job):
+        params = job.params
+        if job.job_type == 'refresh_section':
+            section = params.get('section')
+            if section not in TARGET_SECTIONS:
+                raise ValueError(f"Неизвестный раздел: {section}")
+            self._ensure_browser()
+            return len(get_section_list_data(self.helper, section, on_item=lambda d: job.emit('item', data=d),
+                                             navigator=self.navigator))
+
+        if job.job_type == 'refresh_nation_tree':
+            section = params.get('section')
+            nation = params.get('nation')
+            if section not in TARGET_SECTIONS or not nation:
+                raise ValueError("Для refresh_nation_tree нужны параметры section и nation")
+            self._ensure_browser()
+            if self.navigator:
+                nodes = get_section_tree_data_via_navigator(self.navigator, section, nations=[nation],
+                                                            on_item=lambda d: job.emit('item', data=d))
+                if nodes:
+                    return len(nodes)
+            open_section(self.helper, section)
+            show_tree_view(self.helper)
+            nodes = get_all_nation_tree_data(self.helper, section, nations=[nation],
+                                             on_item=lambda d: job.emit('item', data=d))
+            return len(nodes)
+
+        # required_exp не требует браузера
+        base_url = self.config['start_url'].rstrip('/')
+        count = 0
+        for unit_id in params.get('ids') or []:
+            data = {'data_ulist_id': unit_id, 'link': f"{base_url}/unit/{unit_id}", 'silver': '1'}
+            data = VehicleDataFetcher.fetch_required_exp(data)
+            job.emit('item', data={'data_ulist_id': unit_id, 'required_exp': data.get('required_exp')})
+            count += 1
+        return count
+
+    def serve_jobs(self, warm_start=True):
+        """Рабочий цикл: выполняет задания по очереди в одном потоке с драйвером."""
+        if warm_start:
+            try:
+                self._ensure_browser()
+            except Exception as e:
+                print(f"Демон: не удалось заранее запустить браузер: {e}")
+        while not self._stopping.is_set():
+            try:
+                job = self._jobs.get(timeout=1)
+            except queue.Empty:
+                continue
+            self.current_job = job.job_type
+            started = time.time()
+            job.emit('started', job=job.job_type, params=job.params)
+            try:
+                count = self._run_job(job)
+                job.emit('done', count=count, seconds=round(time.time() - started, 2))
+            except Exception as e:
+                print(f"Демон: ошибка выполнения задания {job.job_type}: {e}")
+                print(traceback.format_exc())
+                job.emit('error', message=str(e))
+                if is_dead_session_error(e):
+                    self._stop_browser()
+            finally:
+                job.events.put(_DONE)
+                self.current_job = None
+                self.jobs_total += 1
+                self.jobs_since_start += 1
+                self._maybe_recycle()
+        self._stop_browser()
+
+    def stop(self):
+        self._stopping.set()
+
+
+class _DaemonRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, payload):
+        line = (json.dumps(payload, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+        self.wfile.write(f"{len(line):x}\r\n".encode('ascii') + line + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == '/status':
+            self._send_json(200, self.server.scraper_daemon.status())
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            self._send_json(404, {'error': 'not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(request, dict):
+                raise ValueError("Тело запроса должно быть JSON-объектом")
+            job = self.server.scraper_daemon.submit(request.get('type'), request)
+        except (ValueError, json.JSONDecodeError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+
+        # Результаты отдаются потоком NDJSON по мере готовности
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            while True:
+                event = job.events.get()
+                if event is _DONE:
+                    break
+                self._write_chunk(event)
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            print("Демон: клиент отключился до завершения задания.")
+
+
+def run_daemon(config):
+    """Запускает HTTP API демона и рабочий поток с браузером."""
+    request_filter = RequestFilter.from_config(config)
+    if request_filter:
+        request_filter.start()
+    daemon = ScraperDaemon(config, request_filter)
+    host = config.get('daemon_host', '127.0.0.1')
+    port = int(config.get('daemon_port', '8765'))
+    server = ThreadingHTTPServer((host, port), _DaemonRequestHandler)
+    server.daemon_threads = True
+    server.scraper_daemon = daemon
+
+    warm_start = config.get('daemon_warm_start', 'true').lower() == 'true'
+    worker = threading.Thread(target=daemon.serve_jobs, args=(warm_start,), daemon=True)
+    worker.start()
+
+    print(f"Демон запущен на http://{host}:{port} (POST /jobs, GET /status)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nОстановка демона...")
+    finally:
+        server.server_close()
+        daemon.stop()
+        worker.join(timeout=30)
+        if request_filter:
+            request_filter.report()
+            request_filter.stop()
+
+
+if __name__ == "__main__":
+    run_daemon(read_config())
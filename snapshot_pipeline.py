@@ -0,0 +1,64 @@
+import io
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from page_helper import PageHelper
+from scrape_archive import ReplayDriver
+from tree_data_extractor import TreeDataExtractor
+
+
+def parse_tree_snapshot(html, url=''):
+    """
+    Выполняется в процессе пула: извлекает узлы дерева из снимка page_source.
+    Вывод экстрактора возвращается вместе с узлами, чтобы не перемешивался с выводом других процессов.
+    """
+    log = io.StringIO()
+    with redirect_stdout(log):
+        driver = ReplayDriver()
+        driver.load(html, url)
+        nodes = TreeDataExtractor(PageHelper(driver, wait_timeout=1)).extract_nodes()
+    return nodes, log.getvalue()
+
+
+class SnapshotParser:
+    """
+    Разбор снимков страниц в пуле процессов параллельно с навигацией браузера.
+
+    submit не дает накопиться больше max_pending неразобранных снимков (ограниченная очередь):
+    браузер ждет, если парсеры не успевают. results возвращает результаты в порядке submit,
+    независимо от того, какой процесс закончил раньше.
+    """
+
+    def __init__(self, workers=2, max_pending=None):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending or self.workers * 2
+        self._pool = None
+        self._submitted = []
+
+    def __enter__(self):
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._pool.shutdown(wait=exc_type is None, cancel_futures=exc_type is not None)
+        self._pool = None
+
+    def submit(self, key, html, url=''):
+        while True:
+            pending = [f for _, f in self._submitted if not f.done()]
+            if len(pending) < self.max_pending:
+                break
+            wait(pending, return_when=FIRST_COMPLETED)
+        self._submitted.append((key, self._pool.submit(parse_tree_snapshot, html, url)))
+
+    def results(self):
+        """Пары (key, узлы) в порядке отправки; при ошибке разбора вместо узлов - None."""
+        for key, future in self._submitted:
+            try:
+                nodes, log = future.result()
+            except Exception as e:
+                print(f"Ошибка разбора снимка {key}: {e}")
+                yield key, None
+                continue
+            print(log, end='')
+            yield key, nodes
+        self._submitted = []
@@ -0,0 +1,337 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from build_graph import file_hash
+
+# Виды записей: файл конвейера и функция ключа строки (по ключу запись сравнивается между снимками)
+KINDS = {
+    'node': lambda row: (row.get('data_ulist_id') or row.get('external_id') or '').strip(),
+    'dependency': lambda row: f"{row.get('node_external_id', '').strip()}>{row.get('prerequisite_external_id', '').strip()}",
+    'rank': lambda row: f"{row.get('nation', '').strip()}|{row.get('vehicle_type', '').strip()}|"
+                        f"{row.get('target_rank', '').strip()}",
+}
+DEFAULT_FILES = {
+    'node': 'vehicles_merged.csv',
+    'dependency': 'dependencies.csv',
+    'rank': 'rank_requirements.csv',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    hash BLOB PRIMARY KEY,
+    kind TEXT NOT NULL,
+    body TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patch TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    sources TEXT NOT NULL,
+    fieldnames TEXT NOT NULL,
+    counts TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id),
+    hash BLOB REFERENCES records(hash),
+    PRIMARY KEY (kind, key, snapshot_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS changes_by_snapshot ON changes(snapshot_id);
+"""
+
+
+class SnapshotNotFoundError(LookupError):
+    """В хранилище нет снимка с таким патчем или номером."""
+
+
+def record_hash(kind, row):
+    """sha256 канонического JSON строки: одинаковые записи разных снимков хранятся один раз."""
+    body = json.dumps(row, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f"{kind}\n{body}".encode('utf-8')).digest(), body
+
+
+def _read_rows(path):
+    if not path or not os.path.exists(path):
+        return [], []
+    with open(path, encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        return list(reader), list(reader.fieldnames or [])
+
+
+class SnapshotStore:
+    """
+    Версионированное хранилище узлов, зависимостей и требований рангов.
+
+    Каждая запись хранится один раз по хэшу содержимого (records), а снимок записывает
+    только изменившиеся относительно предыдущего снимка ключи (changes, hash NULL - удаление).
+    Поэтому хранилище растет с объемом изменений, а не с числом запусков.
+    Состояние "на патч P" - последнее изменение каждого ключа не позже снимка P.
+    """
+
+    def __init__(self, path='snapshots.sqlite'):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def snapshots(self):
+        rows = self.conn.execute("""
+            SELECT s.*, (SELECT COUNT(*) FROM changes c WHERE c.snapshot_id = s.id) AS changed
+            FROM snapshots s ORDER BY s.id""").fetchall()
+        return [{'id': row['id'], 'patch': row['patch'], 'created_at': row['created_at'],
+                 'counts': json.loads(row['counts']), 'changed': row['changed']} for row in rows]
+
+    def resolve(self, ref):
+        """
+        Номер снимка по ссылке: метка патча (последний снимок с ней), '#<номер>' или 'latest'.
+
+        :raises SnapshotNotFoundError: Если снимка нет
+        """
+        ref = str(ref).strip()
+        if ref == 'latest':
+            row = self.conn.execute("SELECT MAX(id) AS id FROM snapshots").fetchone()
+        elif ref.startswith('#') and ref[1:].isdigit():
+            row = self.conn.execute("SELECT id FROM snapshots WHERE id = ?", (int(ref[1:]),)).fetchone()
+        else:
+            row = self.conn.execute("SELECT MAX(id) AS id FROM snapshots WHERE patch = ?", (ref,)).fetchone()
+        if row is None or row['id'] is None:
+            raise SnapshotNotFoundError(f"Снимок '{ref}' не найден в {self.path}")
+        return row['id']
+
+    def _state_hashes(self, snapshot_id):
+        """{(вид, ключ): хэш} на момент снимка - по индексу (kind, key, snapshot_id), без полных копий."""
+        # В SQLite столбцы рядом с MAX() берутся из строки с максимумом
+        rows = self.conn.execute("""
+            SELECT kind, key, hash, MAX(snapshot_id) FROM changes
+            WHERE snapshot_id <= ? GROUP BY kind, key""", (snapshot_id,))
+        return {(row['kind'], row['key']): row['hash'] for row in rows if row['hash'] is not None}
+
+    def _bodies(self, hashes):
+        bodies = {}
+        hashes = list(hashes)
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            query = f"SELECT hash, body FROM records WHERE hash IN ({','.join('?' * len(chunk))})"
+            bodies.update((row['hash'], json.loads(row['body'])) for row in self.conn.execute(query, chunk))
+        return bodies
+
+    def add_snapshot(self, patch, files=None):
+        """
+        Записывает снимок файлов конвейера под меткой патча.
+
+        Если данные и метка совпадают с последним снимком, новый снимок не создается.
+
+        :param patch: Метка версии игры (патча)
+        :param files: {вид: путь к CSV} (по умолчанию DEFAULT_FILES)
+        :return: (номер снимка, {вид: {'added', 'changed', 'removed'}})
+        """
+        files = dict(DEFAULT_FILES, **(files or {}))
+        current, fieldnames, counts = {}, {}, {}
+        for kind, key_of in KINDS.items():
+            rows, fieldnames[kind] = _read_rows(files.get(kind))
+            for row in rows:
+                key = key_of(row)
+                if not key.strip('>|') or (kind, key) in current:
+                    continue
+                current[(kind, key)] = record_hash(kind, row)
+            counts[kind] = sum(1 for k in current if k[0] == kind)
+
+        latest = self.conn.execute("SELECT id, patch, fieldnames FROM snapshots ORDER BY id DESC LIMIT 1").fetchone()
+        previous = self._state_hashes(latest['id']) if latest else {}
+        changes = [(kind, key, digest) for (kind, key), (digest, _) in current.items()
+                   if previous.get((kind, key)) != digest]
+        changes += [(kind, key, None) for (kind, key) in previous if (kind, key) not in current]
+
+        stats = {kind: {'added': 0, 'changed': 0, 'removed': 0} for kind in KINDS}
+        for kind, key, digest in changes:
+            action = 'removed' if digest is None else 'changed' if (kind, key) in previous else 'added'
+            stats[kind][action] += 1
+
+        fieldnames_json = json.dumps(fieldnames, ensure_ascii=False)
+        if latest and not changes and latest['patch'] == patch and latest['fieldnames'] == fieldnames_json:
+            return latest['id'], stats
+
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO snapshots (patch, created_at, sources, fieldnames, counts) VALUES (?, ?, ?, ?, ?)",
+                (patch, time.strftime('%Y-%m-%d %H:%M:%S'),
+                 json.dumps({kind: {'path': path, 'sha256': file_hash(path)} for kind, path in files.items()}),
+                 fieldnames_json, json.dumps(counts)))
+            snapshot_id = cursor.lastrowid
+            self.conn.executemany("INSERT OR IGNORE INTO records (hash, kind, body) VALUES (?, ?, ?)",
+                                  ((digest, kind, current[(kind, key)][1])
+                                   for kind, key, digest in changes if digest is not None))
+            self.conn.executemany("INSERT INTO changes (kind, key, snapshot_id, hash) VALUES (?, ?, ?, ?)",
+                                  ((kind, key, snapshot_id, digest) for kind, key, digest in changes))
+        return snapshot_id, stats
+
+    def as_of(self, ref):
+        """
+        Данные на патч ref.
+
+        :return: {вид: {'fieldnames': [...], 'rows': [строки CSV]}}
+        """
+        snapshot_id = self.resolve(ref)
+        state = self._state_hashes(snapshot_id)
+        bodies = self._bodies(set(state.values()))
+        row = self.conn.execute("SELECT fieldnames FROM snapshots WHERE id = ?", (snapshot_id,)).fetchone()
+        fieldnames = json.loads(row['fieldnames'])
+        result = {kind: {'fieldnames': fieldnames.get(kind, []), 'rows': []} for kind in KINDS}
+        for (kind, _), digest in sorted(state.items()):
+            result[kind]['rows'].append(bodies[digest])
+        return result
+
+    def export(self, ref, out_dir):
+        """Записывает CSV-файлы конвейера на патч ref в out_dir (строки упорядочены по ключу)."""
+        os.makedirs(out_dir, exist_ok=True)
+        paths = {}
+        for kind, data in self.as_of(ref).items():
+            path = os.path.join(out_dir, DEFAULT_FILES[kind])
+            fieldnames = data['fieldnames'] or sorted({name for row in data['rows'] for name in row})
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+                writer.writeheader()
+                writer.writerows(data['rows'])
+            paths[kind] = path
+        return paths
+
+    def diff(self, old_ref, new_ref):
+        """
+        Различия между патчами old_ref и new_ref.
+
+        Рассматриваются только ключи, менявшиеся в снимках между ними, а не полные наборы данных.
+
+        :return: {вид: {'added': [...], 'removed': [...], 'changed': [{'key', 'fields': {поле: [было, стало]}}]}}
+        """
+        old_id, new_id = self.resolve(old_ref), self.resolve(new_ref)
+        low, high = min(old_id, new_id), max(old_id, new_id)
+        rows = self.conn.execute("""
+            WITH touched AS (
+                SELECT DISTINCT kind, key FROM changes WHERE snapshot_id > :low AND snapshot_id <= :high
+            )
+            SELECT t.kind, t.key,
+                (SELECT hash FROM changes c WHERE c.kind = t.kind AND c.key = t.key AND c.snapshot_id <= :old
+                 ORDER BY c.snapshot_id DESC LIMIT 1) AS old_hash,
+                (SELECT hash FROM changes c WHERE c.kind = t.kind AND c.key = t.key AND c.snapshot_id <= :new
+                 ORDER BY c.snapshot_id DESC LIMIT 1) AS new_hash
+            FROM touched t ORDER BY t.kind, t.key""",
+            {'low': low, 'high': high, 'old': old_id, 'new': new_id}).fetchall()
+        rows = [row for row in rows if row['old_hash'] != row['new_hash']]
+        bodies = self._bodies({row[column] for row in rows for column in ('old_hash', 'new_hash') if row[column]})
+
+        result = {kind: {'added': [], 'removed': [], 'changed': []} for kind in KINDS}
+        for row in rows:
+            old, new = bodies.get(row['old_hash']), bodies.get(row['new_hash'])
+            if old is None:
+                result[row['kind']]['added'].append(new)
+            elif new is None:
+                result[row['kind']]['removed'].append(old)
+            else:
+                fields = {name: [old.get(name), new.get(name)] for name in dict(old, **new)
+                          if old.get(name) != new.get(name)}
+                result[row['kind']]['changed'].append({'key': row['key'], 'fields': fields})
+        return result
+
+    def stats(self):
+        counts = {table: self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                  for table in ('snapshots', 'records', 'changes')}
+        counts['size_bytes'] = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return counts
+
+
+def snapshot_files(config, files=None):
+    """Снимок текущих CSV конвейера в хранилище snapshot_db под меткой snapshot_patch (по умолчанию - время запуска)."""
+    patch = config.get('snapshot_patch', '') or time.strftime('%Y-%m-%d %H:%M')
+    with SnapshotStore(config.get('snapshot_db', 'snapshots.sqlite')) as store:
+        snapshot_id, stats = store.add_snapshot(patch, files)
+        totals = store.stats()
+    changed = ', '.join(f"{kind}: +{s['added']} ~{s['changed']} -{s['removed']}" for kind, s in stats.items())
+    print(f"Снимок #{snapshot_id} (патч {patch}): {changed}. Всего в хранилище: {totals['snapshots']} снимков, "
+          f"{totals['records']} записей, {totals['changes']} изменений, {totals['size_bytes'] / 1e6:.1f} МБ")
+    return snapshot_id
+
+
+def _print_diff(diff, limit):
+    for kind, parts in diff.items():
+        print(f"{kind}: добавлено {len(parts['added'])}, удалено {len(parts['removed'])}, "
+              f"изменено {len(parts['changed'])}")
+        key_of = KINDS[kind]
+        for row in parts['added'][:limit]:
+            print(f"  + {key_of(row)}")
+        for row in parts['removed'][:limit]:
+            print(f"  - {key_of(row)}")
+        for change in parts['changed'][:limit]:
+            fields = ', '.join(f"{name}: {old!r} -> {new!r}" for name, (old, new) in change['fields'].items())
+            print(f"  ~ {change['key']}: {fields}")
+
+
+def _run_query(store, args):
+    if args.command == 'list':
+        for snapshot in store.snapshots():
+            counts = ', '.join(f"{kind} {count}" for kind, count in snapshot['counts'].items())
+            print(f"#{snapshot['id']:<4} {snapshot['patch']:<20} {snapshot['created_at']}  {counts}; "
+                  f"изменений {snapshot['changed']}")
+    elif args.command == 'asof':
+        if args.out:
+            for kind, path in store.export(args.patch, args.out).items():
+                print(f"{kind}: {path}")
+        else:
+            for kind, data in store.as_of(args.patch).items():
+                print(f"{kind}: {len(data['rows'])}")
+    elif args.command == 'diff':
+        result = store.diff(args.old, args.new)
+        _print_diff(result, args.limit)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Хранилище снимков данных по патчам игры.")
+    parser.add_argument('--config', default='config.txt', help="Путь к конфигурационному файлу")
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help="Записать снимок текущих CSV")
+    add.add_argument('--patch', help="Метка патча (по умолчанию snapshot_patch из config.txt или время)")
+    commands.add_parser('list', help="Список снимков")
+    as_of = commands.add_parser('asof', help="Данные на патч")
+    as_of.add_argument('patch', help="Метка патча, '#<номер>' или 'latest'")
+    as_of.add_argument('--out', help="Каталог для CSV-файлов на этот патч")
+    diff = commands.add_parser('diff', help="Различия между патчами")
+    diff.add_argument('old')
+    diff.add_argument('new')
+    diff.add_argument('--json', metavar='FILE', help="Сохранить полные различия в JSON")
+    diff.add_argument('--limit', type=int, default=10, help="Сколько примеров печатать для каждого вида")
+    args = parser.parse_args(argv)
+
+    from main import read_config
+    config = read_config(args.config)
+    if args.command == 'add':
+        if args.patch:
+            config['snapshot_patch'] = args.patch
+        snapshot_files(config)
+        return
+
+    with SnapshotStore(config.get('snapshot_db', 'snapshots.sqlite')) as store:
+        try:
+            _run_query(store, args)
+        except SnapshotNotFoundError as e:
+            parser.exit(1, f"{e}\n")
+
+
+
+if __name__ == "__main__":
+    main()
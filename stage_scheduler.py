@@ -0,0 +1,148 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+GANTT_WIDTH = 50
+
+
+class StageScheduler:
+    """
+    Параллельное выполнение шагов BuildGraph.
+
+    Шаг запускается, как только завершены все шаги, от которых он зависит, и свободен его ресурс:
+    шаги браузера идут строго по одному, а сетевые и файловые шаги выполняются рядом с ними.
+    После выполнения печатается хронология (диаграмма Ганта) и критический путь.
+    """
+
+    def __init__(self, graph, max_workers=4):
+        self.graph = graph
+        self.max_workers = max(1, max_workers)
+        self.timeline = {}
+
+    def run(self, targets=None, force=False, offline=False):
+        """
+        Выполняет шаги графа с теми же правилами пропуска, что и BuildGraph.run.
+
+        При ошибке новые шаги не запускаются, уже запущенные дожидаются завершения,
+        после чего исключение первого упавшего шага пробрасывается дальше.
+        """
+        graph = self.graph
+        names = graph.order(targets)
+        deps = {name: [d for d in graph.dependencies(graph.stages[name]) if d in names] for name in names}
+        pending = list(names)
+        finished = set()
+        running = {}
+        busy = set()
+        error = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                progress = True
+                while progress and error is None:
+                    progress = False
+                    for name in list(pending):
+                        stage = graph.stages[name]
+                        if any(d not in finished for d in deps[name]):
+                            continue
+                        if (not force or stage.source) and graph.is_up_to_date(stage, offline=offline):
+                            print(f"\n[{name}] актуален, пропуск.")
+                            graph.results[name] = 'skipped'
+                            now = time.time()
+                            self.timeline[name] = (now, now, 'skipped')
+                            pending.remove(name)
+                            finished.add(name)
+                            progress = True
+                            continue
+                        if stage.resource and stage.resource in busy:
+                            continue
+                        if len(running) >= self.max_workers:
+                            break
+                        print(f"\n[{name}] выполнение...")
+                        if stage.resource:
+                            busy.add(stage.resource)
+                        running[pool.submit(self._run_stage, stage)] = name
+                        pending.remove(name)
+
+                if not running:
+                    if pending and error is None:
+                        raise RuntimeError(f"Шаги не могут быть запущены: {', '.join(pending)}")
+                    break
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    stage = graph.stages[name]
+                    busy.discard(stage.resource)
+                    try:
+                        started, ended = future.result()
+                    except Exception as e:
+                        print(f"[{name}] завершен с ошибкой: {e}")
+                        self.timeline[name] = (getattr(e, 'stage_started', time.time()), time.time(), 'failed')
+                        if error is None:
+                            error = e
+                        continue
+                    self.timeline[name] = (started, ended, 'run')
+                    finished.add(name)
+                    print(f"[{name}] завершен за {ended - started:.2f} сек.")
+
+        self.print_timeline()
+        if error is not None:
+            raise error
+        return graph.results
+
+    def _run_stage(self, stage):
+        started = time.time()
+        try:
+            stage.func()
+        except Exception as e:
+            e.stage_started = started
+            raise
+        ended = time.time()
+        self.graph.record_run(stage, ended - started)
+        return started, ended
+
+    def critical_path(self):
+        """
+        Цепочка шагов, определившая общее время: от последнего завершенного шага назад
+        к тому, что задержал его старт - зависимости или предыдущему шагу на том же ресурсе.
+        """
+        executed = {name: t for name, t in self.timeline.items() if t[2] != 'skipped'}
+        if not executed:
+            return []
+        graph = self.graph
+        path = [max(executed, key=lambda n: executed[n][1])]
+        while True:
+            name = path[-1]
+            started = executed[name][0]
+            stage = graph.stages[name]
+            blockers = [d for d in graph.dependencies(stage) if d in executed]
+            if stage.resource:
+                blockers += [n for n in executed
+                             if n != name and graph.stages[n].resource == stage.resource]
+            blockers = [n for n in blockers if n not in path and executed[n][1] <= started + 0.05]
+            if not blockers:
+                break
+            path.append(max(blockers, key=lambda n: executed[n][1]))
+        return list(reversed(path))
+
+    def print_timeline(self):
+        if all(status == 'skipped' for _, _, status in self.timeline.values()):
+            return
+        start = min(t[0] for t in self.timeline.values())
+        total = max(max(t[1] for t in self.timeline.values()) - start, 1e-6)
+        scale = GANTT_WIDTH / total
+        name_width = max(len(name) for name in self.timeline)
+
+        print(f"\nХронология шагов (всего {total:.2f} сек., '#' - выполнение, '.' - пропуск):")
+        for name, (started, ended, status) in sorted(self.timeline.items(), key=lambda item: item[1][0]):
+            left = int((started - start) * scale)
+            length = max(1, int(round((ended - started) * scale)))
+            mark = {'run': '#', 'skipped': '.', 'failed': 'x'}[status]
+            bar = (' ' * left + mark * length)[:GANTT_WIDTH].ljust(GANTT_WIDTH)
+            resource = self.graph.stages[name].resource or ''
+            print(f"  {name.ljust(name_width)} {resource.ljust(7)} |{bar}| "
+                  f"{started - start:7.2f} - {ended - start:7.2f} сек.")
+
+        path = self.critical_path()
+        if path:
+            length = self.timeline[path[-1]][1] - self.timeline[path[0]][0]
+            print(f"Критический путь: {' -> '.join(path)} ({length:.2f} сек.)")
@@ -0,0 +1,137 @@
+"""
+Проверка загрузчика COPY на живом PostgreSQL.
+
+Сервер берется из PG_TEST_DSN (переменная окружения) или pg_dsn в config.txt; если они не заданы,
+а установлен pgserver (pip install pgserver), тест поднимает временный PostgreSQL сам.
+Без DSN и pgserver тест пропускается. Таблицы создаются в отдельной схеме внутри транзакции, которая в конце откатывается,
+поэтому данные в базе не меняются.
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from main import read_config, load_override_rules, TARGET_SECTIONS
+from db_uploader import build_upload_payload
+from db_copy_loader import load_into_tables, TABLES, psycopg
+
+try:
+    import pgserver
+except ImportError:
+    pgserver = None
+
+SCHEMA = 'copy_loader_test'
+
+# Минимальная схема с теми же колонками, ключами и связями, что и в рабочей базе
+SCHEMA_SQL = """
+CREATE SCHEMA {schema};
+CREATE TABLE {schema}.vehicle_types (id serial PRIMARY KEY, name text UNIQUE NOT NULL);
+CREATE TABLE {schema}.nations (id serial PRIMARY KEY, name text UNIQUE NOT NULL, image_url text);
+CREATE TABLE {schema}.nodes (
+    id serial PRIMARY KEY, external_id text UNIQUE NOT NULL, name text, type text, tech_category text,
+    nation_id int NOT NULL REFERENCES {schema}.nations(id),
+    vehicle_type_id int NOT NULL REFERENCES {schema}.vehicle_types(id),
+    rank int, silver_cost int, required_exp int, image_url text, br numeric(4,1),
+    column_index int, row_index int, order_in_folder int, parent_id int REFERENCES {schema}.nodes(id)
+);
+CREATE TABLE {schema}.node_dependencies (
+    id serial PRIMARY KEY,
+    node_id int NOT NULL REFERENCES {schema}.nodes(id) ON DELETE CASCADE,
+    prerequisite_node_id int NOT NULL REFERENCES {schema}.nodes(id) ON DELETE CASCADE
+);
+CREATE TABLE {schema}.rank_requirements (
+    id serial PRIMARY KEY, nation_id int REFERENCES {schema}.nations(id),
+    vehicle_type_id int REFERENCES {schema}.vehicle_types(id),
+    target_rank int, previous_rank int, required_units int
+);
+"""
+
+
+def configured_dsn():
+    return os.environ.get('PG_TEST_DSN') or read_config(os.path.join(ROOT, 'config.txt')).get('pg_dsn')
+
+
+@unittest.skipIf(psycopg is None, "psycopg не установлен")
+@unittest.skipUnless(configured_dsn() or pgserver, "не задан PG_TEST_DSN или pg_dsn и не установлен pgserver")
+class CopyLoaderTest(unittest.TestCase):
+    server = None
+
+    @classmethod
+    def setUpClass(cls):
+        dsn = configured_dsn()
+        if not dsn:
+            cls.server = pgserver.get_server(tempfile.mkdtemp(prefix='copy_loader_pg_'), cleanup_mode='delete')
+            dsn = cls.server.get_uri()
+        cls.payload = build_upload_payload(
+            TARGET_SECTIONS, load_override_rules(os.path.join(ROOT, 'override_rules.json')),
+            country_csv=os.path.join(ROOT, 'country_flags.csv'),
+            merged_csv=os.path.join(ROOT, 'vehicles_merged.csv'),
+            deps_csv=os.path.join(ROOT, 'dependencies.csv'),
+            rank_csv=os.path.join(ROOT, 'rank_requirements.csv'))
+        cls.conn = psycopg.connect(dsn)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.close()
+        if cls.server is not None:
+            cls.server.cleanup()
+
+    def setUp(self):
+        self.transaction = self.conn.transaction(force_rollback=True)
+        self.transaction.__enter__()
+        self.cur = self.conn.cursor()
+        self.cur.execute(SCHEMA_SQL.format(schema=SCHEMA))
+        self.counts = load_into_tables(self.cur, {t: f"{SCHEMA}.{t}" for t in TABLES}, self.payload)
+
+    def tearDown(self):
+        self.cur.close()
+        self.transaction.__exit__(None, None, None)
+
+    def query(self, sql):
+        self.cur.execute(sql.format(schema=SCHEMA))
+        return self.cur.fetchall()
+
+    def test_row_counts(self):
+        payload = self.payload
+        self.assertEqual(self.query("SELECT count(*) FROM {schema}.vehicle_types")[0][0],
+                         len(payload['vehicle_types']))
+        self.assertEqual(self.query("SELECT count(*) FROM {schema}.nations")[0][0], len(payload['nations']))
+        self.assertEqual(self.counts['nodes'], self.counts['nodes_expected'])
+        self.assertEqual(self.query("SELECT count(*) FROM {schema}.nodes")[0][0], len(payload['nodes']))
+        known = {(n['name'], t) for n in payload['nations'] for t in payload['vehicle_types']}
+        expected_rr = [r for r in payload['rank_requirements'] if (r['nation'], r['vehicle_type']) in known]
+        self.assertEqual(self.query("SELECT count(*) FROM {schema}.rank_requirements")[0][0], len(expected_rr))
+
+    def test_parent_ids_resolved(self):
+        node_ids = {nd['external_id'] for nd in self.payload['nodes']}
+        expected = {nd['external_id']: nd['parent_external_id'] for nd in self.payload['nodes']
+                    if nd.get('parent_external_id') in node_ids}
+        self.assertTrue(expected, "в CSV репозитория нет узлов с родителями")
+        actual = dict(self.query("SELECT c.external_id, p.external_id FROM {schema}.nodes c "
+                                 "JOIN {schema}.nodes p ON p.id = c.parent_id"))
+        self.assertEqual(actual, expected)
+
+    def test_dependency_ids_resolved(self):
+        node_ids = {nd['external_id'] for nd in self.payload['nodes']}
+        expected = sorted((d['node_external_id'], d['prerequisite_external_id'])
+                          for d in self.payload['dependencies']
+                          if d['node_external_id'] in node_ids and d['prerequisite_external_id'] in node_ids)
+        self.assertTrue(expected, "в CSV репозитория нет зависимостей")
+        actual = sorted(self.query("SELECT a.external_id, b.external_id FROM {schema}.node_dependencies d "
+                                   "JOIN {schema}.nodes a ON a.id = d.node_id "
+                                   "JOIN {schema}.nodes b ON b.id = d.prerequisite_node_id"))
+        self.assertEqual(actual, expected)
+
+    def test_nation_and_type_ids_resolved(self):
+        expected = sorted((nd['external_id'], nd['nation'], nd['vehicle_type']) for nd in self.payload['nodes'])
+        actual = sorted(self.query("SELECT nd.external_id, n.name, vt.name FROM {schema}.nodes nd "
+                                   "JOIN {schema}.nations n ON n.id = nd.nation_id "
+                                   "JOIN {schema}.vehicle_types vt ON vt.id = nd.vehicle_type_id"))
+        self.assertEqual(actual, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+"""
+Проверки графа техники (graph_validator) на небольших графах в памяти.
+"""
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from graph_validator import validate_graph, _cycles, GraphValidationError, CHECKS
+
+NATIONS = {'usa'}
+TYPES = {'Авиация'}
+
+
+def node(node_id, parent='', node_type='vehicle', rank='I'):
+    return {'data_ulist_id': node_id, 'parent_external_id': parent, 'type': node_type, 'rank': rank,
+            'country': 'usa', 'vehicle_category': 'Авиация', 'name': node_id}
+
+
+def dep(source, target):
+    return {'node_external_id': source, 'prerequisite_external_id': target}
+
+
+def validate(nodes, dependencies=()):
+    return validate_graph(nodes, list(dependencies), NATIONS, TYPES)
+
+
+def cycle_sets(report):
+    return sorted(sorted(set(item['cycle'])) for item in report['checks']['cycles']['items'])
+
+
+class CyclesTest(unittest.TestCase):
+
+    def test_acyclic_graph_is_ok(self):
+        report = validate([node('a'), node('b'), node('c')], [dep('b', 'a'), dep('c', 'b')])
+        self.assertTrue(report['ok'])
+        self.assertEqual(report['summary'], {'nodes': 3, 'edges': 2, 'errors': 0, 'warnings': 0})
+
+    def test_simple_cycle(self):
+        report = validate([node('a'), node('b'), node('c')], [dep('a', 'b'), dep('b', 'c'), dep('c', 'a')])
+        self.assertFalse(report['ok'])
+        self.assertEqual(cycle_sets(report), [['a', 'b', 'c']])
+        cycle = report['checks']['cycles']['items'][0]['cycle']
+        self.assertEqual(cycle[0], cycle[-1])
+        self.assertEqual(len(cycle), 4)
+
+    def test_cycle_with_downstream_nodes(self):
+        # d зависит от цикла, e и f достижимы из него: в отчете только сам цикл
+        nodes = [node(node_id) for node_id in 'abcdef']
+        report = validate(nodes, [dep('a', 'b'), dep('b', 'c'), dep('c', 'a'),
+                                  dep('d', 'a'), dep('c', 'e'), dep('e', 'f')])
+        self.assertEqual(cycle_sets(report), [['a', 'b', 'c']])
+        self.assertEqual(report['checks']['cycles']['count'], 1)
+
+    def test_two_disjoint_cycles(self):
+        nodes = [node(node_id) for node_id in 'abcxy']
+        report = validate(nodes, [dep('a', 'b'), dep('b', 'c'), dep('c', 'a'), dep('x', 'y'), dep('y', 'x')])
+        self.assertEqual(cycle_sets(report), [['a', 'b', 'c'], ['x', 'y']])
+
+    def test_cycle_through_parent_links(self):
+        report = validate([node('a', parent='b'), node('b')], [dep('b', 'a')])
+        self.assertEqual(cycle_sets(report), [['a', 'b']])
+
+    def test_cycles_helper_skips_nodes_reachable_from_cycle(self):
+        edges = {'a': ['b'], 'b': ['a', 'c'], 'c': []}
+        self.assertEqual(_cycles(edges, {'a', 'b', 'c'}), [{'cycle': ['a', 'b', 'a']}])
+
+
+class ReferencesTest(unittest.TestCase):
+
+    def test_missing_parent(self):
+        report = validate([node('a', parent='nowhere')])
+        self.assertFalse(report['ok'])
+        self.assertEqual(report['checks']['missing_parents']['items'], [{'id': 'a', 'parent': 'nowhere'}])
+
+    def test_parent_resolved_through_group_suffix(self):
+        report = validate([node('a_group', node_type='folder'), node('b', parent='a')])
+        self.assertTrue(report['ok'])
+        self.assertEqual(report['summary']['edges'], 1)
+
+    def test_self_parent_on_group_fallback(self):
+        # id группы совпадает с id ее первой техники: родитель 'a' находится как 'a_group' - сам узел
+        report = validate([node('a_group', parent='a', node_type='folder')])
+        self.assertTrue(report['ok'])
+        self.assertEqual(report['checks']['self_parents']['items'], [{'id': 'a_group'}])
+        self.assertEqual(report['checks']['self_parents']['severity'], 'warning')
+        self.assertEqual(report['summary']['edges'], 0)
+
+    def test_dangling_dependency(self):
+        report = validate([node('a')], [dep('a', 'ghost')])
+        self.assertFalse(report['ok'])
+        self.assertEqual(report['checks']['dangling_dependencies']['items'],
+                         [{'node': 'a', 'prerequisite': 'ghost', 'missing': ['ghost']}])
+        self.assertEqual(report['summary']['edges'], 0)
+
+    def test_ignore_downgrades_errors(self):
+        report = validate_graph([node('a')], [dep('a', 'ghost')], NATIONS, TYPES, ignore=('dangling_dependencies',))
+        self.assertTrue(report['ok'])
+        self.assertEqual(report['checks']['dangling_dependencies']['severity'], 'warning')
+
+    def test_error_message_lists_failed_checks(self):
+        report = validate([node('a', parent='nowhere')], [dep('a', 'ghost')])
+        message = str(GraphValidationError(report))
+        self.assertIn('missing_parents (1)', message)
+        self.assertIn('dangling_dependencies (1)', message)
+        self.assertEqual(set(report['checks']), set(CHECKS))
+
+
+if __name__ == '__main__':
+    unittest.main()
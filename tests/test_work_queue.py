@@ -0,0 +1,185 @@
+"""
+Очередь распределенного сбора (work_queue): SQLiteWorkQueue во временном файле и Coordinator
+с работником в соседнем потоке.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from work_queue import SQLiteWorkQueue, Coordinator, unit_spec
+
+BATCH = 'test-batch'
+
+
+class QueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='work_queue_')
+        self.queue = SQLiteWorkQueue(os.path.join(self.tmp, 'queue.sqlite'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+class SQLiteWorkQueueTest(QueueTestCase):
+
+    def test_lease_is_exclusive(self):
+        self.queue.enqueue(BATCH, [unit_spec('list', 0, {'section': 'A'}, [0])])
+        unit = self.queue.claim('w1', 60)
+        self.assertIsNotNone(unit)
+        self.assertEqual(unit.params, {'section': 'A'})
+        self.assertIsNone(self.queue.claim('w2', 60))
+        self.assertEqual(self.queue.counts(BATCH)['leased'], 1)
+
+    def test_concurrent_claims_get_distinct_units(self):
+        self.queue.enqueue(BATCH, [unit_spec('list', i, {}, [i]) for i in range(20)])
+        claimed, lock = [], threading.Lock()
+
+        def worker(name):
+            while True:
+                unit = self.queue.claim(name, 60)
+                if unit is None:
+                    return
+                with lock:
+                    claimed.append(unit.id)
+
+        threads = [threading.Thread(target=worker, args=(f"w{i}",)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(claimed), 20)
+        self.assertEqual(len(set(claimed)), 20)
+
+    def test_expired_lease_is_reissued(self):
+        self.queue.enqueue(BATCH, [unit_spec('list', 0, {}, [0])])
+        first = self.queue.claim('w1', -1)
+        self.assertEqual(self.queue.reclaim_expired(), 1)
+        self.assertEqual(self.queue.counts(BATCH)['pending'], 1)
+        second = self.queue.claim('w2', 60)
+        self.assertEqual(second.id, first.id)
+        self.assertEqual(second.attempts, 1)
+        self.assertNotEqual(second.lease, first.lease)
+        self.assertEqual(self.queue.reclaim_expired(), 0)
+
+    def test_late_complete_is_rejected(self):
+        self.queue.enqueue(BATCH, [unit_spec('list', 0, {}, [0])])
+        stale = self.queue.claim('w1', -1)
+        self.queue.reclaim_expired()
+        current = self.queue.claim('w2', 60)
+        self.assertFalse(self.queue.extend(stale, 60))
+        self.assertFalse(self.queue.complete(stale, ['stale']))
+        self.assertFalse(self.queue.fail(stale, 'stale'))
+        self.assertTrue(self.queue.complete(current, ['fresh']))
+        self.assertEqual(self.queue.finished(BATCH), [([0], 'list', {}, ['fresh'], None)])
+
+    def test_fail_requeues_until_attempts_exhausted(self):
+        self.queue.enqueue(BATCH, [unit_spec('list', 0, {}, [0])], max_attempts=2)
+        self.assertTrue(self.queue.fail(self.queue.claim('w1', 60), 'first'))
+        self.assertEqual(self.queue.counts(BATCH)['pending'], 1)
+        self.assertTrue(self.queue.fail(self.queue.claim('w1', 60), 'second'))
+        self.assertEqual(self.queue.counts(BATCH), {'pending': 0, 'leased': 0, 'done': 0, 'failed': 1})
+        self.assertIsNone(self.queue.claim('w1', 60))
+        self.assertEqual(self.queue.finished(BATCH), [([0], 'list', {}, None, 'second')])
+
+    def test_children_are_enqueued_on_complete(self):
+        self.queue.enqueue(BATCH, [unit_spec('tree_section', 'A', {'section': 'A'}, [0])], max_attempts=5)
+        parent = self.queue.claim('w1', 60)
+        children = [unit_spec('tree', f"A/{nation}", {'nation': nation}, [0, index])
+                    for index, nation in enumerate(['us', 'de'])]
+        self.assertTrue(self.queue.complete(parent, [], children))
+        # Повторное завершение (например, после потери аренды) не ставит детей второй раз
+        self.assertFalse(self.queue.complete(parent, [], children))
+        self.assertEqual(self.queue.counts(BATCH)['pending'], 2)
+        child = self.queue.claim('w1', 60)
+        self.assertEqual((child.kind, child.seq), ('tree', [0, 0]))
+        self.assertTrue(self.queue.fail(child, 'x'))
+        self.assertEqual(self.queue.counts(BATCH)['pending'], 2, "у детей max_attempts родителя")
+
+    def test_purge_removes_batch(self):
+        self.queue.enqueue(BATCH, [unit_spec('list', 0, {}, [0])])
+        self.queue.enqueue('other', [unit_spec('list', 0, {}, [0])])
+        self.queue.purge(BATCH)
+        self.assertEqual(sum(self.queue.counts(BATCH).values()), 0)
+        self.assertEqual(self.queue.counts('other')['pending'], 1)
+
+
+class CoordinatorTest(QueueTestCase):
+
+    def run_with_worker(self, coordinator, name, specs, handler):
+        """Coordinator.run, пока работник в соседнем потоке выполняет единицы через handler(unit)."""
+        stop = threading.Event()
+
+        def worker():
+            while not stop.is_set():
+                unit = self.queue.claim('worker', 60)
+                if unit is None:
+                    stop.wait(0.01)
+                    continue
+                try:
+                    result, children = handler(unit)
+                except Exception as e:
+                    self.queue.fail(unit, e)
+                else:
+                    self.queue.complete(unit, result, children)
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        try:
+            return coordinator.run(name, specs)
+        finally:
+            stop.set()
+            thread.join()
+
+    def coordinator(self, **kwargs):
+        return Coordinator(self.queue, lease_seconds=60, max_attempts=2, poll=0.01, timeout=30,
+                           report_every=3600, **kwargs)
+
+    def test_results_follow_seq_with_children(self):
+        def handler(unit):
+            if unit.kind == 'tree_section':
+                # Дети ставятся в обратном порядке: итог все равно идет по seq
+                return [], [unit_spec('tree', f"{unit.params['section']}/{index}", {'nation': index},
+                                      unit.seq + [index]) for index in (2, 1, 0)]
+            return [unit.params], []
+
+        specs = [unit_spec('tree_section', section, {'section': section}, [index])
+                 for index, section in enumerate(['A', 'B'])]
+        coordinator = self.coordinator()
+        done, failed = self.run_with_worker(coordinator, 'tree', specs, handler)
+        self.assertEqual(failed, [])
+        self.assertEqual([(kind, params) for kind, params, _ in done],
+                         [('tree_section', {'section': 'A'})] + [('tree', {'nation': i}) for i in range(3)]
+                         + [('tree_section', {'section': 'B'})] + [('tree', {'nation': i}) for i in range(3)])
+        self.assertEqual(sum(self.queue.counts(f"{coordinator.run_id}-tree").values()), 0, "пакет удален после сбора")
+
+    def test_exhausted_attempts_raise(self):
+        def handler(unit):
+            if unit.params['section'] == 'bad':
+                raise RuntimeError('раздел не открылся')
+            return ['ok'], []
+
+        specs = [unit_spec('list', index, {'section': section}, [index])
+                 for index, section in enumerate(['ok', 'bad'])]
+        with self.assertRaises(RuntimeError) as raised:
+            self.run_with_worker(self.coordinator(), 'list', specs, handler)
+        self.assertIn("'list'", str(raised.exception))
+
+    def test_allow_partial_returns_failed_units(self):
+        def handler(unit):
+            raise RuntimeError('нет браузера')
+
+        done, failed = self.run_with_worker(self.coordinator(allow_partial=True), 'flags',
+                                            [unit_spec('flags', 0, {'section': 'A'}, [0])], handler)
+        self.assertEqual(done, [])
+        self.assertEqual(failed, [('flags', {'section': 'A'}, 'нет браузера')])
+
+
+if __name__ == '__main__':
+    unittest.main()
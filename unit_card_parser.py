@@ -0,0 +1,151 @@
+import json
+import re
+from dataclasses import dataclass, field, fields as dataclass_fields
+from typing import Dict, Optional
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+CARD_ITEM_CLASS = 'game-unit_card-info_item'
+CARD_TITLE_CLASS = 'game-unit_card-info_title'
+CARD_VALUE_CLASS = 'game-unit_card-info_value'
+BR_ITEM_CLASS = 'game-unit_br-item'
+# Разбирается только содержимое этих элементов - остальная страница в дерево не попадает
+CARD_STRAINER = SoupStrainer(class_=[CARD_ITEM_CLASS, BR_ITEM_CLASS])
+
+MODES = {
+    'АБ': 'arcade', 'AB': 'arcade',
+    'РБ': 'realistic', 'RB': 'realistic',
+    'СБ': 'simulator', 'SB': 'simulator',
+}
+_MODE_VALUE_RE = re.compile(r'\b(АБ|РБ|СБ|AB|RB|SB)\b\s*:?\s*(\d[\d\s.,]*)')
+_NUMBER_RE = re.compile(r'\d[\d \xa0\u2009\u202f.]*')
+_BR_RE = re.compile(r'\d+[.,]\d+')
+_DIV_TAG_RE = re.compile(r'<(/?)div\b', re.IGNORECASE)
+
+
+def parse_int(text):
+    """Первое число в тексте карточки ('95 000', '95.000' -> 95000) или None."""
+    match = _NUMBER_RE.search(text or '')
+    if not match:
+        return None
+    digits = re.sub(r'\D', '', match.group(0))
+    return int(digits) if digits else None
+
+
+def parse_br(text):
+    match = _BR_RE.search(text or '')
+    return match.group(0).replace(',', '.') if match else None
+
+
+def _text(tag):
+    return ' '.join(tag.get_text(' ').split()) if tag is not None else ''
+
+
+@dataclass
+class UnitCard:
+    """Поля карточки техники со страницы /unit/<id>."""
+
+    data_ulist_id: str = ''
+    required_exp: Optional[int] = None
+    purchase_cost: Optional[int] = None
+    crew: Optional[int] = None
+    br_arcade: Optional[str] = None
+    br_realistic: Optional[str] = None
+    br_simulator: Optional[str] = None
+    repair_arcade: Optional[int] = None
+    repair_realistic: Optional[int] = None
+    repair_simulator: Optional[int] = None
+    # Все пары "заголовок: значение" карточки, включая не разобранные в типизированные поля
+    card_fields: Dict[str, str] = field(default_factory=dict)
+
+    def is_empty(self):
+        return not self.card_fields and self.br_arcade is None and self.br_realistic is None \
+            and self.br_simulator is None
+
+    def as_row(self):
+        """Словарь для CSV (card_fields - JSON-строкой)."""
+        row = {f.name: getattr(self, f.name) for f in dataclass_fields(self)}
+        row['card_fields'] = json.dumps(self.card_fields, ensure_ascii=False) if self.card_fields else ''
+        return row
+
+
+UNIT_CARD_FIELDNAMES = [f.name for f in dataclass_fields(UnitCard)]
+# Поля, которые NodesMerger переносит из карточки в узел
+UNIT_CARD_NODE_FIELDS = [name for name in UNIT_CARD_FIELDNAMES if name not in ('data_ulist_id', 'card_fields')]
+
+
+def _set_modes(card, prefix, values, convert):
+    for mode, raw in values.items():
+        value = convert(raw)
+        if value is not None:
+            setattr(card, f"{prefix}_{MODES[mode]}", value)
+
+
+def card_window(html):
+    """
+    Фрагмент страницы от первого до конца последнего элемента карточки.
+    Остальная страница (меню, скрипты, статьи) не попадает даже в токенизатор.
+    """
+    markers = [html.find(cls) for cls in (CARD_ITEM_CLASS, BR_ITEM_CLASS)]
+    markers = [pos for pos in markers if pos >= 0]
+    if not markers:
+        return ''
+    start = html.rfind('<', 0, min(markers))
+    last = max(html.rfind(cls) for cls in (CARD_ITEM_CLASS, BR_ITEM_CLASS))
+    # Конец последнего элемента - закрывающий </div> его открывающего тега
+    depth = 0
+    for match in _DIV_TAG_RE.finditer(html, html.rfind('<', 0, last)):
+        depth += -1 if match.group(1) else 1
+        if depth == 0:
+            return html[start:html.find('>', match.end()) + 1]
+    return html[start:]
+
+
+def parse_unit_card(html, data_ulist_id=''):
+    """
+    Разбирает карточку техники за один проход.
+
+    Разбирается только фрагмент карточки (card_window), и в дерево попадают только ее элементы
+    (SoupStrainer), поэтому разбор страницы на порядки быстрее полного BeautifulSoup.
+
+    :return: UnitCard (поля, которых нет на странице, остаются None)
+    """
+    soup = BeautifulSoup(card_window(html), HTML_PARSER, parse_only=CARD_STRAINER)
+    card = UnitCard(data_ulist_id=data_ulist_id)
+
+    for item in soup.find_all(class_=BR_ITEM_CLASS):
+        parts = [_text(child) for child in item.find_all(recursive=False)] or [_text(item)]
+        mode = next((MODES[p] for p in parts if p in MODES), None)
+        value = parse_br(parts[-1])
+        if mode and value:
+            setattr(card, f"br_{mode}", value)
+
+    for item in soup.find_all(class_=CARD_ITEM_CLASS):
+        title = _text(item.find(class_=CARD_TITLE_CLASS))
+        value_tag = item.find(class_=CARD_VALUE_CLASS)
+        if not title or value_tag is None:
+            continue
+        value_text = _text(value_tag)
+        card.card_fields[title] = value_text
+        # Основное значение - первый вложенный div (рядом могут быть иконки и подписи)
+        first = value_tag.find('div')
+        main_text = _text(first) if first is not None and _text(first) else value_text
+        per_mode = {mode: number for mode, number in _MODE_VALUE_RE.findall(value_text)}
+        lowered = title.lower()
+
+        if 'исследование' in lowered and card.required_exp is None:
+            card.required_exp = parse_int(main_text)
+        elif 'покупка' in lowered and card.purchase_cost is None:
+            card.purchase_cost = parse_int(main_text)
+        elif 'экипаж' in lowered and card.crew is None:
+            card.crew = parse_int(main_text)
+        elif 'ремонт' in lowered and per_mode:
+            _set_modes(card, 'repair', per_mode, parse_int)
+        elif 'рейтинг' in lowered and per_mode:
+            _set_modes(card, 'br', per_mode, parse_br)
+    return card
@@ -0,0 +1,136 @@
+import json
+import os
+import re
+import time
+from http_session import get_shared_session
+from rank_requirements_extractor import DATA_URL
+
+# Репозиторий и ветка датамайна - те же, из которых берутся rank.blkx и units.csv
+_REPO_RE = re.compile(r'/gh/([^/]+)/([^/@]+)@([^/]+)/')
+WIKI_VERSION_PATTERN = r'(?:версия игры|game version|версия|version)\D{0,40}?(\d+\.\d+(?:\.\d+){1,2})'
+
+
+def datamine_repo(data_url=DATA_URL):
+    """(владелец, репозиторий, ветка) из URL jsDelivr вида .../gh/<владелец>/<репозиторий>@<ветка>/..."""
+    match = _REPO_RE.search(data_url)
+    if not match:
+        raise ValueError(f"Не удалось определить репозиторий датамайна по URL {data_url}")
+    return match.groups()
+
+
+class UpstreamProbe:
+    """
+    Предварительная проверка источников перед полным сбором: последний коммит датамайна (или его
+    файл version) и версия игры на стартовой странице вики сравниваются с манифестом последнего
+    успешного запуска. Несколько HTTP-запросов вместо запуска браузера.
+
+    Сигнал, который не удалось получить, считается изменившимся: пропустить сбор можно, только
+    если все сигналы известны и совпадают, а последний полный запуск не старше max_age_hours
+    (правки вики между патчами версию игры не меняют).
+    """
+
+    def __init__(self, wiki_url, manifest_path='.upstream_manifest.json', data_url=DATA_URL,
+                 version_pattern=WIKI_VERSION_PATTERN, max_age_hours=168, github_token=None):
+        self.wiki_url = wiki_url
+        self.manifest_path = manifest_path
+        self.data_url = data_url
+        self.version_re = re.compile(version_pattern, re.IGNORECASE)
+        self.max_age_hours = max_age_hours
+        self.github_token = github_token
+        self.signals = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('wiki_probe_url') or config.get('start_url', 'https://wiki.warthunder.ru'),
+                   manifest_path=config.get('upstream_manifest', '.upstream_manifest.json'),
+                   version_pattern=config.get('wiki_version_pattern', WIKI_VERSION_PATTERN),
+                   max_age_hours=float(config.get('upstream_probe_max_age_hours', '168')),
+                   github_token=config.get('github_token') or None)
+
+    def _get(self, url, **kwargs):
+        response = get_shared_session().get(url, timeout=15, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def datamine_signal(self):
+        """SHA последнего коммита ветки датамайна (GitHub API), при ошибке - содержимое файла version."""
+        owner, repo, ref = datamine_repo(self.data_url)
+        headers = {'Accept': 'application/vnd.github.sha'}
+        if self.github_token:
+            headers['Authorization'] = f"Bearer {self.github_token}"
+        try:
+            sha = self._get(f"https://api.github.com/repos/{owner}/{repo}/commits/{ref}", headers=headers).text.strip()
+            if re.fullmatch(r'[0-9a-f]{40}', sha):
+                return f"commit:{sha}"
+            print(f"Предупреждение: GitHub вернул неожиданный ответ вместо SHA коммита: {sha[:80]!r}")
+        except Exception as e:
+            print(f"Предупреждение: Коммит датамайна не получен ({e}), проверяется файл version.")
+        try:
+            version = self._get(f"https://cdn.jsdelivr.net/gh/{owner}/{repo}@{ref}/version").text.strip()
+            return f"version:{version}" if version else None
+        except Exception as e:
+            print(f"Предупреждение: Версия датамайна не получена: {e}")
+            return None
+
+    def wiki_signal(self):
+        """Версия игры со стартовой страницы вики (первое совпадение wiki_version_pattern)."""
+        try:
+            text = self._get(self.wiki_url).content.decode('utf-8', errors='replace')
+        except Exception as e:
+            print(f"Предупреждение: Стартовая страница вики не получена: {e}")
+            return None
+        match = self.version_re.search(text)
+        if not match:
+            print(f"Предупреждение: Версия игры на {self.wiki_url} не найдена (wiki_version_pattern).")
+            return None
+        return match.group(1)
+
+    def probe(self):
+        started = time.time()
+        self.signals = {'datamine': self.datamine_signal(), 'wiki_version': self.wiki_signal()}
+        print(f"Проверка источников за {time.time() - started:.1f} сек.: датамайн {self.signals['datamine']}, "
+              f"версия игры на вики {self.signals['wiki_version']}")
+        return self.signals
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Предупреждение: Манифест источников '{self.manifest_path}' не прочитан: {e}")
+            return None
+
+    def unchanged(self):
+        """True, если источники не изменились с последнего успешного полного запуска."""
+        signals = self.probe()
+        previous = self.load_manifest()
+        if previous is None:
+            print("Успешных полных запусков еще не было, выполняется сбор.")
+            return False
+        if any(value is None for value in signals.values()):
+            print("Не все источники удалось проверить, выполняется сбор.")
+            return False
+        changed = [name for name, value in signals.items() if previous.get('signals', {}).get(name) != value]
+        if changed:
+            print(f"Изменились источники: {', '.join(changed)}, выполняется сбор.")
+            return False
+        age_hours = (time.time() - previous.get('finished_at', 0)) / 3600
+        if age_hours > self.max_age_hours:
+            print(f"Последний полный запуск был {age_hours:.0f} ч. назад "
+                  f"(upstream_probe_max_age_hours={self.max_age_hours:g}), выполняется сбор.")
+            return False
+        print(f"Источники не изменились с {previous.get('finished', '?')}, сбор не нужен.")
+        return True
+
+    def save(self):
+        """Записывает сигналы после успешного полного запуска (атомарно)."""
+        if self.signals is None:
+            self.probe()
+        manifest = {'signals': self.signals, 'finished_at': time.time(),
+                    'finished': time.strftime('%Y-%m-%d %H:%M:%S')}
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.manifest_path)
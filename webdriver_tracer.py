@@ -0,0 +1,188 @@
+import atexit
+import os
+import sys
+import threading
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Границы корзин гистограммы, мс: <1, 1-2, 2-4, ... , >=1024
+BUCKETS_MS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024]
+HISTOGRAM_WIDTH = 30
+
+
+def _frame_name(frame):
+    """Имя функции в кадре стека в виде 'Класс.метод' или 'модуль.функция'."""
+    code = frame.f_code
+    qualname = getattr(code, 'co_qualname', None)
+    if qualname and '.' in qualname and '<locals>' not in qualname:
+        return qualname
+    owner = frame.f_locals.get('self')
+    if owner is not None:
+        return f"{type(owner).__name__}.{code.co_name}"
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}.{code.co_name}"
+
+
+def _bucket(elapsed_ms):
+    for idx, bound in enumerate(BUCKETS_MS):
+        if elapsed_ms < bound:
+            return idx
+    return len(BUCKETS_MS)
+
+
+def _bucket_label(idx):
+    if idx == 0:
+        return f"<{BUCKETS_MS[0]}"
+    if idx == len(BUCKETS_MS):
+        return f">={BUCKETS_MS[-1]}"
+    return f"{BUCKETS_MS[idx - 1]}-{BUCKETS_MS[idx]}"
+
+
+class SiteStats:
+    """Статистика команд одного места вызова."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.commands = {}
+
+    def add(self, command, elapsed):
+        elapsed_ms = elapsed * 1000
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.buckets[_bucket(elapsed_ms)] += 1
+        count, total = self.commands.get(command, (0, 0.0))
+        self.commands[command] = (count + 1, total + elapsed)
+
+    def percentile(self, fraction):
+        """Приближенный процентиль (верхняя граница корзины), мс."""
+        threshold = self.count * fraction
+        seen = 0
+        for idx, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= threshold:
+                return min(BUCKETS_MS[idx], self.max * 1000) if idx < len(BUCKETS_MS) else self.max * 1000
+        return self.max * 1000
+
+
+class CommandTracer:
+    """
+    Трассировщик команд WebDriver.
+
+    Подменяет execute у command_executor драйвера и для каждой команды (findElement,
+    getElementAttribute, executeScript, ...) записывает задержку и место вызова в коде
+    проекта - ближайшую функцию этого репозитория в стеке (например, TreeDataExtractor.extract_vehicle_node).
+    В конце работы печатает гистограммы по местам вызова и пишет файл свернутых стеков
+    (формат flamegraph.pl / speedscope, вес - микросекунды).
+    """
+
+    def __init__(self, folded_file='webdriver_trace.folded'):
+        self.folded_file = folded_file
+        self.sites = {}
+        self.folded = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._reported = False
+
+    def install(self, driver):
+        """Оборачивает command_executor драйвера. Повторная установка на тот же драйвер игнорируется."""
+        executor = driver.command_executor
+        if getattr(executor, '_command_tracer', None) is self:
+            return driver
+        original = executor.execute
+
+        def execute(command, params=None):
+            started = time.perf_counter()
+            try:
+                return original(command, params)
+            finally:
+                self.record(command, time.perf_counter() - started, sys._getframe(1))
+
+        executor.execute = execute
+        executor._command_tracer = self
+        print("Трассировка команд WebDriver включена.")
+        return driver
+
+    def _project_stack(self, frame):
+        """Функции проекта в стеке, от внешней к внутренней."""
+        stack = []
+        while frame is not None:
+            filename = os.path.abspath(frame.f_code.co_filename)
+            if os.path.dirname(filename) == PROJECT_DIR and filename != os.path.abspath(__file__):
+                stack.append(_frame_name(frame))
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def record(self, command, elapsed, frame):
+        stack = self._project_stack(frame)
+        site = stack[-1] if stack else '<selenium>'
+        folded_key = ';'.join(stack + [str(command)])
+        with self._lock:
+            stats = self.sites.get(site)
+            if stats is None:
+                stats = self.sites[site] = SiteStats()
+            stats.add(command, elapsed)
+            self.folded[folded_key] = self.folded.get(folded_key, 0) + int(elapsed * 1_000_000)
+
+    def report(self, top=15):
+        """Печатает статистику по местам вызова и сохраняет файл свернутых стеков."""
+        with self._lock:
+            if self._reported or not self.sites:
+                return
+            self._reported = True
+            sites = sorted(self.sites.items(), key=lambda item: item[1].total, reverse=True)
+            folded = dict(self.folded)
+
+        total_count = sum(s.count for _, s in sites)
+        total_time = sum(s.total for _, s in sites)
+        wall = time.time() - self.started
+        print(f"\nКоманды WebDriver: {total_count} за {total_time:.2f} сек. "
+              f"({total_time / wall:.0%} времени работы трассировщика)")
+        for site, stats in sites[:top]:
+            print(f"\n  {site}: {stats.count} команд, {stats.total:.2f} сек. "
+                  f"(среднее {stats.total / stats.count * 1000:.1f} мс, p50 ~{stats.percentile(0.5):.0f} мс, "
+                  f"p95 ~{stats.percentile(0.95):.0f} мс, макс. {stats.max * 1000:.0f} мс)")
+            commands = sorted(stats.commands.items(), key=lambda item: item[1][1], reverse=True)
+            print("    " + ", ".join(f"{cmd} x{count} ({total:.2f} сек.)" for cmd, (count, total) in commands))
+            peak = max(stats.buckets)
+            for idx, count in enumerate(stats.buckets):
+                if count:
+                    bar = '#' * max(1, int(count / peak * HISTOGRAM_WIDTH))
+                    print(f"    {_bucket_label(idx):>9} мс | {bar} {count}")
+        if len(sites) > top:
+            print(f"\n  ... еще мест вызова: {len(sites) - top}")
+
+        if self.folded_file:
+            try:
+                with open(self.folded_file, 'w', encoding='utf-8') as f:
+                    for key, weight in sorted(folded.items()):
+                        f.write(f"{key} {weight}\n")
+                print(f"\nСвернутые стеки команд WebDriver сохранены в {self.folded_file} "
+                      f"(flamegraph.pl {self.folded_file} > webdriver_trace.svg)")
+            except OSError as e:
+                print(f"Предупреждение: Не удалось сохранить {self.folded_file}: {e}")
+
+
+_shared_tracer = None
+_shared_lock = threading.Lock()
+
+
+def install_tracer(driver, config):
+    """
+    Включает трассировку драйвера, если в config.txt указано webdriver_trace=true.
+    Все драйверы процесса (в том числе перезапущенные) пишут в один трассировщик,
+    отчет выводится один раз при завершении процесса.
+    """
+    global _shared_tracer
+    if config.get('webdriver_trace', 'false').lower() != 'true':
+        return None
+    with _shared_lock:
+        if _shared_tracer is None:
+            _shared_tracer = CommandTracer(config.get('webdriver_trace_file', 'webdriver_trace.folded') or None)
+            atexit.register(_shared_tracer.report)
+    _shared_tracer.install(driver)
+    return _shared_tracer
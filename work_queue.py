@@ -0,0 +1,463 @@
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+STATUSES = ('pending', 'leased', 'done', 'failed')
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkUnit:
+    """
+    Единица работы распределенного сбора: вид (list, tree, unit_cards, ...), параметры и порядковый ключ.
+
+    seq - список чисел; результаты собираются по нему, поэтому итог не зависит от того, какой
+    работник и в каком порядке выполнил единицы. lease - токен текущей аренды: завершить единицу
+    может только тот, кто ее арендовал, и только пока аренду не отдали другому.
+    """
+
+    def __init__(self, unit_id, batch, kind, params, seq, attempts=0, lease=None):
+        self.id = unit_id
+        self.batch = batch
+        self.kind = kind
+        self.params = params
+        self.seq = seq
+        self.attempts = attempts
+        self.lease = lease
+
+    def __repr__(self):
+        return f"WorkUnit({self.id!r}, attempt {self.attempts + 1})"
+
+
+def unit_spec(kind, key, params, seq):
+    """Описание единицы для enqueue и дочерних единиц complete: key уникален в пределах пакета."""
+    return {'kind': kind, 'key': str(key), 'params': params, 'seq': list(seq)}
+
+
+class SQLiteWorkQueue:
+    """
+    Очередь в файле SQLite: подходит для работников на одной машине или на общем локальном диске
+    (блокировки SQLite по сетевым ФС ненадежны - для нескольких хостов нужен Redis).
+    Захват единицы - одна транзакция BEGIN IMMEDIATE, поэтому два работника не получат одну единицу.
+    """
+
+    def __init__(self, path='work_queue.sqlite'):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS units (
+                id TEXT PRIMARY KEY,
+                batch TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                seq TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                worker TEXT,
+                lease TEXT,
+                lease_until REAL,
+                result TEXT,
+                error TEXT,
+                updated_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS units_by_status ON units(status, lease_until);
+            CREATE INDEX IF NOT EXISTS units_by_batch ON units(batch, status);
+        """)
+
+    def _conn(self):
+        """Соединение своего потока в режиме autocommit (sqlite3 не разделяет соединения между потоками)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _connect(self):
+        return _Transaction(self._conn())
+
+    def enqueue(self, batch, specs, max_attempts=3):
+        now = time.time()
+        with self._connect() as conn:
+            self._insert(conn, batch, specs, max_attempts, now)
+
+    @staticmethod
+    def _insert(conn, batch, specs, max_attempts, now):
+        conn.executemany(
+            "INSERT OR IGNORE INTO units (id, batch, kind, params, seq, max_attempts, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(f"{batch}/{spec['kind']}/{spec['key']}", batch, spec['kind'],
+              json.dumps(spec['params'], ensure_ascii=False), json.dumps(spec['seq']), max_attempts, now)
+             for spec in specs])
+
+    def claim(self, worker, lease_seconds):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT id, batch, kind, params, seq, attempts FROM units "
+                               "WHERE status = 'pending' ORDER BY rowid LIMIT 1").fetchone()
+            if row is None:
+                return None
+            lease = uuid.uuid4().hex
+            conn.execute("UPDATE units SET status = 'leased', worker = ?, lease = ?, lease_until = ?, updated_at = ? "
+                         "WHERE id = ?", (worker, lease, now + lease_seconds, now, row[0]))
+        return WorkUnit(row[0], row[1], row[2], json.loads(row[3]), json.loads(row[4]), row[5], lease)
+
+    def extend(self, unit, lease_seconds):
+        with self._connect() as conn:
+            cursor = conn.execute("UPDATE units SET lease_until = ? WHERE id = ? AND status = 'leased' AND lease = ?",
+                                  (time.time() + lease_seconds, unit.id, unit.lease))
+        return cursor.rowcount == 1
+
+    def complete(self, unit, result, children=()):
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE units SET status = 'done', result = ?, error = NULL, lease = NULL, lease_until = NULL, "
+                "updated_at = ? WHERE id = ? AND status = 'leased' AND lease = ?",
+                (json.dumps(result, ensure_ascii=False), now, unit.id, unit.lease))
+            if cursor.rowcount != 1:
+                return False
+            if children:
+                max_attempts = conn.execute("SELECT max_attempts FROM units WHERE id = ?", (unit.id,)).fetchone()[0]
+                self._insert(conn, unit.batch, children, max_attempts, now)
+        return True
+
+    def fail(self, unit, error):
+        """Неудача единицы: снова в очередь, пока не исчерпаны попытки, затем failed."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE units SET attempts = attempts + 1, error = ?, lease = NULL, lease_until = NULL, updated_at = ?, "
+                "status = CASE WHEN attempts + 1 >= max_attempts THEN 'failed' ELSE 'pending' END "
+                "WHERE id = ? AND status = 'leased' AND lease = ?",
+                (str(error), time.time(), unit.id, unit.lease))
+        return cursor.rowcount == 1
+
+    def reclaim_expired(self):
+        """Возвращает в очередь единицы с истекшей арендой (работник умер или завис). :return: Их число"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE units SET attempts = attempts + 1, error = 'аренда истекла у ' || worker, lease = NULL, "
+                "lease_until = NULL, updated_at = ?, "
+                "status = CASE WHEN attempts + 1 >= max_attempts THEN 'failed' ELSE 'pending' END "
+                "WHERE status = 'leased' AND lease_until < ?", (now, now))
+        return cursor.rowcount
+
+    def counts(self, batch):
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM units WHERE batch = ? GROUP BY status", (batch,))
+        found = dict(rows.fetchall())
+        return {status: found.get(status, 0) for status in STATUSES}
+
+    def finished(self, batch):
+        """[(seq, kind, params, result или None, error)] завершенных (done и failed) единиц пакета."""
+        rows = self._conn().execute("SELECT seq, kind, params, result, error, status FROM units "
+                                    "WHERE batch = ? AND status IN ('done', 'failed')", (batch,)).fetchall()
+        return [(json.loads(seq), kind, json.loads(params), json.loads(result) if status == 'done' else None, error)
+                for seq, kind, params, result, error, status in rows]
+
+    def purge(self, batch):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM units WHERE batch = ?", (batch,))
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK для соединения в режиме autocommit."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+# Переходы состояний в Redis выполняются скриптами Lua - атомарно, как транзакции SQLite
+_REDIS_CLAIM = """
+local id = redis.call('LPOP', KEYS[1])
+if not id then return false end
+local key = ARGV[5] .. id
+redis.call('HSET', key, 'status', 'leased', 'worker', ARGV[1], 'lease', ARGV[2], 'lease_until', ARGV[3],
+           'updated_at', ARGV[4])
+redis.call('ZADD', KEYS[2], ARGV[3], id)
+return id
+"""
+_REDIS_FINISH = """
+local key = ARGV[6] .. ARGV[1]
+if redis.call('HGET', key, 'status') ~= 'leased' or redis.call('HGET', key, 'lease') ~= ARGV[2] then
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HDEL', key, 'lease', 'lease_until')
+if ARGV[3] == 'done' then
+    redis.call('HSET', key, 'status', 'done', 'result', ARGV[4], 'updated_at', ARGV[5])
+    for _, child in ipairs(cjson.decode(ARGV[7])) do
+        local child_key = ARGV[6] .. child[1]
+        if redis.call('EXISTS', child_key) == 0 then
+            redis.call('HSET', child_key, 'batch', child[2], 'kind', child[3], 'params', child[4], 'seq', child[5],
+                       'status', 'pending', 'attempts', 0, 'max_attempts', redis.call('HGET', key, 'max_attempts'),
+                       'updated_at', ARGV[5])
+            redis.call('SADD', ARGV[8] .. child[2], child[1])
+            redis.call('RPUSH', KEYS[1], child[1])
+        end
+    end
+else
+    local attempts = redis.call('HINCRBY', key, 'attempts', 1)
+    redis.call('HSET', key, 'error', ARGV[4], 'updated_at', ARGV[5])
+    if attempts >= tonumber(redis.call('HGET', key, 'max_attempts')) then
+        redis.call('HSET', key, 'status', 'failed')
+    else
+        redis.call('HSET', key, 'status', 'pending')
+        redis.call('RPUSH', KEYS[1], ARGV[1])
+    end
+end
+return 1
+"""
+_REDIS_RECLAIM = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, id in ipairs(ids) do
+    local key = ARGV[2] .. id
+    redis.call('ZREM', KEYS[2], id)
+    local attempts = redis.call('HINCRBY', key, 'attempts', 1)
+    redis.call('HSET', key, 'error', 'аренда истекла у ' .. (redis.call('HGET', key, 'worker') or '?'),
+               'updated_at', ARGV[1])
+    redis.call('HDEL', key, 'lease', 'lease_until')
+    if attempts >= tonumber(redis.call('HGET', key, 'max_attempts')) then
+        redis.call('HSET', key, 'status', 'failed')
+    else
+        redis.call('HSET', key, 'status', 'pending')
+        redis.call('RPUSH', KEYS[1], id)
+    end
+end
+return #ids
+"""
+
+
+class RedisWorkQueue:
+    """
+    Очередь в Redis для работников на разных машинах (нужен пакет redis).
+    Единица - хэш <prefix>unit:<id>, ожидающие - список <prefix>pending, аренды - упорядоченное
+    множество <prefix>leases (срок -> id), единицы пакета - множество <prefix>batch:<пакет>.
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='wtq:'):
+        if redis is None:
+            raise RuntimeError("Для очереди в Redis нужен пакет redis (pip install redis)")
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.pending_key = prefix + 'pending'
+        self.leases_key = prefix + 'leases'
+        self._claim = self.client.register_script(_REDIS_CLAIM)
+        self._finish = self.client.register_script(_REDIS_FINISH)
+        self._reclaim = self.client.register_script(_REDIS_RECLAIM)
+
+    def _unit_key(self, unit_id):
+        return f"{self.prefix}unit:{unit_id}"
+
+    def _spec_fields(self, batch, spec):
+        unit_id = f"{batch}/{spec['kind']}/{spec['key']}"
+        return unit_id, json.dumps(spec['params'], ensure_ascii=False), json.dumps(spec['seq'])
+
+    def enqueue(self, batch, specs, max_attempts=3):
+        now = time.time()
+        pipe = self.client.pipeline()
+        for spec in specs:
+            unit_id, params, seq = self._spec_fields(batch, spec)
+            # HSETNX по полю batch - повторная постановка той же единицы ничего не меняет
+            pipe.hsetnx(self._unit_key(unit_id), 'batch', batch)
+        created = pipe.execute()
+        pipe = self.client.pipeline()
+        for spec, is_new in zip(specs, created):
+            if not is_new:
+                continue
+            unit_id, params, seq = self._spec_fields(batch, spec)
+            pipe.hset(self._unit_key(unit_id), mapping={
+                'kind': spec['kind'], 'params': params, 'seq': seq, 'status': 'pending',
+                'attempts': 0, 'max_attempts': max_attempts, 'updated_at': now})
+            pipe.sadd(f"{self.prefix}batch:{batch}", unit_id)
+            pipe.rpush(self.pending_key, unit_id)
+        pipe.execute()
+
+    def claim(self, worker, lease_seconds):
+        now = time.time()
+        lease = uuid.uuid4().hex
+        unit_id = self._claim(keys=[self.pending_key, self.leases_key],
+                              args=[worker, lease, now + lease_seconds, now, self.prefix + 'unit:'])
+        if not unit_id:
+            return None
+        data = self.client.hgetall(self._unit_key(unit_id))
+        return WorkUnit(unit_id, data['batch'], data['kind'], json.loads(data['params']), json.loads(data['seq']),
+                        int(data.get('attempts', 0)), lease)
+
+    def extend(self, unit, lease_seconds):
+        key = self._unit_key(unit.id)
+        if self.client.hget(key, 'lease') != unit.lease:
+            return False
+        deadline = time.time() + lease_seconds
+        pipe = self.client.pipeline()
+        pipe.hset(key, 'lease_until', deadline)
+        pipe.zadd(self.leases_key, {unit.id: deadline}, xx=True)
+        pipe.execute()
+        return True
+
+    def _finish_unit(self, unit, outcome, payload, children=()):
+        children = [[f"{unit.batch}/{spec['kind']}/{spec['key']}", unit.batch, spec['kind'],
+                     json.dumps(spec['params'], ensure_ascii=False), json.dumps(spec['seq'])] for spec in children]
+        return bool(self._finish(keys=[self.pending_key, self.leases_key],
+                                 args=[unit.id, unit.lease, outcome, payload, time.time(), self.prefix + 'unit:',
+                                       json.dumps(children), self.prefix + 'batch:']))
+
+    def complete(self, unit, result, children=()):
+        return self._finish_unit(unit, 'done', json.dumps(result, ensure_ascii=False), children)
+
+    def fail(self, unit, error):
+        return self._finish_unit(unit, 'failed', str(error))
+
+    def reclaim_expired(self):
+        return int(self._reclaim(keys=[self.pending_key, self.leases_key], args=[time.time(), self.prefix + 'unit:']))
+
+    def _batch_units(self, batch, fields):
+        ids = sorted(self.client.smembers(f"{self.prefix}batch:{batch}"))
+        pipe = self.client.pipeline()
+        for unit_id in ids:
+            pipe.hmget(self._unit_key(unit_id), fields)
+        return pipe.execute()
+
+    def counts(self, batch):
+        found = {status: 0 for status in STATUSES}
+        for (status,) in self._batch_units(batch, ['status']):
+            found[status] = found.get(status, 0) + 1
+        return found
+
+    def finished(self, batch):
+        rows = []
+        for seq, kind, params, result, error, status in self._batch_units(
+                batch, ['seq', 'kind', 'params', 'result', 'error', 'status']):
+            if status in ('done', 'failed'):
+                rows.append((json.loads(seq), kind, json.loads(params),
+                             json.loads(result) if status == 'done' else None, error))
+        return rows
+
+    def purge(self, batch):
+        batch_key = f"{self.prefix}batch:{batch}"
+        ids = self.client.smembers(batch_key)
+        if ids:
+            self.client.delete(*[self._unit_key(unit_id) for unit_id in ids])
+        self.client.delete(batch_key)
+
+
+def open_queue(url):
+    """sqlite:///путь/к/файлу.sqlite, redis://хост:порт/база или просто путь к файлу SQLite."""
+    scheme = urlsplit(url).scheme
+    if scheme in ('redis', 'rediss', 'unix'):
+        return RedisWorkQueue(url)
+    if scheme == 'sqlite':
+        return SQLiteWorkQueue(url[len('sqlite:///'):] if url.startswith('sqlite:///') else url[len('sqlite://'):])
+    return SQLiteWorkQueue(url)
+
+
+class Coordinator:
+    """
+    Сторона main.py: ставит единицы пакета в очередь, ждет их выполнения работниками
+    (scrape_worker.py), возвращает в очередь единицы с истекшей арендой и собирает результаты по seq.
+    """
+
+    def __init__(self, queue, lease_seconds=300, max_attempts=3, poll=1.0, timeout=0, report_every=30,
+                 allow_partial=False):
+        """
+        :param allow_partial: Вернуть результат, даже если часть единиц не выполнена за max_attempts попыток
+            (по умолчанию шаг завершается ошибкой, чтобы неполные CSV не дошли до загрузки в БД)
+        """
+        self.queue = queue
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll = poll
+        self.timeout = timeout
+        self.report_every = report_every
+        self.allow_partial = allow_partial
+        self.run_id = time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:6]
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(open_queue(config.get('queue_url', 'sqlite:///work_queue.sqlite')),
+                   lease_seconds=float(config.get('distributed_lease_seconds', '300')),
+                   max_attempts=int(config.get('distributed_max_attempts', '3')),
+                   timeout=float(config.get('distributed_timeout', '0')),
+                   allow_partial=config.get('distributed_allow_partial', 'false').lower() == 'true')
+
+    def run(self, name, specs):
+        """
+        Выполняет единицы specs (unit_spec) руками работников.
+
+        :return: ([(kind, params, result)] выполненных единиц по seq, [(kind, params, error)] неудавшихся)
+        :raises RuntimeError: Если есть неудавшиеся единицы и allow_partial не задан
+        """
+        batch = f"{self.run_id}-{name}"
+        self.queue.enqueue(batch, specs, max_attempts=self.max_attempts)
+        print(f"Распределенный сбор '{name}': в очереди {len(specs)} единиц (пакет {batch}).")
+        started = last_report = time.time()
+        while True:
+            reissued = self.queue.reclaim_expired()
+            if reissued:
+                print(f"Возвращено в очередь единиц с истекшей арендой: {reissued}")
+            counts = self.queue.counts(batch)
+            if counts['pending'] == 0 and counts['leased'] == 0:
+                break
+            if time.time() - last_report >= self.report_every:
+                last_report = time.time()
+                print(f"'{name}': ожидают {counts['pending']}, выполняются {counts['leased']}, "
+                      f"готово {counts['done']}, неудачно {counts['failed']}"
+                      + ("" if counts['leased'] else " - нет активных работников? (python scrape_worker.py)"))
+            if self.timeout and time.time() - started > self.timeout:
+                raise TimeoutError(f"Распределенный сбор '{name}' не завершен за {self.timeout:g} сек.: {counts}")
+            time.sleep(self.poll)
+
+        finished = sorted(self.queue.finished(batch), key=lambda row: row[0])
+        done = [(kind, params, result) for _, kind, params, result, _ in finished if result is not None]
+        failed = [(kind, params, error) for _, kind, params, result, error in finished if result is None]
+        for kind, params, error in failed:
+            print(f"Единица {kind} {params} не выполнена за {self.max_attempts} попыток: {error}")
+        print(f"Распределенный сбор '{name}' завершен за {time.time() - started:.1f} сек.: "
+              f"выполнено {len(done)}, неудачно {len(failed)}")
+        self.queue.purge(batch)
+        if failed and not self.allow_partial:
+            raise RuntimeError(f"Распределенный сбор '{name}': не выполнено единиц: {len(failed)} "
+                               f"(distributed_allow_partial=true сохранит неполный результат)")
+        return done, failed
+
+
+def start_local_workers(count, config_path='config.txt'):
+    """Запускает count процессов scrape_worker.py на этой машине (завершаются, когда очередь пуста)."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scrape_worker.py')
+    return [subprocess.Popen([sys.executable, script, '--config', config_path, '--idle-exit', '60'])
+            for _ in range(count)]
+
+
+def stop_local_workers(processes, timeout=30):
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()